@@ -26,19 +26,31 @@ def create_engine(work_dir: Path, lazy: bool = False) -> Engine:
     config = ConfigManager(project_root)
     storage_type = config.get("storage.type", "git_object")
     logger.debug(f"Engine factory configured with storage type: '{storage_type}'")
-    git_db = GitDB(project_root)
+    git_db = GitDB(
+        project_root,
+        native_odb=bool(config.get("storage.native_odb", True)),
+        checkout_mode=config.get("storage.checkout_mode", "diff"),
+    )
     db_manager = None
 
     # 默认和备用后端
     reader = GitObjectHistoryReader(git_db)
-    writer = GitObjectHistoryWriter(git_db)
+    writer = GitObjectHistoryWriter(
+        git_db,
+        batched=config.get("storage.write_mode", "plumbing") == "session",
+        compact_heads=bool(config.get("storage.compact_heads", True)),
+    )
 
     if storage_type == "sqlite":
         if not DatabaseManager or not SQLiteHistoryWriter or not SQLiteHistoryReader:
             raise ImportError("SQLite dependencies could not be loaded. Please check your installation.")
 
         logger.debug("Using SQLite storage format for reads and writes.")
-        db_manager = DatabaseManager(project_root)
+        db_manager = DatabaseManager(
+            project_root,
+            busy_timeout=float(config.get("storage.sqlite_busy_timeout", 5.0)),
+            content_cache_bytes=int(config.get("storage.content_cache_bytes", 32 * 1024 * 1024)),
+        )
         db_manager.init_schema()
 
         # 切换到 SQLite 后端
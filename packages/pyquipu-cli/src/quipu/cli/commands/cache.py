@@ -75,40 +75,20 @@ def cache_prune_refs(
             bus.success(L.cache.prune.info.noRedundant)
             return
 
-        head_commits = {h[0] for h in local_heads}
-
-        # 2. 批量获取这些 commit 的内容以解析 parent
-        commits_content = engine.git_db.batch_cat_file(list(head_commits))
-
-        parents_of_heads = set()
-        for c_hash, content in commits_content.items():
-            text = content.decode("utf-8", errors="ignore")
-            for line in text.splitlines():
-                if line.startswith("parent "):
-                    p_hash = line.split()[1]
-                    parents_of_heads.add(p_hash)
-                elif line == "":
-                    break
-
-        # 3. 计算交集：既是 Head 又是某个 Head 的 Parent -> 冗余
-        redundant_commits = head_commits.intersection(parents_of_heads)
-
-        if not redundant_commits:
+        # 2. 可以从另一个 head 到达的 head (即任意 head 的祖先) 都是冗余的
+        refs_to_delete = engine.git_db.find_redundant_heads("refs/quipu/local/heads/")
+        if not refs_to_delete:
+            engine.git_db.pack_refs_if_needed()
             bus.success(L.cache.prune.info.noRedundant)
             return
 
-        # 4. 找出对应的 ref names 并删除
-        refs_to_delete = []
-        for c_hash, ref_name in local_heads:
-            if c_hash in redundant_commits:
-                refs_to_delete.append(ref_name)
-
         bus.info(L.cache.prune.info.found, count=len(refs_to_delete), total=len(local_heads))
 
-        deleted_count = 0
-        for ref in refs_to_delete:
-            engine.git_db.delete_ref(ref)
-            deleted_count += 1
+        # 3. 在一个事务中全部删除，并在松散引用过多时打包
+        with engine.git_db.ref_transaction() as tx:
+            for c_hash, ref_name in refs_to_delete:
+                tx.delete(ref_name, c_hash)
+        engine.git_db.pack_refs_if_needed()
 
-        bus.success(L.cache.prune.success, count=deleted_count)
+        bus.success(L.cache.prune.success, count=len(tx))
         return
@@ -0,0 +1,46 @@
+import logging
+from pathlib import Path
+from typing import Annotated, Optional
+
+import typer
+from needle.pointer import L
+from quipu.common.bus import bus
+
+from ..config import DEFAULT_WORK_DIR
+from .helpers import _find_target_node, engine_context
+
+logger = logging.getLogger(__name__)
+
+
+def register(app: typer.Typer):
+    @app.command(help="比较两个历史节点 (或节点与当前工作区) 之间的文件差异。")
+    def diff(
+        ctx: typer.Context,
+        old_hash: Annotated[str, typer.Argument(help="基准节点的 commit_hash 或 output_tree 的哈希前缀。")],
+        new_hash: Annotated[Optional[str], typer.Argument(help="目标节点的哈希前缀。省略时与当前工作区比较。")] = None,
+        work_dir: Annotated[
+            Path,
+            typer.Option(
+                "--work-dir", "-w", help="操作执行的根目录（工作区）", file_okay=False, dir_okay=True, resolve_path=True
+            ),
+        ] = DEFAULT_WORK_DIR,
+        stat: Annotated[bool, typer.Option("--stat", help="显示变更统计 (默认)。")] = False,
+        name_status: Annotated[bool, typer.Option("--name-status", help="显示每个文件的变更状态。")] = False,
+    ):
+        with engine_context(work_dir) as engine:
+            old_tree = _find_target_node(engine.history_graph, old_hash).output_tree
+            if new_hash:
+                new_tree = _find_target_node(engine.history_graph, new_hash).output_tree
+            else:
+                new_tree = engine.git_db.get_tree_hash()
+
+            tree_diff = engine.git_db.get_tree_diff(old_tree, new_tree)
+            if not tree_diff.name_status:
+                bus.info(L.diff.info.noChanges, old=old_tree[:7], new=new_tree[:7])
+                raise typer.Exit()
+
+            # 与 git 一致：同时指定时先输出 name-status，再输出 stat
+            if name_status:
+                bus.data("\n".join(f"{status}\t{path}" for status, path in tree_diff.name_status))
+            if stat or not name_status:
+                bus.data(tree_diff.stat)
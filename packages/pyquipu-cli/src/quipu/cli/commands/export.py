@@ -8,7 +8,6 @@ import typer
 import yaml
 from needle.pointer import L
 from quipu.common.bus import bus
-from quipu.engine.state_machine import Engine
 from quipu.spec.models.graph import QuipuNode
 
 from ..config import DEFAULT_WORK_DIR
@@ -99,7 +98,8 @@ def _generate_navbar(
 
 def _generate_file_content(
     node: QuipuNode,
-    engine: Engine,
+    public_content: str,
+    private_content: Optional[str],
     no_frontmatter: bool,
     no_nav: bool,
     exported_hashes_set: Set[str],
@@ -110,11 +110,9 @@ def _generate_file_content(
     if not no_frontmatter:
         parts.append(_format_frontmatter(node))
 
-    public_content = engine.reader.get_node_content(node) or ""
     parts.append("# content.md")
-    parts.append(public_content.strip())
+    parts.append((public_content or "").strip())
 
-    private_content = engine.reader.get_private_data(node.commit_hash)
     if private_content:
         parts.append("# 开发者意图")
         parts.append(private_content.strip())
@@ -193,11 +191,22 @@ def register(app: typer.Typer):
             filename_map = {node.commit_hash: _generate_filename(node) for node in nodes_to_export}
             exported_hashes_set = {node.commit_hash for node in nodes_to_export}
 
+            # 批量预取所有节点的公共内容与私有数据，避免逐个节点访问存储后端
+            contents = engine.reader.get_node_contents(nodes_to_export)
+            private_data = engine.reader.get_private_data_many(list(exported_hashes_set))
+
             with typer.progressbar(nodes_to_export, label="导出进度") as progress:
                 for node in progress:
                     filename = filename_map[node.commit_hash]
                     content = _generate_file_content(
-                        node, engine, no_frontmatter, no_nav, exported_hashes_set, filename_map, hidden_types
+                        node,
+                        contents.get(node.commit_hash, ""),
+                        private_data.get(node.commit_hash),
+                        no_frontmatter,
+                        no_nav,
+                        exported_hashes_set,
+                        filename_map,
+                        hidden_types,
                     )
                     (output_dir / filename).write_text(content, encoding="utf-8")
 
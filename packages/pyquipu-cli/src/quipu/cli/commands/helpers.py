@@ -9,6 +9,7 @@ from quipu.application.factory import create_engine
 from needle.pointer import L
 from quipu.common.bus import bus
 from quipu.engine.state_machine import Engine
+from quipu.spec.models.compact_graph import CompactGraph, NodeView
 from quipu.spec.models.graph import QuipuNode
 
 from ..logger_config import setup_logging
@@ -28,10 +29,10 @@ def engine_context(work_dir: Path) -> Generator[Engine, None, None]:
             engine.close()
 
 
-def _find_current_node(engine: Engine, graph: Dict[str, QuipuNode]) -> Optional[QuipuNode]:
+def _find_current_node(engine: Engine, graph: CompactGraph) -> Optional[NodeView]:
     current_hash = engine.git_db.get_tree_hash()
     # 修复：直接从 graph 中通过 output_tree hash 查找
-    for node in graph.values():
+    for node in graph:
         if node.output_tree == current_hash:
             return node
 
@@ -40,6 +41,26 @@ def _find_current_node(engine: Engine, graph: Dict[str, QuipuNode]) -> Optional[
     return None
 
 
+def _find_target_node(graph: Dict, hash_prefix: str):
+    matches = [
+        node
+        for node in graph.values()
+        if node.commit_hash.startswith(hash_prefix) or node.output_tree.startswith(hash_prefix)
+    ]
+    if not matches:
+        bus.error(L.show.error.notFound, hash_prefix=hash_prefix)
+        raise typer.Exit(1)
+
+    unique_commits = {node.commit_hash for node in matches}
+    if len(unique_commits) > 1:
+        unique_output_trees = {node.output_tree for node in matches}
+        if len(unique_output_trees) > 1:
+            bus.error(L.show.error.notUnique, hash_prefix=hash_prefix, count=len(matches))
+            raise typer.Exit(1)
+        matches.sort(key=lambda n: (1 if n.parent else 0, n.timestamp), reverse=True)
+    return matches[0]
+
+
 def _execute_visit(ctx: typer.Context, engine: Engine, target_hash: str, msg_id: str, **kwargs):
     bus.info(msg_id, **kwargs)
     try:
@@ -73,7 +94,7 @@ def filter_nodes(
 
 
 def filter_reachable_nodes(engine: Engine, nodes: List[QuipuNode]) -> List[QuipuNode]:
-    current_node = _find_current_node(engine, engine.history_graph)
+    current_node = _find_current_node(engine, engine.compact_graph)
     if not current_node:
         # 如果工作区是脏的，无法确定起点，返回所有节点
         return nodes
@@ -27,11 +27,11 @@ def register(app: typer.Typer):
         force: Annotated[bool, typer.Option("--force", "-f", help="强制执行，跳过确认提示。")] = False,
     ):
         with engine_context(work_dir) as engine:
-            graph = engine.history_graph
+            graph = engine.compact_graph
 
             matches = [
                 node
-                for node in graph.values()
+                for node in graph
                 if node.commit_hash.startswith(hash_prefix) or node.output_tree.startswith(hash_prefix)
             ]
             if not matches:
@@ -88,7 +88,7 @@ def register(app: typer.Typer):
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
     ):
         with engine_context(work_dir) as engine:
-            graph = engine.history_graph
+            graph = engine.compact_graph
             current_node = _find_current_node(engine, graph)
             if not current_node:
                 ctx.exit(1)
@@ -119,7 +119,7 @@ def register(app: typer.Typer):
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
     ):
         with engine_context(work_dir) as engine:
-            graph = engine.history_graph
+            graph = engine.compact_graph
             current_node = _find_current_node(engine, graph)
             if not current_node:
                 ctx.exit(1)
@@ -151,7 +151,7 @@ def register(app: typer.Typer):
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
     ):
         with engine_context(work_dir) as engine:
-            graph = engine.history_graph
+            graph = engine.compact_graph
             current_node = _find_current_node(engine, graph)
             if not current_node:
                 ctx.exit(1)
@@ -181,7 +181,7 @@ def register(app: typer.Typer):
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
     ):
         with engine_context(work_dir) as engine:
-            graph = engine.history_graph
+            graph = engine.compact_graph
             current_node = _find_current_node(engine, graph)
             if not current_node:
                 ctx.exit(1)
@@ -94,7 +94,7 @@ def register(app: typer.Typer):
                 data_line = f"{ts} {tag:<9} {node.short_hash} - {summary}"
                 bus.data(data_line)
 
-    @app.command(name="find", help="根据摘要或类型搜索历史节点。")
+    @app.command(name="find", help="根据摘要、类型或内容搜索历史节点。")
     def find_command(
         ctx: typer.Context,
         summary_regex: Annotated[
@@ -103,6 +103,10 @@ def register(app: typer.Typer):
         node_type: Annotated[
             Optional[str], typer.Option("--type", "-t", help="节点类型 ('plan' 或 'capture')。")
         ] = None,
+        content_query: Annotated[
+            Optional[str],
+            typer.Option("--content", "-c", help="在摘要与计划内容中全文搜索的关键词 (结果按相关度排序)。"),
+        ] = None,
         limit: Annotated[int, typer.Option("--limit", "-n", help="返回的最大结果数量。")] = 10,
         work_dir: Annotated[Path, typer.Option("--work-dir", "-w", help="工作区根目录。")] = DEFAULT_WORK_DIR,
         json_output: Annotated[bool, typer.Option("--json", help="以 JSON 格式输出结果。")] = False,
@@ -115,7 +119,9 @@ def register(app: typer.Typer):
                     bus.info(L.query.info.emptyHistory)
                 ctx.exit(0)
 
-            nodes = engine.find_nodes(summary_regex=summary_regex, node_type=node_type, limit=limit)
+            nodes = engine.find_nodes(
+                summary_regex=summary_regex, node_type=node_type, limit=limit, content_query=content_query
+            )
 
             if not nodes:
                 if json_output:
@@ -1,7 +1,7 @@
 import subprocess
 from enum import Enum
 from pathlib import Path
-from typing import Annotated, Optional
+from typing import Annotated, Optional, Set
 
 import typer
 from quipu.application.utils import find_git_repository_root
@@ -24,6 +24,19 @@ class SyncMode(str, Enum):
     PULL_ONLY = "pull-only"
 
 
+def _fetch_users(git_db: GitDB, remote: str, user_ids: Set[str], fetch_jobs: int):
+    # 单个用户拉取失败只会告警；只有全部失败 (通常是远程不可达) 才中止同步
+    failures = git_db.fetch_quipu_refs_many(remote, sorted(user_ids), max_workers=fetch_jobs)
+    if failures and len(failures) == len(user_ids):
+        raise RuntimeError(failures[min(failures)])
+
+
+def _compact_heads(git_db: GitDB, config: ConfigManager):
+    # 调和会把远程镜像中的历史 head (包括祖先) 恢复到本地，这里重新折叠为分支末端
+    if config.get("storage.compact_heads", True):
+        git_db.compact_heads()
+
+
 def register(app: typer.Typer):
     @app.command(help="与远程 Git 仓库同步 Quipu 历史记录。")
     def sync(
@@ -78,6 +91,7 @@ def register(app: typer.Typer):
             subscriptions = config.get("sync.subscriptions", [])
             target_ids_to_fetch = set(subscriptions)
             target_ids_to_fetch.add(final_user_id)
+            fetch_jobs = int(config.get("sync.fetch_jobs", 4))
 
             bus.info(L.sync.run.info.mode, mode=mode.value)
 
@@ -85,28 +99,28 @@ def register(app: typer.Typer):
             match mode:
                 case SyncMode.BIDIRECTIONAL:
                     bus.info(L.sync.run.info.pulling)
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
+                    _fetch_users(git_db, remote, target_ids_to_fetch, fetch_jobs)
                     bus.info(L.sync.run.info.reconciling)
                     git_db.reconcile_local_with_remote(remote, final_user_id)
+                    _compact_heads(git_db, config)
                     bus.info(L.sync.run.info.pushing)
                     git_db.push_quipu_refs(remote, final_user_id)
                     bus.success(L.sync.run.success.bidirectional)
 
                 case SyncMode.PULL_ONLY:
                     bus.info(L.sync.run.info.pulling)
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
+                    _fetch_users(git_db, remote, target_ids_to_fetch, fetch_jobs)
                     bus.info(L.sync.run.info.reconciling)
                     git_db.reconcile_local_with_remote(remote, final_user_id)
+                    _compact_heads(git_db, config)
                     bus.success(L.sync.run.success.pullOnly)
 
                 case SyncMode.PULL_PRUNE:
                     bus.info(L.sync.run.info.pullingPrune)
-                    for target_id in sorted(list(target_ids_to_fetch)):
-                        git_db.fetch_quipu_refs(remote, target_id)
+                    _fetch_users(git_db, remote, target_ids_to_fetch, fetch_jobs)
                     bus.info(L.sync.run.info.reconciling)
                     git_db.reconcile_local_with_remote(remote, final_user_id)
+                    _compact_heads(git_db, config)
                     bus.info(L.sync.run.info.pruning)
                     git_db.prune_local_from_remote(remote, final_user_id)
                     bus.success(L.sync.run.success.pullPrune)
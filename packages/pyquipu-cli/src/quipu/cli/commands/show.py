@@ -1,7 +1,7 @@
 import json
 import logging
 from pathlib import Path
-from typing import Annotated, Dict, List, Optional
+from typing import Annotated, List, Optional
 
 import typer
 from needle.pointer import L
@@ -10,31 +10,11 @@ from rich.console import Console
 from rich.syntax import Syntax
 
 from ..config import DEFAULT_WORK_DIR
-from .helpers import engine_context
+from .helpers import _find_target_node, engine_context
 
 logger = logging.getLogger(__name__)
 
 
-def _find_target_node(graph: Dict, hash_prefix: str):
-    matches = [
-        node
-        for node in graph.values()
-        if node.commit_hash.startswith(hash_prefix) or node.output_tree.startswith(hash_prefix)
-    ]
-    if not matches:
-        bus.error(L.show.error.notFound, hash_prefix=hash_prefix)
-        raise typer.Exit(1)
-
-    unique_commits = {node.commit_hash for node in matches}
-    if len(unique_commits) > 1:
-        unique_output_trees = {node.output_tree for node in matches}
-        if len(unique_output_trees) > 1:
-            bus.error(L.show.error.notUnique, hash_prefix=hash_prefix, count=len(matches))
-            raise typer.Exit(1)
-        matches.sort(key=lambda n: (1 if n.parent else 0, n.timestamp), reverse=True)
-    return matches[0]
-
-
 def register(app: typer.Typer):
     @app.command(help="显示指定历史节点中的文件内容。")
     def show(
@@ -5,7 +5,7 @@ from typing import Annotated, Optional
 import typer
 from quipu.common.bus import bus
 
-from .commands import axon, cache, export, navigation, query, remote, run, show, ui, workspace
+from .commands import axon, cache, diff, export, navigation, query, remote, run, show, ui, workspace
 from .rendering import TyperRenderer
 
 # --- Global Setup ---
@@ -73,6 +73,7 @@ remote.register(app)
 run.register(app)
 ui.register(app)
 show.register(app)
+diff.register(app)
 export.register(app)
 
 
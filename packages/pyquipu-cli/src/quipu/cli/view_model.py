@@ -64,10 +64,23 @@ class GraphViewModel:
             self._node_by_key = {}
             return []
 
-        self.current_page = page_number
-        offset = (self.current_page - 1) * self.page_size
+        loaded = self.current_page_nodes
+        if page_number == 1:
+            page = self.reader.load_nodes_page(limit=self.page_size)
+        elif loaded and page_number == self.current_page + 1:
+            # 相邻页以当前页的边界节点为游标继续读取，耗时与页码无关
+            page = self.reader.load_nodes_page(limit=self.page_size, after=loaded[-1].commit_hash)
+        elif loaded and page_number == self.current_page - 1:
+            page = self.reader.load_nodes_page(limit=self.page_size, before=loaded[0].commit_hash)
+        else:
+            # 任意跳转 (例如启动时定位到 HEAD 所在的页) 仍按偏移量读取
+            offset = (page_number - 1) * self.page_size
+            page = self.reader.load_nodes_paginated(limit=self.page_size, offset=offset)
 
-        self.current_page_nodes = self.reader.load_nodes_paginated(limit=self.page_size, offset=offset)
+        self.current_page = page_number
+        self.current_page_nodes = page
+        # 一次批量预取整页节点的内容，之后的 get_node_content 直接命中节点上的缓存
+        self.reader.get_node_contents(self.current_page_nodes)
         self._node_by_key = {str(node.filename): node for node in self.current_page_nodes}
         return self.current_page_nodes
 
@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+
+from needle.pointer import L
+from quipu.cli.main import app
+
+
+def _two_nodes(engine):
+    ws = engine.root_dir
+    (ws / "a.txt").write_text("a1")
+    (ws / "b.txt").write_text("b1")
+    n1 = engine.capture_drift(engine.git_db.get_tree_hash(), "n1")
+
+    (ws / "a.txt").write_text("a2\nmore")
+    (ws / "b.txt").unlink()
+    (ws / "c.txt").write_text("c")
+    n2 = engine.capture_drift(engine.git_db.get_tree_hash(), "n2")
+    return n1, n2
+
+
+def test_diff_name_status_and_stat(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    n1, n2 = _two_nodes(engine)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("quipu.cli.commands.diff.bus", mock_bus)
+
+    result = runner.invoke(app, ["diff", n1.short_hash, n2.short_hash, "--name-status", "--stat", "-w", str(work_dir)])
+
+    assert result.exit_code == 0
+    name_status, stat = [call.args[0] for call in mock_bus.data.call_args_list]
+    assert name_status.splitlines() == ["M\ta.txt", "D\tb.txt", "A\tc.txt"]
+    assert "3 files changed" in stat
+
+
+def test_diff_defaults_to_stat_against_workspace(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    _, n2 = _two_nodes(engine)
+    (work_dir / "d.txt").write_text("draft")
+    mock_bus = MagicMock()
+    monkeypatch.setattr("quipu.cli.commands.diff.bus", mock_bus)
+
+    result = runner.invoke(app, ["diff", n2.short_hash, "-w", str(work_dir)])
+
+    assert result.exit_code == 0
+    mock_bus.data.assert_called_once()
+    assert "d.txt" in mock_bus.data.call_args.args[0]
+
+
+def test_diff_identical_nodes(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    n1, _ = _two_nodes(engine)
+    mock_bus = MagicMock()
+    monkeypatch.setattr("quipu.cli.commands.diff.bus", mock_bus)
+
+    result = runner.invoke(app, ["diff", n1.short_hash, n1.short_hash, "-w", str(work_dir)])
+
+    assert result.exit_code == 0
+    mock_bus.info.assert_called_once_with(L.diff.info.noChanges, old=n1.output_tree[:7], new=n1.output_tree[:7])
+    mock_bus.data.assert_not_called()
@@ -53,6 +53,23 @@ def test_find_command(runner, quipu_workspace, monkeypatch):
     assert "Fix bug" in mock_bus.data.call_args.args[0]
 
 
+def test_find_by_content(runner, quipu_workspace, monkeypatch):
+    work_dir, _, engine = quipu_workspace
+    mock_bus = MagicMock()
+    monkeypatch.setattr("quipu.cli.commands.query.bus", mock_bus)
+
+    specs = [
+        {"type": "plan", "summary": "Plan A", "content": "migrate the database schema"},
+        {"type": "plan", "summary": "Plan B", "content": "polish the README"},
+    ]
+    create_linear_history_from_specs(engine, specs)
+
+    result = runner.invoke(app, ["find", "--content", "schema", "-w", str(work_dir)])
+    assert result.exit_code == 0
+    mock_bus.data.assert_called_once()
+    assert "Plan A" in mock_bus.data.call_args.args[0]
+
+
 def test_log_json_output(runner, quipu_workspace, monkeypatch):
     work_dir, _, engine = quipu_workspace
     mock_bus = MagicMock()
@@ -20,13 +20,24 @@ class MockHistoryReader(HistoryReader):
         self._ancestors = ancestors or set()
         self._descendants = descendants or set()
         self._private_data = private_data or {}
+        # 记录按偏移量读取的调用，用于确认相邻翻页走游标
+        self.offset_loads: List[int] = []
 
     def get_node_count(self) -> int:
         return len(self._nodes)
 
     def load_nodes_paginated(self, limit: int, offset: int) -> List[QuipuNode]:
+        self.offset_loads.append(offset)
         return self._nodes[offset : offset + limit]
 
+    def load_nodes_page(self, limit: int, after: Optional[str] = None, before: Optional[str] = None) -> List[QuipuNode]:
+        hashes = [node.commit_hash for node in self._nodes]
+        if before is not None:
+            end = hashes.index(before)
+            return self._nodes[max(0, end - limit) : end]
+        start = hashes.index(after) + 1 if after is not None else 0
+        return self._nodes[start : start + limit]
+
     def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
         return self._ancestors
 
@@ -46,6 +57,9 @@ class MockHistoryReader(HistoryReader):
         # For simplicity, mock content is stored in the node's summary
         return node.summary
 
+    def get_node_contents(self, nodes: List[QuipuNode]) -> Dict[str, str]:
+        return {node.commit_hash: node.summary for node in nodes}
+
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         return {}
 
@@ -58,6 +72,7 @@ class MockHistoryReader(HistoryReader):
         summary_regex: Optional[str] = None,
         node_type: Optional[str] = None,
         limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]:
         return []
 
@@ -115,6 +130,20 @@ class TestGraphViewModel:
         page4 = vm.load_page(4)
         assert len(page4) == 0
 
+    def test_adjacent_pages_use_cursor(self, sample_nodes):
+        reader = MockHistoryReader(sample_nodes)
+        vm = GraphViewModel(reader, current_output_tree_hash=None, page_size=4)
+        vm.initialize()
+
+        # 直接跳转到第 2 页时按偏移量读取一次，之后的翻页都以边界节点为游标
+        assert [n.output_tree for n in vm.load_page(2)] == ["h5", "h4", "h3", "h2"]
+        assert [n.output_tree for n in vm.next_page()] == ["h1", "h0"]
+        assert [n.output_tree for n in vm.previous_page()] == ["h5", "h4", "h3", "h2"]
+        assert [n.output_tree for n in vm.previous_page()] == ["h9", "h8", "h7", "h6"]
+        assert vm.current_page == 1
+        assert vm.previous_page() == []
+        assert reader.offset_loads == [4]
+
     def test_is_reachable(self, sample_nodes):
         ancestors = {"h8"}
         descendants = {"h10"}
@@ -12,12 +12,19 @@ logger = logging.getLogger(__name__)
 DEFAULTS = {
     "storage": {
         "type": "sqlite",  # 可选: "git_object", "sqlite"
+        "native_odb": True,  # 在进程内直接读取 .git/objects，失败时回退到 git cat-file
+        "write_mode": "plumbing",  # 可选: "plumbing" (每步一个 git 进程), "session" (可复用的批量写会话)
+        "compact_heads": True,  # 只保留分支末端的 head 引用，并在松散引用过多时自动 pack-refs
+        "checkout_mode": "diff",  # 可选: "diff" (只删除两个快照之间被删除的路径), "clean" (git clean 全量扫描)
+        "sqlite_busy_timeout": 5.0,  # SQLite 等待其他进程释放锁的秒数
+        "content_cache_bytes": 32 * 1024 * 1024,  # 计划内容缓存 (压缩后) 的字节预算
     },
     "sync": {
         "remote_name": "origin",
         "persistent_ignores": [".idea", ".vscode", ".envs", "__pycache__", "node_modules", "o.md"],
         "user_id": None,
         "subscriptions": [],
+        "fetch_jobs": 4,  # 批量拉取失败后，逐用户重试时的并发 fetch 数
     },
     "list_files": {"ignore_patterns": [".git", "__pycache__", ".idea", ".vscode", "node_modules", ".quipu"]},
 }
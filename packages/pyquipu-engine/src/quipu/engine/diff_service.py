@@ -0,0 +1,88 @@
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TreeDiff:
+    old_tree: str
+    new_tree: str
+    name_status: Tuple[Tuple[str, str], ...]
+    stat: str
+
+    @property
+    def size(self) -> int:
+        # 近似的内存占用，用于按容量淘汰缓存
+        return len(self.stat) + sum(len(path) + 8 for _, path in self.name_status) + 128
+
+
+class DiffService:
+    # 缓存中所有 TreeDiff 的近似总大小上限
+    DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str, int], TreeDiff]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def diff(self, old_tree: str, new_tree: str, stat_count: int = 30) -> TreeDiff:
+        # Tree 哈希不可变，因此缓存条目永远有效，只需按容量淘汰
+        key = (old_tree, new_tree, stat_count)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = self._compute(old_tree, new_tree, stat_count)
+
+        with self._lock:
+            if key not in self._cache and result.size <= self.max_bytes:
+                self._cache[key] = result
+                self._bytes += result.size
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._bytes -= evicted.size
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def _compute(self, old_tree: str, new_tree: str, stat_count: int) -> TreeDiff:
+        # --raw 与 --stat 可以在同一次 diff-tree 中输出：先是逐文件的 raw 行，然后是 stat 摘要
+        args = ["diff-tree", "-r", "--raw", f"--stat=,,{stat_count}", old_tree, new_tree]
+        result = subprocess.run(["git"] + args, cwd=self.root, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error(f"Git plumbing error: {result.stderr}")
+            raise RuntimeError(f"Git command failed: {' '.join(args)}\n{result.stderr}")
+
+        name_status = []
+        stat_lines = []
+        for line in result.stdout.splitlines():
+            if line.startswith(":"):
+                # :<old_mode> <new_mode> <old_sha> <new_sha> <status>\t<path>
+                meta, _, path = line.partition("\t")
+                name_status.append((meta.rsplit(" ", 1)[-1], path))
+            elif line:
+                stat_lines.append(line)
+
+        return TreeDiff(
+            old_tree=old_tree,
+            new_tree=new_tree,
+            name_status=tuple(name_status),
+            stat="\n".join(stat_lines).strip(),
+        )
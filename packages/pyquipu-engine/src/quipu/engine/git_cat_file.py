@@ -0,0 +1,258 @@
+import logging
+import subprocess
+import threading
+from collections import deque
+from pathlib import Path
+from typing import IO, Deque, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# (object_hash, object_type, size, content)
+# 在 --batch-check 模式下 content 恒为 None
+CatFileEntry = Tuple[str, str, int, Optional[bytes]]
+
+# 流式读取的产出: (object_hash, object_type, size, content_view)
+StreamEntry = Tuple[str, str, int, memoryview]
+
+_END = object()
+
+
+class _StreamState:
+    def __init__(self, max_inflight_bytes: int):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.inflight_bytes = 0
+        self.delivered = 0
+        self.cancelled = False
+        self._items: Deque[Union[StreamEntry, BaseException, object]] = deque()
+        self._cond = threading.Condition()
+
+    def reserve(self, size: int):
+        with self._cond:
+            # 背压：预算耗尽时阻塞读取线程；队列为空时总是放行，保证超大对象也能通过
+            while self.inflight_bytes > 0 and self.inflight_bytes + size > self.max_inflight_bytes:
+                if self.cancelled:
+                    return
+                self._cond.wait()
+            self.inflight_bytes += size
+
+    def release(self, size: int):
+        with self._cond:
+            self.inflight_bytes -= size
+            self._cond.notify_all()
+
+    def put(self, item: Union[StreamEntry, BaseException, object]):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self) -> Union[StreamEntry, BaseException, object]:
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            return self._items.popleft()
+
+    def cancel(self):
+        with self._cond:
+            self.cancelled = True
+            self._cond.notify_all()
+
+
+class CatFileProcess:
+    # 单次写入的请求数上限。请求总字节数需远小于管道缓冲区 (通常 64KB)，
+    # 这样无需关闭 stdin 也能安全地流水线读写，不会出现双向阻塞。
+    PIPELINE_WINDOW = 256
+
+    def __init__(self, root: Path, mode: str = "--batch"):
+        if mode not in ("--batch", "--batch-check"):
+            raise ValueError(f"Unsupported cat-file mode: {mode}")
+        self.root = root
+        self.mode = mode
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    @property
+    def with_content(self) -> bool:
+        return self.mode == "--batch"
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self._proc is not None and self._proc.poll() is None:
+            return self._proc.pid
+        return None
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                return self._proc
+            logger.warning(f"git cat-file {self.mode} 协进程已退出 (code={self._proc.returncode})，正在重启。")
+            self._terminate()
+
+        self._proc = subprocess.Popen(
+            ["git", "cat-file", self.mode],
+            cwd=self.root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        logger.debug(f"已启动 git cat-file {self.mode} 协进程 (pid={self._proc.pid})")
+        return self._proc
+
+    def _terminate(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+
+        for stream in (proc.stdin, proc.stdout):
+            if stream:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def close(self):
+        with self._lock:
+            self._terminate()
+
+    def query(self, revs: List[str]) -> List[Optional[CatFileEntry]]:
+        if not revs:
+            return []
+
+        with self._lock:
+            try:
+                return self._exchange(revs)
+            except (OSError, EOFError, ValueError) as e:
+                # 协进程崩溃或协议失步：重启后整体重试一次 (读操作是幂等的)
+                logger.warning(f"git cat-file {self.mode} 协进程通信失败，正在重启: {e}")
+                self._terminate()
+                try:
+                    return self._exchange(revs)
+                except (OSError, EOFError, ValueError) as retry_error:
+                    self._terminate()
+                    raise RuntimeError(f"Git batch operation failed: {retry_error}") from retry_error
+
+    def _exchange(self, revs: List[str]) -> List[Optional[CatFileEntry]]:
+        proc = self._ensure_started()
+        assert proc.stdin is not None and proc.stdout is not None
+
+        results: List[Optional[CatFileEntry]] = []
+        for start in range(0, len(revs), self.PIPELINE_WINDOW):
+            window = revs[start : start + self.PIPELINE_WINDOW]
+            proc.stdin.write("".join(f"{rev}\n" for rev in window).encode("utf-8"))
+            proc.stdin.flush()
+            for _ in window:
+                results.append(self._read_entry(proc.stdout))
+        return results
+
+    def _read_entry(self, stdout: IO[bytes]) -> Optional[CatFileEntry]:
+        header = stdout.readline()
+        if not header:
+            raise EOFError("git cat-file closed its output stream")
+
+        # 不存在的对象: "<rev> missing" / "<rev> ambiguous"
+        if header.endswith((b" missing\n", b" ambiguous\n")):
+            return None
+
+        parts = header.split()
+        if len(parts) != 3:
+            raise ValueError(f"Unexpected git cat-file header: {header!r}")
+
+        obj_hash, obj_type, size = parts[0].decode("ascii"), parts[1].decode("ascii"), int(parts[2])
+        if not self.with_content:
+            return obj_hash, obj_type, size, None
+
+        content = stdout.read(size)
+        if len(content) != size or stdout.read(1) != b"\n":
+            raise EOFError(f"Truncated git cat-file payload for {obj_hash}")
+        return obj_hash, obj_type, size, content
+
+    def stream(self, revs: List[str], max_inflight_bytes: int) -> Iterator[StreamEntry]:
+        if not self.with_content:
+            raise ValueError("stream() requires a --batch coprocess")
+        if not revs:
+            return
+
+        with self._lock:
+            state = _StreamState(max_inflight_bytes)
+            worker = threading.Thread(target=self._stream_worker, args=(revs, state), daemon=True)
+            worker.start()
+            completed = False
+            try:
+                while True:
+                    item = state.get()
+                    if item is _END:
+                        completed = True
+                        return
+                    if isinstance(item, BaseException):
+                        raise RuntimeError(f"Git batch operation failed: {item}") from item
+                    yield item
+                    state.release(item[2])
+            finally:
+                if not completed:
+                    # 消费方提前放弃或读取失败：管道中可能仍有未读响应，协议已无法对齐，直接终止协进程
+                    state.cancel()
+                    if self._proc is not None:
+                        self._proc.kill()
+                worker.join()
+                if not completed:
+                    self._terminate()
+
+    def _stream_worker(self, revs: List[str], state: _StreamState):
+        retried = False
+        try:
+            while state.delivered < len(revs) and not state.cancelled:
+                try:
+                    self._pump(self._ensure_started(), revs, state)
+                except (OSError, EOFError, ValueError) as e:
+                    if state.cancelled or retried:
+                        raise
+                    # 从第一个尚未交付的请求处重启并续传
+                    logger.warning(f"git cat-file {self.mode} 协进程通信失败，正在重启: {e}")
+                    retried = True
+                    self._terminate()
+        except Exception as e:
+            state.put(e)
+            return
+        state.put(_END)
+
+    def _pump(self, proc: subprocess.Popen, revs: List[str], state: _StreamState):
+        assert proc.stdin is not None and proc.stdout is not None
+        total = len(revs)
+        sent = state.delivered
+        while state.delivered < total and not state.cancelled:
+            # 流水线：未完成请求不足半个窗口时补齐，避免频繁的小写入
+            outstanding = sent - state.delivered
+            if sent < total and outstanding <= self.PIPELINE_WINDOW // 2:
+                batch = revs[sent : min(total, state.delivered + self.PIPELINE_WINDOW)]
+                proc.stdin.write("".join(f"{rev}\n" for rev in batch).encode("utf-8"))
+                proc.stdin.flush()
+                sent += len(batch)
+
+            header = proc.stdout.readline()
+            if not header:
+                raise EOFError("git cat-file closed its output stream")
+            if header.endswith((b" missing\n", b" ambiguous\n")):
+                state.delivered += 1
+                continue
+
+            parts = header.split()
+            if len(parts) != 3:
+                raise ValueError(f"Unexpected git cat-file header: {header!r}")
+            size = int(parts[2])
+
+            state.reserve(size)
+            content = proc.stdout.read(size)
+            if len(content) != size or proc.stdout.read(1) != b"\n":
+                state.release(size)
+                raise EOFError(f"Truncated git cat-file payload for {parts[0]!r}")
+
+            state.put((parts[0].decode("ascii"), parts[1].decode("ascii"), size, memoryview(content)))
+            state.delivered += 1
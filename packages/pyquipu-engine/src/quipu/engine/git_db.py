@@ -1,26 +1,147 @@
 import logging
 import os
+import re
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from needle.pointer import L
 from quipu.common.bus import bus
 from quipu.spec.exceptions import ExecutionError
 
+from .diff_service import DiffService, TreeDiff
+from .git_cat_file import CatFileProcess, StreamEntry
+from .git_odb import ObjectStore
+from .git_refs import RefTransaction
+from .git_write_session import WriteSession
+from .output_tree_index import OutputTreeIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 logger = logging.getLogger(__name__)
 
+# .quipu 下持久化影子索引的文件名 (另有同名的 .seed 与 .flock 文件)
+SHADOW_INDEX_NAME = "shadow_index"
+
+_FULL_HASH_RE = re.compile(r"^[0-9a-f]{40}$")
+_PEEL_RE = re.compile(r"^([0-9a-f]{40})\^\{(\w+)\}$")
+_OBJECT_FORMAT_RE = re.compile(r"^\s*objectformat\s*=\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+
+
+@contextmanager
+def _exclusive_file_lock(lock_path: Path):
+    with open(lock_path, "a+b") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _iter_tree_entries(data: bytes):
+    # 原始二进制 Tree 格式: [mode] [space] [path] [null] [20-byte-hash]
+    idx = 0
+    length = len(data)
+    while idx < length:
+        space_idx = data.find(b" ", idx)
+        null_idx = data.find(b"\0", space_idx + 1)
+        if space_idx == -1 or null_idx == -1 or null_idx + 21 > length:
+            break
+        mode = data[idx:space_idx].decode("ascii")
+        name = data[space_idx + 1 : null_idx].decode("utf-8", errors="ignore")
+        yield mode, name, data[null_idx + 1 : null_idx + 21].hex()
+        idx = null_idx + 21
+
 
 class GitDB:
-    def __init__(self, root_dir: Path):
+    # 流式读取时，已从 git 读出但尚未被消费的对象字节数上限
+    STREAM_INFLIGHT_BYTES = 8 * 1024 * 1024
+    # refs/quipu 下的松散引用超过该数量时，自动执行 pack-refs
+    PACK_REFS_THRESHOLD = 512
+
+    def __init__(self, root_dir: Path, native_odb: bool = True, checkout_mode: str = "diff"):
+        # 协进程采用懒启动，必须先于任何可能失败的检查初始化，以便 close() 始终安全
+        self._cat_file_proc: Optional[CatFileProcess] = None
+        self._cat_check_proc: Optional[CatFileProcess] = None
+        self._cat_stream_proc: Optional[CatFileProcess] = None
+        self._odb: Optional[ObjectStore] = None
+        self._write_session: Optional[WriteSession] = None
+        self._shadow_lock = threading.Lock()
+        self.checkout_mode = checkout_mode
+
         if not shutil.which("git"):
             raise ExecutionError("未找到 'git' 命令。请安装 Git 并确保它在系统的 PATH 中。")
 
         self.root = root_dir.resolve()
         self.quipu_dir = self.root / ".quipu"
         self._ensure_git_repo()
+        self.output_tree_index = OutputTreeIndex(self.quipu_dir / "output_tree.idx")
+        self.diff_service = DiffService(self.root)
+
+        if native_odb and self._supports_native_odb():
+            self._odb = ObjectStore(self.root / ".git" / "objects")
+
+    def _supports_native_odb(self) -> bool:
+        # 进程内读取器只理解 SHA-1 对象格式
+        try:
+            config_text = (self.root / ".git" / "config").read_text(encoding="utf-8", errors="ignore")
+        except OSError:
+            return True
+        match = _OBJECT_FORMAT_RE.search(config_text)
+        return match is None or match.group(1).lower() == "sha1"
+
+    def _cat_file_batch(self) -> CatFileProcess:
+        if self._cat_file_proc is None:
+            self._cat_file_proc = CatFileProcess(self.root, "--batch")
+        return self._cat_file_proc
+
+    def _cat_file_check(self) -> CatFileProcess:
+        if self._cat_check_proc is None:
+            self._cat_check_proc = CatFileProcess(self.root, "--batch-check")
+        return self._cat_check_proc
+
+    def _cat_file_stream(self) -> CatFileProcess:
+        if self._cat_stream_proc is None:
+            self._cat_stream_proc = CatFileProcess(self.root, "--batch")
+        return self._cat_stream_proc
+
+    def close(self):
+        for proc in (self._cat_file_proc, self._cat_check_proc, self._cat_stream_proc):
+            if proc:
+                proc.close()
+        if self._odb:
+            self._odb.close()
+        if self._write_session:
+            self._write_session.close()
+            self._write_session = None
+        self._cat_file_proc = None
+        self._cat_check_proc = None
+        self._cat_stream_proc = None
+
+    def __del__(self):
+        self.close()
+
+    def write_session(self) -> Optional[WriteSession]:
+        if self._write_session is None and self._supports_native_odb():
+            self._write_session = WriteSession(self.root, self.root / ".git" / "objects")
+        return self._write_session
 
     def _ensure_git_repo(self):
         if not (self.root / ".git").is_dir():
@@ -62,12 +183,44 @@ class GitDB:
 
     @contextmanager
     def shadow_index(self):
-        index_path = self.quipu_dir / "tmp_index"
+        # 影子索引在多次调用 (以及多个 quipu 进程) 之间持久保留，
+        # 因此读写必须同时受进程内锁与文件锁保护
+        index_path = self.quipu_dir / SHADOW_INDEX_NAME
         self.quipu_dir.mkdir(exist_ok=True)
+        quipu_gitignore = self.quipu_dir / ".gitignore"
+        if not quipu_gitignore.exists():
+            # 与 Engine 的隔离策略一致：持久化的影子索引不应出现在用户的 git status 中
+            quipu_gitignore.write_text("*\n", encoding="utf-8")
 
+        # 注意不能使用 "<index>.lock"：那是 git 自己写索引时创建的锁文件
+        with self._shadow_lock, _exclusive_file_lock(self.quipu_dir / f"{SHADOW_INDEX_NAME}.flock"):
+            yield {"GIT_INDEX_FILE": str(index_path)}
+
+    def invalidate_shadow_index(self):
+        with self.shadow_index() as env:
+            self._discard_shadow_index(Path(env["GIT_INDEX_FILE"]))
+
+    def _user_index_fingerprint(self) -> str:
+        try:
+            st = (self.root / ".git" / "index").stat()
+        except FileNotFoundError:
+            return "absent"
+        return f"{st.st_mtime_ns}:{st.st_size}:{st.st_ino}"
+
+    def _discard_shadow_index(self, index_path: Path):
+        for path in (index_path, index_path.with_name(f"{SHADOW_INDEX_NAME}.seed")):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _seed_shadow_index(self, index_path: Path):
         # --- 性能优化：通过复制用户的索引来“预热”影子索引 ---
         # 这避免了从零开始扫描整个仓库的巨大开销。
         # 后续的 `git add -A` 只需要处理未暂存的变更。
+        self._discard_shadow_index(index_path)
+        fingerprint = self._user_index_fingerprint()
+
         user_index_path = self.root / ".git" / "index"
         if user_index_path.exists():
             try:
@@ -75,32 +228,71 @@ class GitDB:
             except OSError as e:
                 bus.warning(L.engine.git.warning.copyIndexFailed, error=str(e))
 
-        # 定义隔离的环境变量
-        env = {"GIT_INDEX_FILE": str(index_path)}
+        index_path.with_name(f"{SHADOW_INDEX_NAME}.seed").write_text(fingerprint, encoding="utf-8")
 
+    def _prepare_shadow_index(self, index_path: Path) -> bool:
+        # 用户索引未变化时复用上一次的影子索引，其中的 stat 缓存让 `git add -A` 只需重新哈希变更的文件。
+        # 用户索引一旦变化 (git add / commit / checkout ...)，就从它重新预热。
+        seed_path = index_path.with_name(f"{SHADOW_INDEX_NAME}.seed")
         try:
-            yield env
-        finally:
-            # 无论成功失败，必须清理临时索引文件
-            if index_path.exists():
-                try:
-                    index_path.unlink()
-                except OSError:
-                    logger.warning(f"Failed to cleanup shadow index: {index_path}")
+            recorded = seed_path.read_text(encoding="utf-8").strip()
+        except OSError:
+            recorded = None
+
+        if index_path.exists() and recorded == self._user_index_fingerprint():
+            return True
+
+        self._seed_shadow_index(index_path)
+        return False
+
+    def _prune_ignored_entries(self, env: Dict[str, str]):
+        # 复用的影子索引可能仍追踪着后来才被 .gitignore 忽略的文件，
+        # 而从用户索引重新预热时它们不会出现。移除这些条目以保持两种路径的结果一致。
+        ls_ignored = ["ls-files", "-z", "--cached", "--ignored", "--exclude-standard"]
+        shadow_ignored = set(filter(None, self._run(ls_ignored, env=env).stdout.split("\0")))
+        if not shadow_ignored:
+            return
 
-    def get_tree_hash(self) -> str:
-        with self.shadow_index() as env:
-            # 阶段 1: 更新索引以匹配工作区。
-            # 由于 shadow_index 上下文已经通过复制预热了索引，
-            # 此处的 `git add -A` 只会处理少量未暂存的变更，速度非常快。
-            self._run(["add", "-A", "--ignore-errors"], env=env)
+        user_ignored = set(filter(None, self._run(ls_ignored).stdout.split("\0")))
+        stale = sorted(shadow_ignored - user_ignored)
+        if stale:
+            self._run(
+                ["rm", "--cached", "-q", "--pathspec-from-file=-", "--pathspec-file-nul"],
+                env={**env, "GIT_LITERAL_PATHSPECS": "1"},
+                input_data="\0".join(stale),
+            )
 
-            # 阶段 2: 显式移除 .quipu 目录作为安全网。
-            self._run(["rm", "--cached", "-r", ".quipu"], env=env, check=False)
+    def _write_shadow_tree(self, env: Dict[str, str], prune_ignored: bool) -> str:
+        # 阶段 1: 更新索引以匹配工作区。
+        # 影子索引已经预热 (或沿用了上一次的 stat 信息)，
+        # 此处的 `git add -A` 只会处理少量变更，速度非常快。
+        # .quipu 在 pathspec 中直接排除，其中的数据库与影子索引本身都不会被哈希。
+        self._run(["add", "-A", "--ignore-errors", "--", ".", ":(exclude).quipu"], env=env)
+        if prune_ignored:
+            self._prune_ignored_entries(env)
+
+        # 阶段 2: 显式移除 .quipu 目录作为安全网 (例如从用户索引继承来的条目)。
+        self._run(
+            ["rm", "--cached", "-r", "-f", "-q", "--ignore-unmatch", ".quipu"], env=env, check=False, log_error=False
+        )
 
-            # 阶段 3: 将最终的纯净索引写入对象库，返回 Tree Hash。
-            result = self._run(["write-tree"], env=env)
-            return result.stdout.strip()
+        # 阶段 3: 将最终的纯净索引写入对象库，返回 Tree Hash。
+        result = self._run(["write-tree"], env=env)
+        return result.stdout.strip()
+
+    def get_tree_hash(self) -> str:
+        with self.shadow_index() as env:
+            index_path = Path(env["GIT_INDEX_FILE"])
+            reused = self._prepare_shadow_index(index_path)
+            try:
+                return self._write_shadow_tree(env, prune_ignored=reused)
+            except RuntimeError:
+                if not reused:
+                    raise
+                # 持久化的影子索引可能已损坏：从用户索引重新预热后再试一次
+                logger.warning("影子索引刷新失败，正在从用户索引重建。")
+                self._seed_shadow_index(index_path)
+                return self._write_shadow_tree(env, prune_ignored=False)
 
     def hash_object(self, content_bytes: bytes, object_type: str = "blob") -> str:
         try:
@@ -133,11 +325,82 @@ class GitDB:
     def update_ref(self, ref_name: str, commit_hash: str):
         self._run(["update-ref", ref_name, commit_hash])
 
+    def ref_transaction(self) -> RefTransaction:
+        return RefTransaction(self.root)
+
     def delete_ref(self, ref_name: str):
         self._run(["update-ref", "-d", ref_name], check=False)
 
+    def find_redundant_heads(self, prefix: str = "refs/quipu/local/heads/") -> List[Tuple[str, str]]:
+        heads = self.get_all_ref_heads(prefix)
+        if len(heads) < 2:
+            return []
+
+        # 一次 rev-list 遍历所有 head 的祖先 ("<commit>^@" 表示该 commit 的全部父节点)；
+        # 出现在结果中的 head 可以从另一个 head 到达，因此不是真正的分支末端
+        payload = "".join(f"{commit_hash}^@\n" for commit_hash in {c for c, _ in heads})
+        result = self._run(["rev-list", "--stdin"], check=False, input_data=payload)
+        if result.returncode != 0:
+            logger.warning(f"无法计算冗余的 head 引用: {result.stderr.strip()}")
+            return []
+
+        ancestors = set(result.stdout.split())
+        return [(commit_hash, ref_name) for commit_hash, ref_name in heads if commit_hash in ancestors]
+
+    def compact_heads(self, prefix: str = "refs/quipu/local/heads/") -> int:
+        redundant = self.find_redundant_heads(prefix)
+        with self.ref_transaction() as tx:
+            for commit_hash, ref_name in redundant:
+                tx.delete(ref_name, commit_hash)
+        if redundant:
+            logger.debug(f"已折叠 {len(redundant)} 个冗余的 head 引用")
+        self.pack_refs_if_needed()
+        return len(redundant)
+
+    def count_loose_refs(self, namespace: str = "refs/quipu") -> int:
+        return sum(len(files) for _, _, files in os.walk(self.root / ".git" / namespace))
+
+    def ref_fingerprint(self, namespace: str = "refs/quipu") -> Optional[Tuple[Tuple[str, int, int, int], ...]]:
+        git_dir = self.root / ".git"
+        if not git_dir.is_dir():
+            # .git 为文件 (worktree / submodule) 时无法廉价判断，返回 None 表示必须重新加载
+            return None
+
+        # 引用更新总是通过 <ref>.lock + rename 完成，因此 (mtime, size, inode) 的变化足以察觉任何改动
+        entries = []
+        packed = git_dir / "packed-refs"
+        try:
+            st = packed.stat()
+            entries.append(("packed-refs", st.st_mtime_ns, st.st_size, st.st_ino))
+        except FileNotFoundError:
+            pass
+        for dirpath, _, files in os.walk(git_dir / namespace):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((os.path.join(dirpath, name), st.st_mtime_ns, st.st_size, st.st_ino))
+        entries.sort()
+        return tuple(entries)
+
+    def pack_refs_if_needed(self, threshold: Optional[int] = None) -> bool:
+        limit = self.PACK_REFS_THRESHOLD if threshold is None else threshold
+        if self.count_loose_refs() <= limit:
+            return False
+        # --all 才会打包 refs/quipu 这类非 tag 的引用，打包后的松散文件会被一并删除
+        self._run(["pack-refs", "--all"])
+        logger.debug("松散引用数量超过阈值，已执行 pack-refs")
+        return True
+
     def get_commit_by_output_tree(self, tree_hash: str) -> Optional[str]:
-        # 使用 grep 搜索所有 refs/quipu/ 下的记录
+        if self.output_tree_index.initialized:
+            try:
+                return self.output_tree_index.lookup(tree_hash)
+            except (OSError, ValueError) as e:
+                logger.warning(f"output_tree 索引不可用，回退到全量搜索: {e}")
+
+        # 索引尚未建立 (尚未加载过历史) 时，回退为使用 grep 搜索所有 refs/quipu/ 下的记录
         # 注意：这假设 Output Tree 是唯一的，这在大概率上是成立的，
         # 且即使有重复（如 merge），找到任意一个作为父节点通常也是可接受的起点。
         cmd = ["log", "--all", f"--grep=X-Quipu-Output-Tree: {tree_hash}", "--format=%H", "-n", "1"]
@@ -163,138 +426,214 @@ class GitDB:
         )
         return result.returncode == 0
 
+    def get_tree_diff(self, old_tree: str, new_tree: str, count=30) -> TreeDiff:
+        return self.diff_service.diff(old_tree, new_tree, stat_count=count)
+
     def get_diff_stat(self, old_tree: str, new_tree: str, count=30) -> str:
-        # 使用 --stat=<width>,<name-width>,<count> 格式
-        # 我们不关心 width，所以留空，只设置 count
-        result = self._run(["diff-tree", f"--stat=,,{count}", old_tree, new_tree])
-        return result.stdout.strip()
+        # stat 中最多列出 count 个文件，超出部分由 git 折叠为一行摘要
+        return self.get_tree_diff(old_tree, new_tree, count).stat
 
     def get_diff_name_status(self, old_tree: str, new_tree: str) -> List[Tuple[str, str]]:
-        result = self._run(["diff-tree", "--name-status", "--no-commit-id", "-r", old_tree, new_tree])
-        changes = []
-        for line in result.stdout.strip().splitlines():
-            if not line:
-                continue
-            parts = line.split("\t", 1)
-            if len(parts) == 2:
-                status, path = parts
-                changes.append((status, path))
-        return changes
+        return list(self.get_tree_diff(old_tree, new_tree).name_status)
 
     def checkout_tree(self, new_tree_hash: str, old_tree_hash: Optional[str] = None):
         bus.info(L.engine.git.info.checkoutStarted, short_hash=new_tree_hash[:7])
+        start = time.perf_counter()
+        diff_mode = self.checkout_mode == "diff" and bool(old_tree_hash)
+
+        # 1. 差异驱动的清理 (需在 read-tree 之前，以便目录与文件之间的类型转换不产生冲突)
+        # 只删除旧快照中存在而新快照中不存在的路径，耗时与变更规模成正比，而不是与整个工作区成正比。
+        # 要求 old_tree_hash 准确反映当前工作区，否则旧快照之外的未追踪文件会被保留。
+        removed = 0
+        if self.checkout_mode == "diff" and old_tree_hash:
+            removed = self._remove_deleted_paths(old_tree_hash, new_tree_hash)
 
-        # 1. 高性能检出核心
+        # 2. 高性能检出核心
         # --reset: 类似于 git reset --hard，强制覆盖本地未提交的变更，解决 "not uptodate" 冲突。
         # -u: 更新工作区文件。Git 会自动对比当前索引，只对发生变更的文件执行 I/O (更新 mtime)。
-        # 这就是我们要的 "tree-vs-tree" 优化，不需要手动传入 old_tree_hash，因为当前索引就是 old_tree。
         logger.debug(f"执行优化的强制检出: -> {new_tree_hash[:7]}")
         self._run(["read-tree", "--reset", "-u", new_tree_hash])
 
-        # 2. 清理工作区中多余的文件和目录
-        # read-tree -u 会删除旧树中有但新树中没有的文件。
-        # 但它不会删除 "未追踪 (Untracked)" 的新文件。我们需要用 clean 来处理它们。
-        # -d: 目录, -f: 强制
-        # -e .quipu: 排除 .quipu 目录，防止自毁
-        self._run(["clean", "-df", "-e", ".quipu"])
-
+        if not diff_mode:
+            # 3. 回退方案：清理工作区中多余的文件和目录
+            # read-tree -u 会删除旧树中有但新树中没有的文件。
+            # 但它不会删除 "未追踪 (Untracked)" 的新文件。我们需要用 clean 来处理它们。
+            # -d: 目录, -f: 强制
+            # -e .quipu: 排除 .quipu 目录，防止自毁
+            self._run(["clean", "-df", "-e", ".quipu"])
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if diff_mode:
+            logger.info(f"检出完成 (diff 模式，删除 {removed} 个路径): {elapsed_ms:.1f} ms")
+        else:
+            logger.info(f"检出完成 (clean 模式): {elapsed_ms:.1f} ms")
         bus.success(L.engine.git.success.checkoutComplete)
 
+    def _remove_deleted_paths(self, old_tree_hash: str, new_tree_hash: str) -> int:
+        if old_tree_hash == new_tree_hash:
+            return 0
+        result = self._run(
+            ["diff-tree", "-r", "-z", "--name-only", "--no-renames", "--diff-filter=D", old_tree_hash, new_tree_hash],
+            capture_as_text=False,
+        )
+
+        removed = 0
+        parents = set()
+        for raw_path in result.stdout.split(b"\0"):
+            if not raw_path:
+                continue
+            rel_path = os.fsdecode(raw_path)
+            if rel_path == ".quipu" or rel_path.startswith(".quipu/"):
+                continue
+            path = self.root / rel_path
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except IsADirectoryError:
+                # 旧快照中的文件已被用户替换为目录，交由 read-tree 处理
+                continue
+            parents.update(path.parents[: len(Path(rel_path).parts) - 1])
+
+        # 与 clean -d 一致：删除因此变空的目录 (由深到浅)
+        for directory in sorted(parents, key=lambda p: len(p.parts), reverse=True):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+        return removed
+
+    def _read_native(self, rev: str) -> Optional[Tuple[str, str, bytes]]:
+        if self._odb is None:
+            return None
+
+        try:
+            if ":" in rev:
+                base, _, path = rev.partition(":")
+                obj = self._peel_native(base, "tree")
+                for segment in path.split("/") if path else []:
+                    if obj is None:
+                        return None
+                    entry_hash = next((h for _, name, h in _iter_tree_entries(obj[2]) if name == segment), None)
+                    if entry_hash is None:
+                        # 路径不存在时交由 git 给出权威答复
+                        return None
+                    found = self._odb.read(entry_hash)
+                    obj = (entry_hash, found[0], found[1]) if found else None
+                return obj
+
+            peel = _PEEL_RE.match(rev)
+            if peel:
+                return self._peel_native(peel.group(1), peel.group(2))
+
+            if _FULL_HASH_RE.match(rev):
+                found = self._odb.read(rev)
+                return (rev, found[0], found[1]) if found else None
+        except (OSError, ValueError, IndexError, KeyError) as e:
+            logger.debug(f"进程内读取 {rev} 失败，回退到 git cat-file: {e}")
+        return None
+
+    def _peel_native(self, object_hash: str, object_type: str) -> Optional[Tuple[str, str, bytes]]:
+        if not _FULL_HASH_RE.match(object_hash):
+            return None
+        found = self._odb.read(object_hash)  # type: ignore[union-attr]
+        if found is None:
+            return None
+        if found[0] == object_type:
+            return object_hash, found[0], found[1]
+        if found[0] == "commit" and object_type == "tree" and found[1].startswith(b"tree "):
+            tree_hash = found[1][5:45].decode("ascii")
+            tree = self._odb.read(tree_hash)  # type: ignore[union-attr]
+            return (tree_hash, tree[0], tree[1]) if tree else None
+        # 其余解引用 (例如 tag) 交给 git 处理
+        return None
+
     def cat_file(self, object_hash: str, object_type: str) -> bytes:
-        cmd = ["cat-file", object_type, object_hash]
-        result = self._run(cmd, capture_as_text=False)
-        return result.stdout
+        # "<hash>^{type}" 与 `git cat-file <type> <hash>` 具有相同的解引用语义
+        rev = f"{object_hash}^{{{object_type}}}"
+        native = self._read_native(rev)
+        if native is not None:
+            return native[2]
+
+        (entry,) = self._cat_file_batch().query([rev])
+        if entry is None:
+            logger.error(f"Git plumbing error: object {object_hash} ({object_type}) not found")
+            raise RuntimeError(f"Git command failed: cat-file {object_type} {object_hash}")
+        return entry[3] or b""
+
+    def get_object_info(self, object_hash: str) -> Optional[Tuple[str, int]]:
+        (entry,) = self._cat_file_check().query([object_hash])
+        if entry is None:
+            return None
+        return entry[1], entry[2]
 
     def get_blobs_from_tree(self, tree_hash: str) -> Dict[str, bytes]:
-        # 1. 获取 Tree 的内容
-        tree_content_bytes = self.cat_file(tree_hash, "tree")
-        tree_content = tree_content_bytes.decode("utf-8", "ignore")
-
-        # 2. 解析 Tree 内容以获取 blob 哈希
-        # 格式: <mode> <type> <hash>\t<filename>
-        blob_info = {}
-        for line in tree_content.strip().splitlines():
-            parts = line.split()
-            if len(parts) == 4 and parts[1] == "blob":
-                blob_hash, filename = parts[2], parts[3]
-                blob_info[filename] = blob_hash
+        # 1. 获取 Tree 的原始二进制内容
+        tree_content = self.cat_file(tree_hash, "tree")
 
+        # 2. 解析 Tree 内容以获取 blob 哈希 (跳过子树，例如 snapshot)
+        blob_info = {name: obj_hash for mode, name, obj_hash in _iter_tree_entries(tree_content) if mode != "40000"}
         if not blob_info:
             return {}
 
-        # 3. 批量获取所有 blob 的内容
-        return self.batch_cat_file(list(blob_info.values()))
+        # 3. 通过同一个协进程批量获取所有 blob 的内容
+        blob_contents = self.batch_cat_file(list(blob_info.values()))
+        return {name: blob_contents[obj_hash] for name, obj_hash in blob_info.items() if obj_hash in blob_contents}
 
     def batch_cat_file(self, object_hashes: List[str]) -> Dict[str, bytes]:
         if not object_hashes:
             return {}
 
-        # Deduplicate
-        unique_hashes = list(set(object_hashes))
-
-        # Prepare input: <hash>\n
-        input_str = "\n".join(unique_hashes) + "\n"
+        # 去重并保持顺序
+        unique_hashes = list(dict.fromkeys(object_hashes))
 
         results = {}
+        misses = []
+        for requested in unique_hashes:
+            native = self._read_native(requested)
+            if native is None:
+                misses.append(requested)
+            else:
+                results[requested] = native[2]
+
+        for requested, entry in zip(misses, self._cat_file_batch().query(misses)):
+            if entry is None:
+                continue
+            # 以请求的名称为键，以便调用方使用 "<commit>^{tree}" 之类的表达式
+            results[requested] = entry[3]
+        return results
 
-        try:
-            # git cat-file --batch format:
-            # <hash> <type> <size>\n
-            # <content>\n
-            with subprocess.Popen(
-                ["git", "cat-file", "--batch"],
-                cwd=self.root,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                # bufsize=0 is often recommended for binary streams but careful buffering is usually fine
-            ) as proc:
-                # Write requests and close stdin to signal EOF
-                if proc.stdin:
-                    proc.stdin.write(input_str.encode("utf-8"))
-                    proc.stdin.close()
-
-                if not proc.stdout:
-                    return {}
-
-                while True:
-                    # Read header line
-                    header_line = proc.stdout.readline()
-                    if not header_line:
-                        break
-
-                    header_parts = header_line.strip().split()
-                    if not header_parts:
-                        continue
-
-                    obj_hash_bytes = header_parts[0]
-                    obj_hash = obj_hash_bytes.decode("utf-8")
-
-                    # Check for missing object: "<hash> missing"
-                    if len(header_parts) == 2 and header_parts[1] == b"missing":
-                        continue
-
-                    if len(header_parts) < 3:
-                        logger.warning(f"Unexpected git cat-file header: {header_line}")
-                        continue
-
-                    # size is at index 2
-                    try:
-                        size = int(header_parts[2])
-                    except ValueError:
-                        logger.warning(f"Invalid size in header: {header_line}")
-                        continue
-
-                    # Read content bytes + trailing newline
-                    content = proc.stdout.read(size)
-                    proc.stdout.read(1)  # Consume the trailing LF
-
-                    results[obj_hash] = content
-
-        except Exception as e:
-            logger.error(f"Batch cat-file failed: {e}")
-            raise RuntimeError(f"Git batch operation failed: {e}") from e
+    def iter_cat_file(
+        self, object_hashes: List[str], max_inflight_bytes: Optional[int] = None
+    ) -> Iterator[StreamEntry]:
+        unique_hashes = list(dict.fromkeys(object_hashes))
+        if not unique_hashes:
+            return
 
-        return results
+        # 进程内命中的对象按请求顺序立即产出，其余对象随后统一交给协进程
+        misses = []
+        for requested in unique_hashes:
+            native = self._read_native(requested)
+            if native is None:
+                misses.append(requested)
+            else:
+                yield native[0], native[1], len(native[2]), memoryview(native[2])
+        if not misses:
+            return
+
+        budget = max_inflight_bytes or self.STREAM_INFLIGHT_BYTES
+        stream_proc = self._cat_file_stream()
+        if not stream_proc.busy:
+            yield from stream_proc.stream(misses, budget)
+            return
+
+        # 嵌套或并发的流式读取：使用一个临时协进程，避免与正在进行的流交错
+        temp_proc = CatFileProcess(self.root, "--batch")
+        try:
+            yield from temp_proc.stream(misses, budget)
+        finally:
+            temp_proc.close()
 
     def get_all_ref_heads(self, prefix: str) -> List[Tuple[str, str]]:
         res = self._run(["for-each-ref", "--format=%(objectname) %(refname)", prefix], check=False)
@@ -313,45 +652,75 @@ class GitDB:
         res = self._run(["show-ref", "--verify", "--quiet", "refs/quipu/"], check=False, log_error=False)
         return res.returncode == 0
 
-    def log_ref(self, ref_names: Union[str, List[str]]) -> List[Dict[str, str]]:
-        # A unique delimiter that's unlikely to appear in commit messages
-        DELIMITER = "---QUIPU-LOG-ENTRY---"
-        # Format: H=hash, P=parent, T=tree, ct=commit_timestamp, B=body
-        log_format = f"%H%n%P%n%T%n%ct%n%B{DELIMITER}"
+    # Format: H=hash, P=parent, T=tree, ct=commit_timestamp, B=body; 记录之间由 -z 以 NUL 分隔
+    LOG_FORMAT = "%H%n%P%n%T%n%ct%n%B"
+    LOG_CHUNK_SIZE = 64 * 1024
 
-        if isinstance(ref_names, str):
-            refs_to_log = [ref_names]
-        else:
-            refs_to_log = ref_names
+    def iter_log(self, revisions: Iterable[str]) -> Iterator[Dict[str, str]]:
+        revisions = list(revisions)
+        if not revisions:
+            return
 
-        if not refs_to_log:
-            return []
+        # 修订通过 --stdin 传入以避免 ARG_MAX 限制；git 会先读完 stdin 再开始遍历
+        proc = subprocess.Popen(
+            ["git", "log", "-z", f"--format={self.LOG_FORMAT}", "--stdin"],
+            cwd=self.root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            try:
+                proc.stdin.write("".join(f"{rev}\n" for rev in revisions).encode())
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+            # 未结束的记录按块暂存，只在遇到 NUL 时拼接，避免超长提交信息导致的重复拷贝
+            pending: List[bytes] = []
+            while True:
+                chunk = proc.stdout.read1(self.LOG_CHUNK_SIZE)
+                if not chunk:
+                    break
+                pending.append(chunk)
+                if b"\0" not in chunk:
+                    continue
+                records = b"".join(pending).split(b"\0")
+                pending = [records.pop()]
+                for record in records:
+                    entry = self._parse_log_record(record)
+                    if entry:
+                        yield entry
+            entry = self._parse_log_record(b"".join(pending))
+            if entry:
+                yield entry
+
+            if proc.wait() != 0:
+                logger.debug(f"git log 失败: {proc.stderr.read().decode('utf-8', errors='replace').strip()}")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            proc.stderr.close()
+
+    @staticmethod
+    def _parse_log_record(record: bytes) -> Optional[Dict[str, str]]:
+        parts = record.decode("utf-8", errors="replace").strip("\n").split("\n", 4)
+        if len(parts) < 4:
+            return None
+        return {
+            "hash": parts[0],
+            "parent": parts[1],
+            "tree": parts[2],
+            "timestamp": parts[3],
+            "body": parts[4] if len(parts) > 4 else "",
+        }
 
+    def log_ref(self, ref_names: Union[str, List[str]]) -> List[Dict[str, str]]:
+        refs_to_log = [ref_names] if isinstance(ref_names, str) else ref_names
         # Git log on multiple refs will automatically show the union of their histories without duplicates.
-        cmd = ["log", f"--format={log_format}"] + refs_to_log
-        res = self._run(cmd, check=False, log_error=False)
-
-        if res.returncode != 0:
-            return []
-
-        entries = res.stdout.strip().split(DELIMITER)
-        parsed_logs = []
-        for entry in entries:
-            if not entry.strip():
-                continue
-
-            parts = entry.strip().split("\n", 4)
-            if len(parts) >= 4:
-                parsed_logs.append(
-                    {
-                        "hash": parts[0],
-                        "parent": parts[1],
-                        "tree": parts[2],
-                        "timestamp": parts[3],
-                        "body": parts[4] if len(parts) > 4 else "",
-                    }
-                )
-        return parsed_logs
+        return list(self.iter_log(refs_to_log))
 
     def push_quipu_refs(self, remote: str, user_id: str, force: bool = False):
         refspec = f"refs/quipu/local/heads/*:refs/quipu/users/{user_id}/heads/*"
@@ -363,10 +732,55 @@ class GitDB:
             cmd.extend(["--force", "--prune"])
         self._run(cmd)
 
+    @staticmethod
+    def _fetch_refspec(remote: str, user_id: str) -> str:
+        return f"refs/quipu/users/{user_id}/heads/*:refs/quipu/remotes/{remote}/{user_id}/heads/*"
+
     def fetch_quipu_refs(self, remote: str, user_id: str):
-        refspec = f"refs/quipu/users/{user_id}/heads/*:refs/quipu/remotes/{remote}/{user_id}/heads/*"
         bus.info(L.engine.git.info.fetching, remote=remote, user_id=user_id)
-        self._run(["fetch", remote, "--prune", refspec])
+        self._run(["fetch", remote, "--prune", self._fetch_refspec(remote, user_id)])
+
+    def fetch_quipu_refs_many(self, remote: str, user_ids: List[str], max_workers: int = 4) -> Dict[str, str]:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return {}
+        bus.info(L.engine.git.info.fetchingMany, remote=remote, count=len(user_ids))
+
+        # 所有用户的 refspec 通过 stdin 交给同一个 fetch：只进行一次连接与协商
+        payload = "".join(f"{self._fetch_refspec(remote, user_id)}\n" for user_id in user_ids)
+        result = self._run(["fetch", remote, "--prune", "--stdin"], check=False, input_data=payload)
+        if result.returncode == 0:
+            failures: Dict[str, str] = {}
+        else:
+            # 任意一个 refspec 出错都会让整个 fetch 失败，此时逐用户重试以隔离失败
+            logger.warning(f"批量拉取失败，回退为逐用户拉取: {result.stderr.strip()}")
+            failures = self._fetch_each(remote, user_ids, max_workers)
+
+        ref_counts: Dict[str, int] = {}
+        for _, ref_name in self.get_all_ref_heads(f"refs/quipu/remotes/{remote}/"):
+            owner = ref_name.split("/")[4]
+            ref_counts[owner] = ref_counts.get(owner, 0) + 1
+
+        for user_id in user_ids:
+            if user_id in failures:
+                bus.warning(L.engine.git.warning.fetchFailed, user_id=user_id, error=failures[user_id])
+            else:
+                bus.info(L.engine.git.info.fetchedUser, user_id=user_id, count=ref_counts.get(user_id, 0))
+        return failures
+
+    def _fetch_each(self, remote: str, user_ids: List[str], max_workers: int) -> Dict[str, str]:
+        def fetch_one(user_id: str) -> Optional[str]:
+            # 并发的 fetch 各自写 FETCH_HEAD 与触发自动 gc 会相互干扰，这里都关闭
+            result = self._run(
+                ["fetch", "--no-write-fetch-head", "--no-auto-gc", remote, "--prune"]
+                + [self._fetch_refspec(remote, user_id)],
+                check=False,
+            )
+            return result.stderr.strip() if result.returncode != 0 else None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            errors = dict(zip(user_ids, pool.map(fetch_one, user_ids)))
+        return {user_id: error for user_id, error in errors.items() if error is not None}
 
     def reconcile_local_with_remote(self, remote: str, user_id: str):
         remote_heads_prefix = f"refs/quipu/remotes/{remote}/{user_id}/heads/"
@@ -375,24 +789,27 @@ class GitDB:
             logger.debug("No remote refs found to reconcile.")
             return
 
-        reconciled_count = 0
-        for commit_hash, remote_ref in remote_heads:
-            # e.g., remote_ref = refs/quipu/remotes/origin/user/heads/abc...
-            #       local_ref should be refs/quipu/local/heads/abc...
-            local_ref_suffix = remote_ref.replace(remote_heads_prefix, "")
-            local_ref = f"refs/quipu/local/heads/{local_ref_suffix}"
-
-            # 使用 rev-parse 检查本地 ref 是否已存在
-            # 如果本地已经存在，我们假设它是最新的或用户有意为之，不做任何操作
-            check_res = self._run(["rev-parse", "--verify", local_ref], check=False, log_error=False)
-            if check_res.returncode != 0:
-                # 本地不存在此 ref，从远程镜像创建它
-                self.update_ref(local_ref, commit_hash)
-                reconciled_count += 1
-                bus.info(L.engine.git.info.reconciledNewBranch, short_hash=commit_hash[:7])
-
-        if reconciled_count > 0:
-            bus.success(L.engine.git.success.reconciliationComplete, count=reconciled_count)
+        # 一次 for-each-ref 快照代替逐个 rev-parse 检查
+        # 如果本地已经存在，我们假设它是最新的或用户有意为之，不做任何操作
+        local_refs = {ref for _, ref in self.get_all_ref_heads("refs/quipu/local/heads/")}
+
+        created = []
+        with self.ref_transaction() as tx:
+            for commit_hash, remote_ref in remote_heads:
+                # e.g., remote_ref = refs/quipu/remotes/origin/user/heads/abc...
+                #       local_ref should be refs/quipu/local/heads/abc...
+                local_ref_suffix = remote_ref.replace(remote_heads_prefix, "")
+                local_ref = f"refs/quipu/local/heads/{local_ref_suffix}"
+                if local_ref not in local_refs:
+                    # 本地不存在此 ref，从远程镜像创建它
+                    tx.create(local_ref, commit_hash)
+                    created.append(commit_hash)
+
+        for commit_hash in created:
+            bus.info(L.engine.git.info.reconciledNewBranch, short_hash=commit_hash[:7])
+
+        if created:
+            bus.success(L.engine.git.success.reconciliationComplete, count=len(created))
         else:
             logger.debug("✅ Local history is already up-to-date with remote.")
 
@@ -400,20 +817,21 @@ class GitDB:
         local_prefix = "refs/quipu/local/heads/"
         remote_prefix = f"refs/quipu/remotes/{remote}/{user_id}/heads/"
 
-        local_heads = {ref.replace(local_prefix, "") for _, ref in self.get_all_ref_heads(local_prefix)}
+        local_heads = {
+            ref.replace(local_prefix, ""): commit_hash for commit_hash, ref in self.get_all_ref_heads(local_prefix)
+        }
         remote_heads = {ref.replace(remote_prefix, "") for _, ref in self.get_all_ref_heads(remote_prefix)}
 
-        to_delete = local_heads - remote_heads
+        to_delete = sorted(set(local_heads) - remote_heads)
         if not to_delete:
             logger.debug("✅ No local refs to prune.")
             return
 
-        deleted_count = 0
-        for ref_suffix in to_delete:
-            local_ref_to_delete = local_prefix + ref_suffix
-            self.delete_ref(local_ref_to_delete)
-            deleted_count += 1
-            bus.info(L.engine.git.info.prunedRef, ref=local_ref_to_delete)
+        with self.ref_transaction() as tx:
+            for ref_suffix in to_delete:
+                # 以快照中的值作为期望旧值，避免误删在此期间被更新的引用
+                tx.delete(local_prefix + ref_suffix, local_heads[ref_suffix])
 
-        if deleted_count > 0:
-            bus.success(L.engine.git.success.pruningComplete, count=deleted_count)
+        for ref_suffix in to_delete:
+            bus.info(L.engine.git.info.prunedRef, ref=local_prefix + ref_suffix)
+        bus.success(L.engine.git.success.pruningComplete, count=len(to_delete))
@@ -4,26 +4,95 @@ import logging
 import os
 import platform
 import re
+import threading
 import time
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from quipu.engine.git_db import GitDB
+from quipu.engine.node_table import NodeRecord, NodeTable
+from quipu.engine.reachability import ReachabilityIndex
 from quipu.spec.constants import EMPTY_TREE_HASH
+from quipu.spec.models.compact_graph import CompactGraph, NodeRow
 from quipu.spec.models.graph import QuipuNode
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class _GraphSnapshot:
+    fingerprint: Optional[Tuple]
+    # 按 (timestamp, commit_hash) 倒序排列的全部节点，与 SQLite 后端的分页顺序一致
+    nodes: List[QuipuNode]
+    by_commit: Dict[str, QuipuNode]
+    by_output_tree: Dict[str, List[QuipuNode]]
+    # output_tree -> 在 nodes 中首次出现的位置
+    positions: Dict[str, int]
+    # commit_hash -> 在 nodes 中的位置，用于按游标分页
+    rows: Dict[str, int]
+
+    @classmethod
+    def build(cls, fingerprint: Optional[Tuple], nodes: List[QuipuNode]) -> "_GraphSnapshot":
+        nodes = sorted(nodes, key=lambda n: (n.timestamp, n.commit_hash), reverse=True)
+        by_output_tree: Dict[str, List[QuipuNode]] = {}
+        positions: Dict[str, int] = {}
+        for i, node in enumerate(nodes):
+            by_output_tree.setdefault(node.output_tree, []).append(node)
+            positions.setdefault(node.output_tree, i)
+        rows = {n.commit_hash: i for i, n in enumerate(nodes)}
+        return cls(fingerprint, nodes, {n.commit_hash: n for n in nodes}, by_output_tree, positions, rows)
+
+
 class GitObjectHistoryReader:
+    # 每批解析的 log 条目数
+    LOG_BATCH_SIZE = 2048
+
     def __init__(self, git_db: GitDB):
         self.git_db = git_db
+        self.node_table = NodeTable(git_db.quipu_dir / "node_table.json")
+        # 进程内的图快照，在 refs/quipu 的指纹变化之前被所有查询复用
+        # 可重入：可达性查询需要在持有锁时取得快照，保证索引与快照一致
+        self._snapshot_lock = threading.RLock()
+        self._cached_snapshot: Optional[_GraphSnapshot] = None
+        # 以 commit 为键的可达性索引，随快照更新增量维护
+        self._reachability = ReachabilityIndex()
 
     def _parse_output_tree_from_body(self, body: str) -> Optional[str]:
         match = re.search(r"X-Quipu-Output-Tree:\s*([0-9a-f]{40})", body)
         return match.group(1) if match else None
 
+    def _parse_trailer_meta(self, body: str) -> Optional[Dict[str, Any]]:
+        # 摘要是 trailer 块之前的全部内容；trailer 块是提交信息的最后一段
+        summary, _, block = body.rstrip("\n").rpartition("\n\n")
+        trailers: Dict[str, str] = {}
+        for line in block.splitlines():
+            key, sep, value = line.partition(": ")
+            if sep and key.startswith("X-Quipu-"):
+                trailers[key[len("X-Quipu-") :]] = value.strip()
+
+        # 1.0 节点只有 Output-Tree trailer，需要回退到 metadata.json
+        if "Meta-Version" not in trailers or "Type" not in trailers:
+            return None
+        output_tree = trailers.get("Output-Tree", "")
+        if not re.fullmatch(r"[0-9a-f]{40}", output_tree):
+            return None
+        try:
+            start = float(trailers["Start"])
+        except (KeyError, ValueError):
+            return None
+        return {
+            "meta_version": trailers["Meta-Version"],
+            "output_tree": output_tree,
+            "type": trailers["Type"],
+            "summary": summary,
+            "start": start,
+            "generator": trailers.get("Generator"),
+            "owner": trailers.get("Owner"),
+        }
+
     def _parse_tree_binary(self, data: bytes) -> Dict[str, str]:
         entries = {}
         idx = 0
@@ -57,193 +126,321 @@ class GitObjectHistoryReader:
         return entries
 
     def load_all_nodes(self) -> List[QuipuNode]:
-        # Step 1: Get Commits
+        return list(self._snapshot().nodes)
+
+    def _snapshot(self) -> "_GraphSnapshot":
+        # 先取指纹再加载：加载期间发生的引用变化会让下一次查询的指纹不匹配，从而重新加载
+        fingerprint = self.git_db.ref_fingerprint()
+        with self._snapshot_lock:
+            cached = self._cached_snapshot
+            if cached is not None and fingerprint is not None and cached.fingerprint == fingerprint:
+                return cached
+            snapshot = _GraphSnapshot.build(fingerprint, self._load_nodes())
+            self._reachability.update(
+                (n.commit_hash, n.parent.commit_hash if n.parent else None) for n in snapshot.nodes
+            )
+            self._cached_snapshot = snapshot
+            return snapshot
+
+    def _load_records(self) -> Dict[str, NodeRecord]:
+        # Step 1: Get Heads
         ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
         if not ref_tuples:
-            return []
+            return {}
+        heads = set(t[0] for t in ref_tuples)
 
-        all_heads = list(set(t[0] for t in ref_tuples))
-        log_entries = self.git_db.log_ref(all_heads)
-        if not log_entries:
+        # Step 2: 从持久化的节点表出发，只遍历新出现的 head 带来的提交
+        try:
+            known_heads, records = self.node_table.load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"节点表损坏，正在重建: {e}")
+            known_heads, records = set(), {}
+
+        changed = False
+        # 可达集合缩小时 (prune、reconcile 或回退为全量遍历) 索引中可能残留已不可达的提交，需要整体重建
+        shrunk = False
+        new_heads = [h for h in sorted(heads - known_heads) if h not in records]
+        if new_heads:
+            exclusions = [f"^{h}" for h in sorted(known_heads)]
+            parsed = self._parse_log_entries(self.git_db.iter_log(new_heads + exclusions))
+            if not parsed and exclusions:
+                # 已知 head 可能已被 gc 回收，排除参数失效时退回全量遍历
+                logger.debug("增量遍历失败，回退到全量加载")
+                records = {}
+                shrunk = True
+                parsed = self._parse_log_entries(self.git_db.iter_log(sorted(heads)))
+            for record in parsed:
+                records.setdefault(record.commit, record)
+            changed = True
+
+        if changed or known_heads - heads:
+            # head 被删除 (prune) 后，仅保留仍可从现存 head 到达的提交
+            reachable = self._reachable_records(records, heads)
+            shrunk = shrunk or len(reachable) < len(records)
+            records = reachable
+            try:
+                self.node_table.save(heads, records.values())
+            except OSError as e:
+                logger.warning(f"无法写入节点表: {e}")
+            changed = True
+
+        # 节点表只在这里发生变化：所有消费者 (QuipuNode 图或紧凑图) 都经由此处，索引不会漏掉新节点
+        if changed or not self.git_db.output_tree_index.initialized:
+            self._sync_output_tree_index(records.values(), rebuild=shrunk)
+        return records
+
+    def _load_nodes(self) -> List[QuipuNode]:
+        records = self._load_records()
+        if not records:
             return []
 
-        # Step 2: Batch fetch Trees
-        tree_hashes = [entry["tree"] for entry in log_entries]
-        trees_content = self.git_db.batch_cat_file(tree_hashes)
+        # Step 3: Assemble Nodes
+        temp_nodes: Dict[str, QuipuNode] = {}
+        for record in records.values():
+            if not record.valid:
+                continue
+            temp_nodes[record.commit] = QuipuNode(
+                commit_hash=record.commit,
+                # Placeholder, will be filled in the linking phase
+                input_tree="",
+                output_tree=record.output_tree,
+                timestamp=datetime.fromtimestamp(record.timestamp),
+                filename=Path(f".quipu/git_objects/{record.commit}"),
+                node_type=record.node_type,
+                # Content is lazy loaded
+                content="",
+                summary=record.summary,
+                owner_id=record.owner_id,
+            )
 
-        # Step 3: Parse Trees to find Metadata Blob Hashes
-        # Map tree_hash -> metadata_blob_hash
-        tree_to_meta_blob = {}
-        meta_blob_hashes = []
+        # Phase 2: Link nodes
+        for commit_hash, node in temp_nodes.items():
+            parent_commit_hash = records[commit_hash].first_parent
+            if parent_commit_hash and parent_commit_hash in temp_nodes:
+                parent_node = temp_nodes[parent_commit_hash]
+                node.parent = parent_node
+                parent_node.children.append(node)
+                node.input_tree = parent_node.output_tree
+            else:
+                node.input_tree = EMPTY_TREE_HASH
+
+        # Sort children by timestamp
+        for node in temp_nodes.values():
+            node.children.sort(key=lambda n: n.timestamp)
+
+        return list(temp_nodes.values())
+
+    def load_compact_graph(self) -> CompactGraph:
+        # 直接由节点表构建，不经过 QuipuNode
+        records = self._load_records()
+        rows = []
+        for record in records.values():
+            if not record.valid:
+                continue
+            parent = record.first_parent
+            rows.append(
+                NodeRow(
+                    commit_hash=record.commit,
+                    parent_hash=parent if parent in records and records[parent].valid else None,
+                    output_tree=record.output_tree,
+                    timestamp=record.timestamp,
+                    node_type=record.node_type,
+                    summary=record.summary,
+                    owner_id=record.owner_id,
+                )
+            )
+        return CompactGraph.build(rows)
+
+    def _reachable_records(self, records: Dict[str, NodeRecord], heads: Set[str]) -> Dict[str, NodeRecord]:
+        reachable: Dict[str, NodeRecord] = {}
+        stack = [h for h in heads if h in records]
+        while stack:
+            commit_hash = stack.pop()
+            if commit_hash in reachable:
+                continue
+            record = records[commit_hash]
+            reachable[commit_hash] = record
+            stack.extend(p for p in record.parents.split() if p in records and p not in reachable)
+        return reachable
+
+    def _parse_log_entries(self, log_entries: Iterable[Dict[str, str]]) -> List[NodeRecord]:
+        records: List[NodeRecord] = []
+        # 分批消费流式的 log，每批解析完即丢弃提交信息与对象内容，内存占用与历史规模无关
+        log_iter = iter(log_entries)
+        while True:
+            batch = list(islice(log_iter, self.LOG_BATCH_SIZE))
+            if not batch:
+                return records
+            records.extend(self._parse_log_batch(batch))
+
+    def _parse_log_batch(self, log_entries: List[Dict[str, str]]) -> List[NodeRecord]:
+        parsed: Dict[str, NodeRecord] = {}
+        legacy_entries = []
+        for entry in log_entries:
+            meta = self._parse_trailer_meta(entry["body"])
+            if meta is None:
+                legacy_entries.append(entry)
+                continue
+            parsed[entry["hash"]] = NodeRecord(
+                commit=entry["hash"],
+                parents=entry["parent"],
+                output_tree=meta["output_tree"],
+                node_type=meta["type"],
+                summary=meta["summary"],
+                timestamp=meta["start"],
+                owner_id=meta["owner"],
+            )
+
+        if legacy_entries:
+            for record in self._parse_legacy_batch(legacy_entries):
+                parsed[record.commit] = record
+        return [parsed[entry["hash"]] for entry in log_entries]
 
-        for tree_hash, content_bytes in trees_content.items():
+    def _parse_legacy_batch(self, log_entries: List[Dict[str, str]]) -> List[NodeRecord]:
+        # Stream Trees and parse Metadata Blob Hashes on the fly
+        # Map tree_hash -> metadata_blob_hash; Tree 内容在解析后即被丢弃
+        tree_hashes = [entry["tree"] for entry in log_entries]
+        tree_to_meta_blob: Dict[str, str] = {}
+
+        for tree_hash, _, _, content_view in self.git_db.iter_cat_file(tree_hashes):
             try:
                 # 使用二进制解析器
-                entries = self._parse_tree_binary(content_bytes)
+                entries = self._parse_tree_binary(bytes(content_view))
                 if "metadata.json" in entries:
-                    blob_hash = entries["metadata.json"]
-                    tree_to_meta_blob[tree_hash] = blob_hash
-                    meta_blob_hashes.append(blob_hash)
+                    tree_to_meta_blob[tree_hash] = entries["metadata.json"]
             except Exception as e:
                 logger.warning(f"Error parsing tree {tree_hash}: {e}")
 
-        # Step 4: Batch fetch Metadata Blobs
-        metas_content = self.git_db.batch_cat_file(meta_blob_hashes)
-
-        # Step 5: Assemble Nodes
-        temp_nodes: Dict[str, QuipuNode] = {}
-        parent_map: Dict[str, str] = {}
+        # Stream Metadata Blobs, keeping only the fields needed by QuipuNode
+        metas_content: Dict[str, Dict[str, Any]] = {}
+        for blob_hash, _, _, content_view in self.git_db.iter_cat_file(list(tree_to_meta_blob.values())):
+            try:
+                meta_data = json.loads(bytes(content_view))
+                metas_content[blob_hash] = {
+                    "type": meta_data.get("type", "unknown"),
+                    "summary": meta_data.get("summary", "No summary available"),
+                    "start": meta_data.get("exec", {}).get("start"),
+                }
+            except Exception as e:
+                logger.warning(f"Error parsing metadata blob {blob_hash}: {e}")
 
+        records: List[NodeRecord] = []
         for entry in log_entries:
             commit_hash = entry["hash"]
             tree_hash = entry["tree"]
-
-            # Skip if already processed (though log entries shouldn't duplicate commits usually)
-            if commit_hash in temp_nodes:
-                continue
+            # 无效提交也记录下来 (output_tree 为 None)，保持父链完整
+            invalid = NodeRecord(commit_hash, entry["parent"], None, None, None, float(entry["timestamp"]))
 
             try:
                 # Retrieve metadata content
                 if tree_hash not in tree_to_meta_blob:
                     logger.warning(f"Skipping commit {commit_hash[:7]}: metadata.json not found in tree.")
+                    records.append(invalid)
                     continue
 
                 meta_blob_hash = tree_to_meta_blob[tree_hash]
 
                 if meta_blob_hash not in metas_content:
                     logger.warning(f"Skipping commit {commit_hash[:7]}: metadata blob missing.")
+                    records.append(invalid)
                     continue
 
-                meta_bytes = metas_content[meta_blob_hash]
-                meta_data = json.loads(meta_bytes)
+                meta_data = metas_content[meta_blob_hash]
 
                 output_tree = self._parse_output_tree_from_body(entry["body"])
                 if not output_tree:
                     logger.warning(f"Skipping commit {commit_hash[:7]}: X-Quipu-Output-Tree trailer not found.")
+                    records.append(invalid)
                     continue
 
-                # Content is lazy loaded
-                content = ""
-
-                node = QuipuNode(
-                    commit_hash=commit_hash,
-                    # Placeholder, will be filled in the linking phase
-                    input_tree="",
-                    output_tree=output_tree,
-                    timestamp=datetime.fromtimestamp(
-                        float(meta_data.get("exec", {}).get("start") or entry["timestamp"])
-                    ),
-                    filename=Path(f".quipu/git_objects/{commit_hash}"),
-                    node_type=meta_data.get("type", "unknown"),
-                    content=content,
-                    summary=meta_data.get("summary", "No summary available"),
+                records.append(
+                    NodeRecord(
+                        commit=commit_hash,
+                        parents=entry["parent"],
+                        output_tree=output_tree,
+                        node_type=meta_data["type"],
+                        summary=meta_data["summary"],
+                        timestamp=float(meta_data["start"] or entry["timestamp"]),
+                    )
                 )
 
-                temp_nodes[commit_hash] = node
-                parent_hash = entry["parent"].split(" ")[0] if entry["parent"] else None
-                if parent_hash:
-                    parent_map[commit_hash] = parent_hash
-
             except Exception as e:
                 logger.error(f"Failed to load history node from commit {commit_hash[:7]}: {e}")
+                records.append(invalid)
+        return records
+
+    def _sync_output_tree_index(self, records: Iterable[NodeRecord], rebuild: bool = False):
+        # 同一个 output_tree 对应多个节点时，以最新的节点为准 (与 `git log --grep -n 1` 的语义一致)
+        latest: Dict[str, str] = {}
+        for record in sorted((r for r in records if r.valid), key=lambda r: r.timestamp):
+            latest[record.output_tree] = record.commit
+
+        index = self.git_db.output_tree_index
+        missing = None
+        if index.initialized and not rebuild:
+            try:
+                missing = index.missing(latest)
+            except (OSError, ValueError) as e:
+                logger.warning(f"output_tree 索引损坏，正在重建: {e}")
 
-        # Phase 2: Link nodes (Same as before)
-        for commit_hash, node in temp_nodes.items():
-            parent_commit_hash = parent_map.get(commit_hash)
-            if parent_commit_hash and parent_commit_hash in temp_nodes:
-                parent_node = temp_nodes[parent_commit_hash]
-                node.parent = parent_node
-                parent_node.children.append(node)
-                node.input_tree = parent_node.output_tree
-            else:
-                node.input_tree = EMPTY_TREE_HASH
-
-        # Sort children by timestamp
-        for node in temp_nodes.values():
-            node.children.sort(key=lambda n: n.timestamp)
-
-        return list(temp_nodes.values())
+        try:
+            if missing is None:
+                index.rebuild(latest.items())
+            elif missing:
+                index.record_many(missing)
+        except OSError as e:
+            logger.warning(f"无法更新 output_tree 索引: {e}")
 
     def get_node_count(self) -> int:
-        return len(self.load_all_nodes())
+        return len(self._snapshot().nodes)
 
     def get_node_position(self, output_tree_hash: str) -> int:
-        all_nodes = self.load_all_nodes()
-        # load_all_nodes 内部已经按时间倒序排序了
-        # 但为了保险，还是在这里再次确认排序逻辑
-        all_nodes.sort(key=lambda n: n.timestamp, reverse=True)
-
-        for i, node in enumerate(all_nodes):
-            if node.output_tree == output_tree_hash:
-                return i
-        return -1
+        return self._snapshot().positions.get(output_tree_hash, -1)
 
     def load_nodes_paginated(self, limit: int, offset: int) -> List[QuipuNode]:
-        all_nodes = self.load_all_nodes()
-        # load_all_nodes 通常按时间倒序返回
-        return all_nodes[offset : offset + limit]
+        # 快照中的节点已按时间倒序排列
+        return self._snapshot().nodes[offset : offset + limit]
+
+    def load_nodes_page(self, limit: int, after: Optional[str] = None, before: Optional[str] = None) -> List[QuipuNode]:
+        snapshot = self._snapshot()
+        cursor = before if before is not None else after
+        if cursor is None:
+            return snapshot.nodes[:limit]
+        row = snapshot.rows.get(cursor)
+        if row is None:
+            return []
+        if before is not None:
+            return snapshot.nodes[max(0, row - limit) : row]
+        return snapshot.nodes[row + 1 : row + 1 + limit]
 
     def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
-        all_nodes = self.load_all_nodes()
-        start_nodes = [n for n in all_nodes if n.output_tree == start_output_tree_hash]
-
         ancestors = set()
-        queue = list(start_nodes)
-
-        while queue:
-            current_node = queue.pop(0)
-            if current_node.parent:
-                p_hash = current_node.parent.output_tree
-                if p_hash not in ancestors:
-                    ancestors.add(p_hash)
-                    queue.append(current_node.parent)
-
+        with self._snapshot_lock:
+            snapshot = self._snapshot()
+            for start_node in snapshot.by_output_tree.get(start_output_tree_hash, []):
+                for commit_hash in self._reachability.ancestors(start_node.commit_hash):
+                    ancestors.add(snapshot.by_commit[commit_hash].output_tree)
         return ancestors
 
     def get_private_data(self, node_commit_hash: str) -> Optional[str]:
         return None
 
-    def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
-        all_nodes = self.load_all_nodes()
-        start_nodes = [n for n in all_nodes if n.output_tree == start_output_tree_hash]
+    def get_private_data_many(self, node_commit_hashes: List[str]) -> Dict[str, str]:
+        return {}
 
+    def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
         descendants = set()
-        queue = list(start_nodes)
-
-        while queue:
-            current_node = queue.pop(0)
-            for child in current_node.children:
-                c_hash = child.output_tree
-                if c_hash not in descendants:
-                    descendants.add(c_hash)
-                    queue.append(child)
-
+        with self._snapshot_lock:
+            snapshot = self._snapshot()
+            for start_node in snapshot.by_output_tree.get(start_output_tree_hash, []):
+                for commit_hash in self._reachability.descendants(start_node.commit_hash):
+                    descendants.add(snapshot.by_commit[commit_hash].output_tree)
         return descendants
 
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         try:
-            # 1. Get Tree Hash from Commit
-            commit_content = self.git_db.cat_file(commit_hash, "commit").decode("utf-8", "ignore")
-            tree_line = commit_content.split("\n", 1)[0]
-            if not tree_line.startswith("tree "):
-                raise ValueError("Invalid commit object format")
-            tree_hash = tree_line.split()[1]
-
-            # 2. 解析 Tree 并批量获取所有 blobs
-            # We need to map blob hashes back to filenames.
-            tree_content_bytes = self.git_db.cat_file(tree_hash, "tree")
-            entries = self._parse_tree_binary(tree_content_bytes)
-
-            blob_hashes = list(entries.values())
-            blob_contents = self.git_db.batch_cat_file(blob_hashes)
-
-            # Reconstruct the {filename: content} map
-            result = {}
-            for filename, blob_hash in entries.items():
-                if blob_hash in blob_contents:
-                    result[filename] = blob_contents[blob_hash]
-            return result
-
+            # "<commit>^{tree}" 由 cat-file 协进程直接解引用，无需先读取 Commit 对象
+            return self.git_db.get_blobs_from_tree(f"{commit_hash}^{{tree}}")
         except Exception as e:
             logger.error(f"Failed to load blobs for commit {commit_hash[:7]}: {e}")
             return {}
@@ -253,32 +450,12 @@ class GitObjectHistoryReader:
             return node.content
 
         try:
-            commit_hash = node.commit_hash
-
-            # 1. Get Tree Hash from Commit
-            commit_bytes = self.git_db.cat_file(commit_hash, "commit")
-            # Parse "tree {hash}" from the first line
-            tree_line = commit_bytes.split(b"\n", 1)[0].decode("utf-8")
-            if not tree_line.startswith("tree "):
-                raise ValueError("Invalid commit object format")
-            tree_hash = tree_line.split()[1]
-
-            # 2. Get content.md Blob Hash from Tree
-            # Use batch_cat_file to get RAW binary tree content, compatible with _parse_tree_binary
-            tree_content_map = self.git_db.batch_cat_file([tree_hash])
-            if tree_hash not in tree_content_map:
-                return ""
-
-            tree_content = tree_content_map[tree_hash]
-            entries = self._parse_tree_binary(tree_content)
-
-            blob_hash = entries.get("content.md")
-
-            if not blob_hash:
+            # 使用 "<commit>:content.md" 表达式，一次协进程往返即可定位并读取 Blob
+            content_rev = f"{node.commit_hash}:content.md"
+            content_bytes = self.git_db.batch_cat_file([content_rev]).get(content_rev)
+            if content_bytes is None:
                 return ""  # No content found
 
-            # 3. Read Blob (also raw binary)
-            content_bytes = self.git_db.cat_file(blob_hash, "blob")
             content = content_bytes.decode("utf-8", errors="ignore")
 
             # Cache it
@@ -289,14 +466,37 @@ class GitObjectHistoryReader:
             logger.error(f"Failed to lazy load content for node {node.short_hash}: {e}")
             return ""
 
+    def get_node_contents(self, nodes: List[QuipuNode]) -> Dict[str, str]:
+        contents = {node.commit_hash: node.content for node in nodes if node.content}
+        pending = [node for node in nodes if node.commit_hash not in contents]
+        if not pending:
+            return contents
+
+        # 所有 "<commit>:content.md" 表达式在同一次 cat-file 批量往返中解析并读取
+        content_revs = [f"{node.commit_hash}:content.md" for node in pending]
+        try:
+            blobs = self.git_db.batch_cat_file(content_revs)
+        except Exception as e:
+            logger.error(f"Failed to batch load content for {len(pending)} nodes: {e}")
+            blobs = {}
+
+        for node, content_rev in zip(pending, content_revs):
+            content_bytes = blobs.get(content_rev)
+            content = content_bytes.decode("utf-8", errors="ignore") if content_bytes is not None else ""
+            if content:
+                node.content = content
+            contents[node.commit_hash] = content
+        return contents
+
     def find_nodes(
         self,
         summary_regex: Optional[str] = None,
         node_type: Optional[str] = None,
         limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]:
-        # 这是一个高成本操作，因为它需要加载整个图
-        candidates = self.load_all_nodes()
+        # 在整个图的快照上过滤；快照已按时间倒序排列
+        candidates = self._snapshot().nodes
 
         if summary_regex:
             try:
@@ -309,15 +509,64 @@ class GitObjectHistoryReader:
         if node_type:
             candidates = [node for node in candidates if node.node_type == node_type]
 
-        # 按时间戳降序排序
-        candidates.sort(key=lambda n: n.timestamp, reverse=True)
+        if content_query:
+            # 内容按需批量加载 (并缓存在快照的节点上)，每个词都须出现在摘要或内容中，按出现次数排序
+            terms = [term.lower() for term in content_query.split()]
+            self.get_node_contents(candidates)
+            scored = []
+            for node in candidates:
+                text = f"{node.summary}\n{node.content}".lower()
+                counts = [text.count(term) for term in terms]
+                if all(counts):
+                    scored.append((sum(counts), node))
+            # 稳定排序：相关度相同的节点保持时间倒序
+            scored.sort(key=lambda item: item[0], reverse=True)
+            candidates = [node for _, node in scored]
 
         return candidates[:limit]
 
 
 class GitObjectHistoryWriter:
-    def __init__(self, git_db: GitDB):
+    # 1.1 起，读取历史所需的元数据同时以 trailer 形式写入提交信息
+    META_VERSION = "1.1"
+
+    def __init__(self, git_db: GitDB, batched: bool = False, compact_heads: bool = False):
         self.git_db = git_db
+        self.batched = batched
+        # 写入新节点后移除父节点的 head 引用，使 refs/quipu/local/heads 只保留分支末端
+        self.compact_heads = compact_heads
+        # 未显式提供父节点时，按 input_tree 反查父节点的方式。SQLite 后端会将其替换为基于索引的查询。
+        self.parent_resolver: Callable[[str], Optional[str]] = git_db.get_commit_by_output_tree
+
+    def _plumbing(self):
+        # 批量模式下，对象写入与引用更新都经由可跨节点复用的写会话，不再为每个节点启动多个 git 进程
+        if self.batched:
+            session = self.git_db.write_session()
+            if session is not None:
+                return session
+        return self.git_db
+
+    def _build_commit_message(
+        self,
+        summary: str,
+        output_tree: str,
+        node_type: str,
+        start_time: float,
+        generator_id: str,
+        owner_id: Optional[str],
+    ) -> str:
+        trailers = [
+            ("Output-Tree", output_tree),
+            ("Meta-Version", self.META_VERSION),
+            ("Type", node_type),
+            ("Start", repr(float(start_time))),
+            ("Generator", generator_id),
+        ]
+        if owner_id:
+            trailers.append(("Owner", owner_id))
+        # trailer 的值必须是单行的，否则会破坏末尾的 trailer 块
+        block = "\n".join(f"X-Quipu-{key}: {' '.join(str(value).split())}" for key, value in trailers)
+        return f"{summary}\n\n{block}"
 
     def _get_generator_info(self) -> Dict[str, str]:
         return {
@@ -390,12 +639,13 @@ class GitObjectHistoryWriter:
         duration_ms = int((end_time - start_time) * 1000)
 
         summary = self._generate_summary(node_type, content, input_tree, output_tree, **kwargs)
+        generator = self._get_generator_info()
 
         metadata = {
-            "meta_version": "1.0",
+            "meta_version": self.META_VERSION,
             "summary": summary,
             "type": node_type,
-            "generator": self._get_generator_info(),
+            "generator": generator,
             "env": self._get_env_info(),
             "exec": {"start": start_time, "duration_ms": duration_ms},
         }
@@ -403,8 +653,9 @@ class GitObjectHistoryWriter:
         meta_json_bytes = json.dumps(metadata, sort_keys=False, ensure_ascii=False).encode("utf-8")
         content_md_bytes = content.encode("utf-8")
 
-        meta_blob_hash = self.git_db.hash_object(meta_json_bytes)
-        content_blob_hash = self.git_db.hash_object(content_md_bytes)
+        plumbing = self._plumbing()
+        meta_blob_hash = plumbing.hash_object(meta_json_bytes)
+        content_blob_hash = plumbing.hash_object(content_md_bytes)
 
         # 使用 100444 权限 (只读文件)
         # 关键修复：建立强引用！将 output_tree 作为名为 'snapshot' 的子目录挂载。
@@ -414,13 +665,13 @@ class GitObjectHistoryWriter:
             f"100444 blob {content_blob_hash}\tcontent.md\n"
             f"040000 tree {output_tree}\tsnapshot"
         )
-        tree_hash = self.git_db.mktree(tree_descriptor)
+        tree_hash = plumbing.mktree(tree_descriptor)
 
         # 1. 确定父节点 (Topological Parent)
         # 优先使用 Engine 提供的确切父节点，仅在未提供时回退到 Tree 反查
         parent_commit = kwargs.get("parent_commit_hash")
         if not parent_commit:
-            parent_commit = self.git_db.get_commit_by_output_tree(input_tree)
+            parent_commit = self.parent_resolver(input_tree)
 
         parents = [parent_commit] if parent_commit else None
 
@@ -430,13 +681,24 @@ class GitObjectHistoryWriter:
             )
 
         # 2. 创建 Commit
-        commit_message = f"{summary}\n\nX-Quipu-Output-Tree: {output_tree}"
-        new_commit_hash = self.git_db.commit_tree(tree_hash=tree_hash, parent_hashes=parents, message=commit_message)
+        commit_message = self._build_commit_message(
+            summary, output_tree, node_type, start_time, generator["id"], kwargs.get("owner_id")
+        )
+        new_commit_hash = plumbing.commit_tree(tree_hash=tree_hash, parent_hashes=parents, message=commit_message)
 
         # 3. 引用管理 (QDPS v1.1 - Local Heads Namespace)
         # 在本地工作区命名空间中为新的 commit 创建一个持久化的 head 引用。
-        # 这是 push 操作的唯一来源，并且支持多分支图谱，因此不再删除父节点的 head。
-        self.git_db.update_ref(f"refs/quipu/local/heads/{new_commit_hash}", new_commit_hash)
+        # 这是 push 操作的唯一来源，并且支持多分支图谱。
+        plumbing.update_ref(f"refs/quipu/local/heads/{new_commit_hash}", new_commit_hash)
+        if self.compact_heads:
+            # 父节点已可从新 head 到达，其 head 引用是冗余的；其他分支的 head 不受影响
+            if parent_commit:
+                plumbing.delete_ref(f"refs/quipu/local/heads/{parent_commit}")
+            self.git_db.pack_refs_if_needed()
+        try:
+            self.git_db.output_tree_index.record(output_tree, new_commit_hash)
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法更新 output_tree 索引: {e}")
 
         logger.info(f"✅ History node created as commit {new_commit_hash[:7]}")
 
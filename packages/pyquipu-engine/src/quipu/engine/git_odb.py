@@ -0,0 +1,301 @@
+import logging
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (object_type, content)
+RawObject = Tuple[str, bytes]
+
+_TYPE_NAMES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+_OFS_DELTA = 6
+_REF_DELTA = 7
+_IDX_V2_MAGIC = b"\xfftOc"
+_SHA_LEN = 20
+
+
+def _read_delta_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    src_size, pos = _read_delta_varint(delta, 0)
+    target_size, pos = _read_delta_varint(delta, pos)
+    if src_size != len(base):
+        raise ValueError(f"Delta base size mismatch: expected {src_size}, got {len(base)}")
+
+    out = bytearray()
+    end = len(delta)
+    while pos < end:
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            # copy 指令: 按位标志决定哪些 offset/size 字节存在
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset : offset + (size or 0x10000)]
+        elif opcode:
+            # insert 指令: 直接追加接下来的 opcode 个字节
+            out += delta[pos : pos + opcode]
+            pos += opcode
+        else:
+            raise ValueError("Reserved delta opcode 0")
+
+    if len(out) != target_size:
+        raise ValueError(f"Delta result size mismatch: expected {target_size}, got {len(out)}")
+    return bytes(out)
+
+
+class PackFile:
+    def __init__(self, idx_path: Path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path.with_suffix(".pack")
+        self._idx = self._map(idx_path)
+        try:
+            self._pack = self._map(self.pack_path)
+        except Exception:
+            self._idx.close()
+            raise
+
+        if self._idx[:4] != _IDX_V2_MAGIC or struct.unpack_from(">I", self._idx, 4)[0] != 2:
+            self.close()
+            raise ValueError(f"Unsupported pack index version: {idx_path.name}")
+        if self._pack[:4] != b"PACK":
+            self.close()
+            raise ValueError(f"Invalid pack file: {self.pack_path.name}")
+
+        self._fanout = struct.unpack_from(">256I", self._idx, 8)
+        self.count = self._fanout[255]
+        self._sha_table = 8 + 256 * 4
+        self._offset_table = self._sha_table + (_SHA_LEN + 4) * self.count  # 跳过 sha 表与 crc32 表
+        self._large_offset_table = self._offset_table + 4 * self.count
+
+    @staticmethod
+    def _map(path: Path) -> mmap.mmap:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for mapped in (getattr(self, "_idx", None), getattr(self, "_pack", None)):
+            if mapped is not None and not mapped.closed:
+                mapped.close()
+
+    def find_offset(self, sha: bytes) -> Optional[int]:
+        first = sha[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self._sha_table + _SHA_LEN * mid
+            current = self._idx[pos : pos + _SHA_LEN]
+            if current < sha:
+                lo = mid + 1
+            elif current > sha:
+                hi = mid
+            else:
+                return self._offset_at(mid)
+        return None
+
+    def _offset_at(self, index: int) -> int:
+        (offset,) = struct.unpack_from(">I", self._idx, self._offset_table + 4 * index)
+        if offset & 0x80000000:
+            (offset,) = struct.unpack_from(">Q", self._idx, self._large_offset_table + 8 * (offset & 0x7FFFFFFF))
+        return offset
+
+    def read_header(self, offset: int) -> Tuple[int, int, int, Optional[object]]:
+        pack = self._pack
+        byte = pack[offset]
+        type_num = (byte >> 4) & 0x07
+        size = byte & 0x0F
+        shift = 4
+        pos = offset + 1
+        while byte & 0x80:
+            byte = pack[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+
+        base: Optional[object] = None
+        if type_num == _OFS_DELTA:
+            byte = pack[pos]
+            pos += 1
+            distance = byte & 0x7F
+            while byte & 0x80:
+                byte = pack[pos]
+                pos += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+            base = offset - distance
+        elif type_num == _REF_DELTA:
+            base = pack[pos : pos + _SHA_LEN]
+            pos += _SHA_LEN
+
+        return type_num, size, pos, base
+
+    def inflate(self, pos: int, size: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        chunks: List[bytes] = []
+        # 压缩后的长度未知：先按解压后大小 (加少量余量) 读取，不足再继续追加
+        step = size + 64
+        end = len(self._pack)
+        while not decompressor.eof:
+            if pos >= end:
+                raise ValueError("Unexpected end of pack data")
+            chunks.append(decompressor.decompress(self._pack[pos : pos + step]))
+            pos += step
+            step = 64 * 1024
+        data = b"".join(chunks)
+        if len(data) != size:
+            raise ValueError(f"Inflated size mismatch: expected {size}, got {len(data)}")
+        return data
+
+
+class ObjectStore:
+    # 最长 delta 链。git 默认 --depth=50，aggressive gc 时可达 4095
+    MAX_DELTA_CHAIN = 4096
+    # delta 基对象缓存的字节上限
+    BASE_CACHE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, objects_dir: Path):
+        self.objects_dir = objects_dir
+        self.pack_dir = objects_dir / "pack"
+        self._packs: Dict[Path, PackFile] = {}
+        self._pack_dir_mtime: Optional[int] = None
+        self._lock = threading.RLock()
+        self._base_cache: "OrderedDict[Tuple[Path, int], Tuple[int, bytes]]" = OrderedDict()
+        self._base_cache_bytes = 0
+
+    def close(self):
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs = {}
+            self._pack_dir_mtime = None
+            self._base_cache.clear()
+            self._base_cache_bytes = 0
+
+    def read(self, object_hash: str) -> Optional[RawObject]:
+        if len(object_hash) != 2 * _SHA_LEN:
+            return None
+
+        loose = self._read_loose(object_hash)
+        if loose is not None:
+            return loose
+
+        sha = bytes.fromhex(object_hash)
+        with self._lock:
+            found = self._read_packed(sha)
+            # 未命中时检查是否有新的 pack (例如 fetch 或 gc 之后)
+            if found is None and self._refresh_packs():
+                found = self._read_packed(sha)
+        if found is None:
+            return None
+        type_num, data = found
+        return _TYPE_NAMES[type_num], data
+
+    def _read_loose(self, object_hash: str) -> Optional[RawObject]:
+        path = self.objects_dir / object_hash[:2] / object_hash[2:]
+        try:
+            raw = zlib.decompress(path.read_bytes())
+        except FileNotFoundError:
+            return None
+
+        header_end = raw.index(b"\0")
+        type_name, size = raw[:header_end].split(b" ")
+        data = raw[header_end + 1 :]
+        if len(data) != int(size):
+            raise ValueError(f"Loose object {object_hash} has inconsistent size")
+        return type_name.decode("ascii"), data
+
+    def _refresh_packs(self) -> bool:
+        try:
+            mtime = self.pack_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._pack_dir_mtime:
+            return False
+        self._pack_dir_mtime = mtime
+
+        current = set(self.pack_dir.glob("pack-*.idx"))
+        for stale in set(self._packs) - current:
+            self._packs.pop(stale).close()
+        for idx_path in current - set(self._packs):
+            try:
+                self._packs[idx_path] = PackFile(idx_path)
+            except (OSError, ValueError) as e:
+                logger.debug(f"跳过无法读取的 pack {idx_path.name}: {e}")
+        return True
+
+    def _read_packed(self, sha: bytes) -> Optional[Tuple[int, bytes]]:
+        if self._pack_dir_mtime is None:
+            self._refresh_packs()
+        for pack in self._packs.values():
+            offset = pack.find_offset(sha)
+            if offset is not None:
+                return self._resolve(pack, offset)
+        return None
+
+    def _resolve(self, pack: PackFile, offset: int) -> Tuple[int, bytes]:
+        # 沿 delta 链向下走到基对象 (或缓存命中)，再按相反顺序逐层应用 delta
+        chain: List[Tuple[int, int]] = []
+        current_pack, current_offset = pack, offset
+        while True:
+            cached = self._base_cache.get((current_pack.pack_path, current_offset))
+            if cached is not None:
+                self._base_cache.move_to_end((current_pack.pack_path, current_offset))
+                base_type, data = cached
+                break
+
+            type_num, size, data_pos, base = current_pack.read_header(current_offset)
+            if type_num in _TYPE_NAMES:
+                base_type, data = type_num, current_pack.inflate(data_pos, size)
+                break
+            if len(chain) >= self.MAX_DELTA_CHAIN:
+                raise ValueError("Delta chain too long")
+
+            if type_num == _OFS_DELTA:
+                chain.append((current_offset, size))
+                current_offset = base  # type: ignore[assignment]
+            elif type_num == _REF_DELTA:
+                chain.append((current_offset, size))
+                base_obj = self.read(bytes(base).hex())  # type: ignore[arg-type]
+                if base_obj is None:
+                    raise ValueError(f"Missing REF_DELTA base {bytes(base).hex()}")  # type: ignore[arg-type]
+                base_type = next(num for num, name in _TYPE_NAMES.items() if name == base_obj[0])
+                data = base_obj[1]
+                break
+            else:
+                raise ValueError(f"Unsupported pack object type {type_num}")
+
+        for delta_offset, delta_size in reversed(chain):
+            _, _, delta_pos, _ = pack.read_header(delta_offset)
+            data = apply_delta(data, pack.inflate(delta_pos, delta_size))
+            self._remember_base(pack.pack_path, delta_offset, base_type, data)
+        return base_type, data
+
+    def _remember_base(self, pack_path: Path, offset: int, type_num: int, data: bytes):
+        if len(data) > self.BASE_CACHE_BYTES // 4:
+            return
+        self._base_cache[(pack_path, offset)] = (type_num, data)
+        self._base_cache_bytes += len(data)
+        while self._base_cache_bytes > self.BASE_CACHE_BYTES:
+            _, (_, evicted) = self._base_cache.popitem(last=False)
+            self._base_cache_bytes -= len(evicted)
@@ -0,0 +1,59 @@
+import logging
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# update-ref 中表示“引用必须不存在”的旧值
+ZERO_HASH = "0" * 40
+
+
+class RefTransaction:
+    def __init__(self, root: Path):
+        self.root = root
+        self._commands: List[str] = []
+        self.committed = False
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def __enter__(self) -> "RefTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 仅在上下文正常结束时提交；异常时丢弃所有排队的操作
+        if exc_type is None:
+            self.commit()
+
+    def create(self, ref_name: str, new_hash: str):
+        self._commands.append(f"create {ref_name} {new_hash}")
+
+    def update(self, ref_name: str, new_hash: str, old_hash: Optional[str] = None):
+        self._commands.append(f"update {ref_name} {new_hash}" + (f" {old_hash}" if old_hash else ""))
+
+    def delete(self, ref_name: str, old_hash: Optional[str] = None):
+        self._commands.append(f"delete {ref_name}" + (f" {old_hash}" if old_hash else ""))
+
+    def commit(self) -> int:
+        if self.committed:
+            raise RuntimeError("Ref transaction has already been committed")
+        self.committed = True
+        if not self._commands:
+            return 0
+
+        # 所有操作在同一个 update-ref 进程中原子地完成：要么全部生效，要么全部不生效
+        payload = "".join(f"{command}\n" for command in self._commands)
+        result = subprocess.run(
+            ["git", "update-ref", "--stdin"],
+            cwd=self.root,
+            input=payload,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            logger.error(f"Git plumbing error: {result.stderr}")
+            raise RuntimeError(f"Git command failed: update-ref --stdin ({len(self._commands)} ops)\n{result.stderr}")
+
+        logger.debug(f"引用事务已提交: {len(self._commands)} 个操作")
+        return len(self._commands)
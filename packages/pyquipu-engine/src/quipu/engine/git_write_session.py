@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _tree_sort_key(entry: Tuple[str, str, str]) -> bytes:
+    # git 对 Tree 条目的排序规则：目录按 "name/" 参与比较
+    mode, name, _ = entry
+    encoded = name.encode("utf-8")
+    return encoded + b"/" if mode.lstrip("0") == "40000" else encoded
+
+
+class WriteSession:
+    def __init__(self, root: Path, objects_dir: Path):
+        self.root = root
+        self.objects_dir = objects_dir
+        self._lock = threading.Lock()
+        self._ref_proc: Optional[subprocess.Popen] = None
+        self._idents: Optional[Tuple[str, str]] = None
+
+    def close(self):
+        with self._lock:
+            proc, self._ref_proc = self._ref_proc, None
+            if proc is None:
+                return
+            for stream in (proc.stdin, proc.stdout, proc.stderr):
+                if stream:
+                    try:
+                        stream.close()
+                    except OSError:
+                        pass
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    # --- 对象写入 (进程内完成，与 git 写出的 loose 对象完全相同) ---
+
+    def _write_object(self, object_type: str, content: bytes) -> str:
+        header = f"{object_type} {len(content)}\0".encode("ascii")
+        sha = hashlib.sha1(header)
+        sha.update(content)
+        object_hash = sha.hexdigest()
+
+        path = self.objects_dir / object_hash[:2] / object_hash[2:]
+        if path.exists():
+            return object_hash
+
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix="tmp_obj_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                compressor = zlib.compressobj()
+                f.write(compressor.compress(header))
+                f.write(compressor.compress(content))
+                f.write(compressor.flush())
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            # 并发写入同一个对象时，另一方可能已经完成了写入
+            if not path.exists():
+                raise
+        return object_hash
+
+    def hash_object(self, content_bytes: bytes, object_type: str = "blob") -> str:
+        return self._write_object(object_type, content_bytes)
+
+    def mktree(self, tree_descriptor: str) -> str:
+        entries = []
+        for line in tree_descriptor.splitlines():
+            if not line.strip():
+                continue
+            meta, name = line.split("\t", 1)
+            mode, _, object_hash = meta.split(" ")
+            entries.append((mode, name, object_hash))
+
+        body = b"".join(
+            f"{mode.lstrip('0')} {name}".encode("utf-8") + b"\0" + bytes.fromhex(object_hash)
+            for mode, name, object_hash in sorted(entries, key=_tree_sort_key)
+        )
+        return self._write_object("tree", body)
+
+    def _resolve_idents(self) -> Tuple[str, str]:
+        if self._idents is None:
+            idents = []
+            for var in ("GIT_AUTHOR_IDENT", "GIT_COMMITTER_IDENT"):
+                result = subprocess.run(["git", "var", var], cwd=self.root, capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise RuntimeError(f"Git command failed: var {var}\n{result.stderr}")
+                idents.append(result.stdout.strip())
+            self._idents = (idents[0], idents[1])
+        return self._idents
+
+    @staticmethod
+    def _stamp(ident: str, date_env: str) -> str:
+        # 显式指定的日期 (例如测试中的 GIT_*_DATE) 沿用 git var 的解析结果，否则使用当前时间
+        if os.environ.get(date_env):
+            return ident
+        name_email = ident.rsplit(" ", 2)[0]
+        now = time.time()
+        offset = time.localtime(now).tm_gmtoff // 60
+        sign = "+" if offset >= 0 else "-"
+        return f"{name_email} {int(now)} {sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}"
+
+    def commit_tree(self, tree_hash: str, parent_hashes: Optional[List[str]], message: str) -> str:
+        author, committer = self._resolve_idents()
+        lines = [f"tree {tree_hash}"]
+        lines.extend(f"parent {p}" for p in parent_hashes or [])
+        lines.append(f"author {self._stamp(author, 'GIT_AUTHOR_DATE')}")
+        lines.append(f"committer {self._stamp(committer, 'GIT_COMMITTER_DATE')}")
+        body = "\n".join(lines) + "\n\n" + message
+        return self._write_object("commit", body.encode("utf-8"))
+
+    # --- 引用更新 (通过一个长驻的 update-ref --stdin 事务会话) ---
+
+    def _ensure_ref_proc(self) -> subprocess.Popen:
+        if self._ref_proc is not None and self._ref_proc.poll() is None:
+            return self._ref_proc
+        self._ref_proc = subprocess.Popen(
+            ["git", "update-ref", "--stdin"],
+            cwd=self.root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        logger.debug(f"已启动 git update-ref --stdin 会话 (pid={self._ref_proc.pid})")
+        return self._ref_proc
+
+    def _transact(self, command: str):
+        with self._lock:
+            proc = self._ensure_ref_proc()
+            assert proc.stdin is not None and proc.stdout is not None and proc.stderr is not None
+            try:
+                proc.stdin.write(f"start\n{command}\ncommit\n".encode("utf-8"))
+                proc.stdin.flush()
+                replies = [proc.stdout.readline(), proc.stdout.readline()]
+            except OSError as e:
+                replies = [str(e).encode("utf-8")]
+
+            if replies != [b"start: ok\n", b"commit: ok\n"]:
+                # 事务失败时 update-ref 会退出，stderr 中包含原因
+                self._ref_proc = None
+                proc.kill()
+                stderr_str = proc.stderr.read().decode("utf-8", "ignore")
+                proc.wait()
+                logger.error(f"Git plumbing error: {stderr_str}")
+                raise RuntimeError(f"Git command failed: update-ref {command}\n{stderr_str}")
+
+    def update_ref(self, ref_name: str, commit_hash: str):
+        self._transact(f"update {ref_name} {commit_hash}")
+
+    def delete_ref(self, ref_name: str):
+        self._transact(f"delete {ref_name}")
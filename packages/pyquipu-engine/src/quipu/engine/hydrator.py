@@ -1,7 +1,10 @@
 import json
 import logging
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from needle.pointer import L
+from quipu.common.bus import bus
 
 from .git_db import GitDB
 from .git_object_storage import GitObjectHistoryReader  # Reuse parsing logic
@@ -11,6 +14,9 @@ logger = logging.getLogger(__name__)
 
 
 class Hydrator:
+    # 每个事务写入的节点数；分块之间释放对象内容，已提交的分块即是补水的断点
+    CHUNK_SIZE = 2000
+
     def __init__(self, git_db: GitDB, db_manager: DatabaseManager):
         self.git_db = git_db
         self.db_manager = db_manager
@@ -25,9 +31,15 @@ class Hydrator:
             return local_user_id
         return None
 
-    def _get_commit_owners(self, local_user_id: str) -> Dict[str, str]:
+    def _get_commit_owners(
+        self,
+        local_user_id: str,
+        parent_map: Optional[Dict[str, str]] = None,
+        head_ref_tuples: Optional[List[Tuple[str, str]]] = None,
+    ) -> Dict[str, str]:
         # 1. 获取所有分支末端 (heads) 及其直接所有者
-        head_ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
+        if head_ref_tuples is None:
+            head_ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
         head_owners: Dict[str, str] = {}
         for commit_hash, ref_name in head_ref_tuples:
             # 优先级：远程所有者 > 本地所有者。避免本地 ref 覆盖正确的远程所有者。
@@ -41,9 +53,9 @@ class Hydrator:
         if not head_owners:
             return {}
 
-        # 2. 获取完整的历史图谱日志
-        all_git_logs = self.git_db.log_ref(list(head_owners.keys()))
-        log_map = {entry["hash"]: entry for entry in all_git_logs}
+        # 2. 获取完整的历史图谱 (只保留父提交，流式读取时即丢弃提交信息)
+        if parent_map is None:
+            parent_map = {entry["hash"]: entry["parent"] for entry in self.git_db.iter_log(head_owners.keys())}
 
         # 3. 从 Heads 开始，通过图遍历传播所有权
         final_commit_owners: Dict[str, str] = {}
@@ -58,10 +70,10 @@ class Hydrator:
         while queue:
             child_hash = queue.pop(0)
             owner = final_commit_owners.get(child_hash)
-            if not owner or child_hash not in log_map:
+            if not owner or child_hash not in parent_map:
                 continue
 
-            parent_hashes = log_map[child_hash]["parent"].split()
+            parent_hashes = parent_map[child_hash].split()
             for parent_hash in parent_hashes:
                 if parent_hash and parent_hash not in visited:
                     final_commit_owners[parent_hash] = owner
@@ -70,25 +82,79 @@ class Hydrator:
 
         return final_commit_owners
 
+    def _meta_json_from_trailers(self, meta: Dict[str, Any]) -> str:
+        # 由 trailer 重建 meta_json 列，省去读取 metadata.json blob 的往返
+        return json.dumps(
+            {
+                "meta_version": meta["meta_version"],
+                "summary": meta["summary"],
+                "type": meta["type"],
+                "generator": {"id": meta["generator"]},
+                "exec": {"start": meta["start"]},
+            },
+            ensure_ascii=False,
+        )
+
+    def _read_log(self, revisions: List[str]) -> Dict[str, Dict[str, Any]]:
+        # 流式读取历史，每条记录只保留补水所需的字段，提交信息在解析出 trailer 后即丢弃
+        log_map: Dict[str, Dict[str, Any]] = {}
+        for entry in self.git_db.iter_log(revisions):
+            meta = self._parser._parse_trailer_meta(entry["body"])
+            log_map[entry["hash"]] = {
+                "parent": entry["parent"],
+                "tree": entry["tree"],
+                "timestamp": entry["timestamp"],
+                "output_tree": meta["output_tree"]
+                if meta
+                else self._parser._parse_output_tree_from_body(entry["body"]),
+                # meta_version 1.1 起元数据直接来自 trailer；旧节点为 None，需要读取 metadata.json
+                "meta": meta,
+            }
+        return log_map
+
     def sync(self, local_user_id: str):
         # --- 阶段 1: 发现 ---
-        all_ref_heads = [t[0] for t in self.git_db.get_all_ref_heads("refs/quipu/")]
-        if not all_ref_heads:
-            logger.debug("✅ Git 中未发现 Quipu 引用，无需补水。")
+        ref_tuples = self.git_db.get_all_ref_heads("refs/quipu/")
+        current_refs = {ref_name: commit_hash for commit_hash, ref_name in ref_tuples}
+        watermark = self.db_manager.get_hydration_refs()
+        if current_refs == watermark:
+            logger.debug("✅ Quipu 引用自上次补水后未变化，无需补水。")
             return
 
-        all_git_logs = self.git_db.log_ref(all_ref_heads)
-        if not all_git_logs:
-            logger.debug("✅ Git 中未发现 Quipu 历史，无需补水。")
-            return
-        log_map = {entry["hash"]: entry for entry in all_git_logs}
+        # 1.1 只遍历上次补水之后新出现的提交：水位中记录的 head 及其祖先均已处理过。
+        # 无法确定所有者的 ref 不作为排除条件，其提交在出现可识别的 ref 后仍会被补水。
+        heads = sorted(set(current_refs.values()))
+        known_heads = sorted(
+            {c for ref_name, c in watermark.items() if self._get_owner_from_ref(ref_name, local_user_id)}
+        )
+        new_heads = [h for h in heads if h not in set(known_heads)]
+        log_map: Dict[str, Dict[str, Any]] = {}
+        if new_heads:
+            log_map = self._read_log(new_heads + [f"^{h}" for h in known_heads])
+            if not log_map and known_heads:
+                # 已知 head 可能已被 gc 回收，排除参数失效时退回全量遍历
+                logger.debug("增量遍历无结果，回退到全量补水")
+                log_map = self._read_log(heads)
+
+        if log_map:
+            self._hydrate(log_map, local_user_id, ref_tuples)
+        else:
+            logger.debug("✅ 未发现新的 Quipu 提交，无需补水。")
+        # 补水成功后才推进水位；中途失败时下次会重新遍历同一段历史 (插入是幂等的)
+        self.db_manager.save_hydration_refs(current_refs)
 
-        # 1.2 [FIXED] 构建一个覆盖所有历史节点的完整所有权地图
-        commit_owners = self._get_commit_owners(local_user_id)
+    def _hydrate(self, log_map: Dict[str, Dict[str, Any]], local_user_id: str, ref_tuples: List[Tuple[str, str]]):
+        # 1.2 [FIXED] 构建一个覆盖所有新节点的完整所有权地图，复用上面的父子关系而不再重复遍历
+        commit_owners = self._get_commit_owners(
+            local_user_id,
+            parent_map={commit_hash: entry["parent"] for commit_hash, entry in log_map.items()},
+            head_ref_tuples=ref_tuples,
+        )
 
         # 1.3 计算需要插入的节点 (所有历史节点 - 已在数据库中的节点)
-        db_hashes = self.db_manager.get_all_node_hashes()
-        missing_hashes = set(log_map.keys()) - db_hashes
+        # 之前中断的补水已提交的分块会在这里被跳过，从而从中断处继续
+        existing = self.db_manager.get_existing_node_hashes(log_map.keys())
+        missing_hashes = set(log_map.keys()) - existing
 
         if not missing_hashes:
             logger.debug("✅ 数据库与 Git 历史一致，无需补水。")
@@ -96,68 +162,139 @@ class Hydrator:
 
         logger.info(f"发现 {len(missing_hashes)} 个需要补水的节点。")
 
-        # --- 阶段 2: 批量准备数据 ---
-        nodes_to_insert: List[Tuple] = []
-        edges_to_insert: List[Tuple] = []
+        # 边只能指向已写入的节点：遍历边界之外的父节点需要查询数据库
+        boundary_parents = {
+            p for commit_hash in missing_hashes for p in log_map[commit_hash]["parent"].split() if p not in log_map
+        }
+        present = existing | self.db_manager.get_existing_node_hashes(boundary_parents)
 
-        tree_hashes = [log_map[h]["tree"] for h in missing_hashes if h in log_map]
-        trees_content = self.git_db.batch_cat_file(tree_hashes)
+        # --- 阶段 2: 按父节点优先的顺序分块补水，每块在独立事务中写入 ---
+        ordered = self._parents_first(missing_hashes, log_map)
+        total = len(ordered)
+        report = total > self.CHUNK_SIZE
+        node_count = edge_count = 0
+        for start in range(0, total, self.CHUNK_SIZE):
+            chunk = ordered[start : start + self.CHUNK_SIZE]
+            nodes, edges = self._build_chunk(chunk, log_map, commit_owners, present)
+            self.db_manager.insert_nodes_and_edges(nodes, edges)
+            present.update(row[0] for row in nodes)
+            node_count += len(nodes)
+            edge_count += len(edges)
+            if report:
+                bus.info(L.engine.hydrator.info.progress, done=start + len(chunk), total=total)
 
-        tree_to_meta_blob: Dict[str, str] = {}
-        meta_blob_hashes: List[str] = []
-        for tree_hash, content_bytes in trees_content.items():
-            entries = self._parser._parse_tree_binary(content_bytes)
-            if "metadata.json" in entries:
-                blob_hash = entries["metadata.json"]
-                tree_to_meta_blob[tree_hash] = blob_hash
-                meta_blob_hashes.append(blob_hash)
-        metas_content = self.git_db.batch_cat_file(meta_blob_hashes)
+        # 大批量补水后未编号的节点通常超过阈值，在此一次性重新编号
+        self.db_manager.refresh_lineage()
+
+        if node_count:
+            logger.info(f"💧 {node_count} 个节点元数据已补水。")
+        if edge_count:
+            logger.info(f"💧 {edge_count} 条边关系已补水。")
+
+    def _parents_first(self, hashes: Set[str], log_map: Dict[str, Dict[str, Any]]) -> List[str]:
+        # git log 的默认顺序不保证严格的拓扑序；重新排序后每个分块的边都指向更早写入的节点
+        ordered: List[str] = []
+        done: Set[str] = set()
+        # log 逆序已接近父节点优先，迭代式 DFS 只需处理少数例外
+        for root in reversed([h for h in log_map if h in hashes]):
+            stack = [root]
+            while stack:
+                commit_hash = stack[-1]
+                if commit_hash in done:
+                    stack.pop()
+                    continue
+                pending = [p for p in log_map[commit_hash]["parent"].split() if p in hashes and p not in done]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                done.add(commit_hash)
+                ordered.append(commit_hash)
+                stack.pop()
+        return ordered
 
-        for commit_hash in missing_hashes:
+    def _build_chunk(
+        self,
+        chunk: List[str],
+        log_map: Dict[str, Dict[str, Any]],
+        commit_owners: Dict[str, str],
+        present: Set[str],
+    ) -> Tuple[List[Tuple], List[Tuple]]:
+        rows: Dict[str, Tuple] = {}
+
+        # 2.1 先完成不依赖对象内容的校验，并按 Tree 归组待处理的 commit
+        commits_by_tree: Dict[str, List[str]] = {}
+        output_trees: Dict[str, str] = {}
+        for commit_hash in chunk:
             log_entry = log_map[commit_hash]
-            tree_hash = log_entry["tree"]
             # [FIXED] 从完整的映射中获取 owner_id，不再使用错误的 fallback
-            owner_id = commit_owners.get(commit_hash)
-            if not owner_id:
+            if not commit_owners.get(commit_hash):
                 logger.warning(f"跳过 {commit_hash[:7]}: 无法确定所有者")
                 continue
 
-            meta_blob_hash = tree_to_meta_blob.get(tree_hash)
-            if not meta_blob_hash or meta_blob_hash not in metas_content:
-                logger.warning(f"跳过 {commit_hash[:7]}: 找不到 metadata.json 内容")
-                continue
-
-            output_tree = self._parser._parse_output_tree_from_body(log_entry["body"])
+            output_tree = log_entry["output_tree"]
             if not output_tree:
                 logger.warning(f"跳过 {commit_hash[:7]}: 找不到 Output-Tree trailer")
                 continue
 
+            meta = log_entry["meta"]
+            if meta is not None:
+                rows[commit_hash] = (
+                    commit_hash,
+                    commit_owners[commit_hash],
+                    output_tree,
+                    meta["type"],
+                    meta["start"],
+                    meta["summary"],
+                    meta["generator"],
+                    self._meta_json_from_trailers(meta),
+                )
+                continue
+
+            output_trees[commit_hash] = output_tree
+            commits_by_tree.setdefault(log_entry["tree"], []).append(commit_hash)
+
+        # 2.2 (仅旧节点) 流式读取 Trees，解析后立即丢弃内容，只保留 metadata.json 的 Blob Hash
+        commits_by_meta_blob: Dict[str, List[str]] = {}
+        for tree_hash, _, _, content_view in self.git_db.iter_cat_file(list(commits_by_tree.keys())):
+            entries = self._parser._parse_tree_binary(bytes(content_view))
+            if "metadata.json" in entries:
+                commits_by_meta_blob.setdefault(entries["metadata.json"], []).extend(commits_by_tree[tree_hash])
+
+        # 2.3 流式读取 Metadata Blobs，逐个转换为待插入的行
+        hydrated_commits = set()
+        for blob_hash, _, _, content_view in self.git_db.iter_cat_file(list(commits_by_meta_blob.keys())):
+            blob_commits = commits_by_meta_blob[blob_hash]
+            hydrated_commits.update(blob_commits)
             try:
-                meta_bytes = metas_content[meta_blob_hash]
-                meta_data = json.loads(meta_bytes)
-                nodes_to_insert.append(
-                    (
-                        commit_hash,
-                        owner_id,
-                        output_tree,
-                        meta_data.get("type", "unknown"),
-                        float(meta_data.get("exec", {}).get("start") or log_entry["timestamp"]),
-                        meta_data.get("summary", "No summary"),
-                        meta_data.get("generator", {}).get("id"),
-                        meta_bytes.decode("utf-8"),
-                        None,
-                    )
+                meta_str = bytes(content_view).decode("utf-8")
+                meta_data = json.loads(meta_str)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                for commit_hash in blob_commits:
+                    logger.error(f"解析 {commit_hash[:7]} 的元数据失败: {e}")
+                continue
+
+            for commit_hash in blob_commits:
+                rows[commit_hash] = (
+                    commit_hash,
+                    commit_owners[commit_hash],
+                    output_trees[commit_hash],
+                    meta_data.get("type", "unknown"),
+                    float(meta_data.get("exec", {}).get("start") or log_map[commit_hash]["timestamp"]),
+                    meta_data.get("summary", "No summary"),
+                    meta_data.get("generator", {}).get("id"),
+                    meta_str,
                 )
-                for p_hash in log_entry["parent"].split():
-                    if p_hash in log_map:
-                        edges_to_insert.append((commit_hash, p_hash))
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.error(f"解析 {commit_hash[:7]} 的元数据失败: {e}")
-
-        # --- 阶段 3: 批量写入数据库 ---
-        if nodes_to_insert:
-            self.db_manager.batch_insert_nodes(nodes_to_insert)
-            logger.info(f"💧 {len(nodes_to_insert)} 个节点元数据已补水。")
-        if edges_to_insert:
-            self.db_manager.batch_insert_edges(edges_to_insert)
-            logger.info(f"💧 {len(edges_to_insert)} 条边关系已补水。")
+
+        for commit_hash in output_trees.keys() - hydrated_commits:
+            logger.warning(f"跳过 {commit_hash[:7]}: 找不到 metadata.json 内容")
+
+        # 按分块内的父节点优先顺序输出；被跳过的父节点不会产生边
+        nodes = [rows[commit_hash] for commit_hash in chunk if commit_hash in rows]
+        edges = [
+            (commit_hash, p)
+            for commit_hash in chunk
+            if commit_hash in rows
+            for p in log_map[commit_hash]["parent"].split()
+            if p in present or p in rows
+        ]
+        return nodes, edges
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+
+class NodeRecord(NamedTuple):
+    commit: str
+    # 空格分隔的全部父提交，与 `git log --format=%P` 一致
+    parents: str
+    # 无效提交 (缺少元数据或 trailer) 同样记录，output_tree 为 None，
+    # 这样增量遍历时既不会重复解析它们，也能保持父链完整以判断可达性
+    output_tree: Optional[str]
+    node_type: Optional[str]
+    summary: Optional[str]
+    timestamp: float
+    # 仅 meta_version 1.1 及以上的节点在 trailer 中记录了所有者
+    owner_id: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.output_tree is not None
+
+    @property
+    def first_parent(self) -> Optional[str]:
+        return self.parents.split(" ", 1)[0] if self.parents else None
+
+
+class NodeTable:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> Tuple[Set[str], Dict[str, NodeRecord]]:
+        try:
+            data = json.loads(self.path.read_bytes())
+        except FileNotFoundError:
+            return set(), {}
+
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            raise ValueError(f"Invalid node table: {self.path}")
+        try:
+            heads = set(data["heads"])
+            records = {row[0]: NodeRecord(*row) for row in data["rows"]}
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid node table: {self.path}") from e
+        return heads, records
+
+    def save(self, heads: Iterable[str], records: Iterable[NodeRecord]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": _VERSION, "heads": sorted(heads), "rows": [list(r) for r in records]}
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f"{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.debug(f"节点表已写入: {len(payload['rows'])} 条记录")
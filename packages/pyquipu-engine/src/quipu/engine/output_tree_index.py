@@ -0,0 +1,145 @@
+import logging
+import os
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 文件布局: [header][按 output_tree 排序的记录 × sorted_count][追加写入的未排序记录 ...]
+# 每条记录为 20 字节 output_tree + 20 字节 commit
+_HEADER = struct.Struct(">4sII")
+_MAGIC = b"QOTI"
+_VERSION = 1
+_KEY_LEN = 20
+_RECORD_LEN = 2 * _KEY_LEN
+
+
+class OutputTreeIndex:
+    # 未排序的追加记录超过该数量时，合并重写为完全排序的文件
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sorted = b""
+        self._tail: Dict[bytes, bytes] = {}
+        self._loaded_size: Optional[int] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self.path.exists()
+
+    def _refresh(self):
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            self._sorted, self._tail, self._loaded_size = b"", {}, None
+            return
+        if size == self._loaded_size:
+            return
+
+        data = self.path.read_bytes()
+        if len(data) < _HEADER.size:
+            raise ValueError(f"Truncated output tree index: {self.path}")
+        magic, version, sorted_count = _HEADER.unpack_from(data)
+        sorted_end = _HEADER.size + sorted_count * _RECORD_LEN
+        if magic != _MAGIC or version != _VERSION or sorted_end > len(data):
+            raise ValueError(f"Invalid output tree index: {self.path}")
+
+        self._sorted = data[_HEADER.size : sorted_end]
+        # 忽略末尾可能存在的不完整记录 (并发追加尚未写完)
+        tail_end = sorted_end + (len(data) - sorted_end) // _RECORD_LEN * _RECORD_LEN
+        self._tail = {
+            data[pos : pos + _KEY_LEN]: data[pos + _KEY_LEN : pos + _RECORD_LEN]
+            for pos in range(sorted_end, tail_end, _RECORD_LEN)
+        }
+        self._loaded_size = size
+
+    def _search_sorted(self, key: bytes) -> Optional[bytes]:
+        lo, hi = 0, len(self._sorted) // _RECORD_LEN
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = mid * _RECORD_LEN
+            current = self._sorted[pos : pos + _KEY_LEN]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return self._sorted[pos + _KEY_LEN : pos + _RECORD_LEN]
+        return None
+
+    def lookup(self, tree_hash: str) -> Optional[str]:
+        key = bytes.fromhex(tree_hash)
+        with self._lock:
+            self._refresh()
+            # 追加区中的记录更新，优先于排序区
+            value = self._tail.get(key) or self._search_sorted(key)
+        return value.hex() if value else None
+
+    def missing(self, mapping: Dict[str, str]) -> List[Tuple[str, str]]:
+        with self._lock:
+            self._refresh()
+            return [
+                (tree, commit)
+                for tree, commit in mapping.items()
+                if (self._tail.get(bytes.fromhex(tree)) or self._search_sorted(bytes.fromhex(tree)))
+                != bytes.fromhex(commit)
+            ]
+
+    def record(self, tree_hash: str, commit_hash: str):
+        self.record_many([(tree_hash, commit_hash)])
+
+    def record_many(self, pairs: Iterable[Tuple[str, str]]):
+        records = [(bytes.fromhex(tree), bytes.fromhex(commit)) for tree, commit in pairs]
+        if not records:
+            return
+
+        with self._lock:
+            # 未初始化的索引只能通过 rebuild() 整体建立，否则零散的追加会让不完整的索引被当作权威
+            if not self.path.exists():
+                return
+
+            self._refresh()
+            if len(self._tail) + len(records) > self.COMPACT_THRESHOLD:
+                merged = self._entries()
+                merged.update(records)
+                self._rewrite(merged)
+                return
+
+            with open(self.path, "ab") as f:
+                f.write(b"".join(tree + commit for tree, commit in records))
+            self._tail.update(records)
+            self._loaded_size = self.path.stat().st_size
+
+    def rebuild(self, pairs: Iterable[Tuple[str, str]]):
+        with self._lock:
+            self._rewrite({bytes.fromhex(tree): bytes.fromhex(commit) for tree, commit in pairs})
+
+    def _entries(self) -> Dict[bytes, bytes]:
+        entries = {
+            self._sorted[pos : pos + _KEY_LEN]: self._sorted[pos + _KEY_LEN : pos + _RECORD_LEN]
+            for pos in range(0, len(self._sorted), _RECORD_LEN)
+        }
+        entries.update(self._tail)
+        return entries
+
+    def _rewrite(self, entries: Dict[bytes, bytes]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        body = b"".join(key + entries[key] for key in sorted(entries))
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f"{self.path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, len(entries)))
+                f.write(body)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._sorted, self._tail = body, {}
+        self._loaded_size = self.path.stat().st_size
+        logger.debug(f"output_tree 索引已重写: {len(entries)} 条记录")
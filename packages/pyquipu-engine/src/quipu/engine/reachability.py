@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReachabilityIndex:
+    # 追加的未编号节点超过该数量时，重新为整个森林编号
+    RELABEL_THRESHOLD = 1024
+
+    def __init__(self):
+        self._parent: Dict[str, Optional[str]] = {}
+        # 先序编号与子树大小：a 是 b 的祖先 <=> pre[a] < pre[b] < pre[a] + size[a]
+        self._pre: Dict[str, int] = {}
+        self._size: Dict[str, int] = {}
+        self._order: List[str] = []
+        # 上次编号之后追加的节点，按追加顺序保存 (父节点总是先于子节点)
+        self._pending: Dict[str, Optional[str]] = {}
+
+    def __contains__(self, commit_hash: str) -> bool:
+        return commit_hash in self._parent
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def rebuild(self, edges: Iterable[Tuple[str, Optional[str]]]):
+        self._parent = dict(edges)
+        self._pending = {}
+        self._relabel()
+
+    def update(self, edges: Iterable[Tuple[str, Optional[str]]]):
+        edges = dict(edges)
+        if any(commit_hash not in edges for commit_hash in self._parent):
+            # 有节点被移除 (例如 prune) 时无法增量维护
+            self.rebuild(edges.items())
+            return
+        for commit_hash in edges:
+            self._append(commit_hash, edges)
+
+    def add(self, commit_hash: str, parent_hash: Optional[str]):
+        self._append(commit_hash, {commit_hash: parent_hash})
+
+    def _append(self, commit_hash: str, edges: Dict[str, Optional[str]]):
+        # 先追加尚未索引的祖先，保证 pending 中父节点先于子节点
+        chain = []
+        current: Optional[str] = commit_hash
+        while current is not None and current not in self._parent and current in edges:
+            chain.append(current)
+            current = edges[current]
+        for node in reversed(chain):
+            parent = edges[node]
+            self._parent[node] = parent if parent in self._parent else None
+            self._pending[node] = self._parent[node]
+        if len(self._pending) > self.RELABEL_THRESHOLD:
+            self._relabel()
+
+    def _relabel(self):
+        children: Dict[Optional[str], List[str]] = {}
+        for commit_hash, parent_hash in self._parent.items():
+            children.setdefault(parent_hash if parent_hash in self._parent else None, []).append(commit_hash)
+
+        pre: Dict[str, int] = {}
+        size: Dict[str, int] = {}
+        order: List[str] = []
+        # 迭代式 DFS，避免深链触发递归上限；(node, False) 为进入，(node, True) 为离开
+        stack: List[Tuple[str, bool]] = [(root, False) for root in reversed(children.get(None, []))]
+        while stack:
+            node, leaving = stack.pop()
+            if leaving:
+                size[node] = len(order) - pre[node]
+                continue
+            pre[node] = len(order)
+            order.append(node)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children.get(node, [])))
+
+        self._pre, self._size, self._order = pre, size, order
+        self._pending = {}
+        logger.debug(f"可达性索引已重新编号: {len(order)} 个节点")
+
+    def is_ancestor(self, ancestor_hash: str, descendant_hash: str) -> bool:
+        if ancestor_hash not in self._parent or descendant_hash not in self._parent:
+            return False
+        # 从追加区向上走到第一个已编号的节点，之后是 O(1) 的区间判断
+        current: Optional[str] = descendant_hash
+        while current in self._pending:
+            current = self._pending[current]
+            if current == ancestor_hash:
+                return True
+        if current is None or ancestor_hash in self._pending:
+            # 已编号的节点不可能是后追加节点的后代
+            return False
+        start = self._pre[ancestor_hash]
+        return start < self._pre[current] < start + self._size[ancestor_hash]
+
+    def ancestors(self, commit_hash: str) -> List[str]:
+        result = []
+        current = self._parent.get(commit_hash)
+        while current is not None:
+            result.append(current)
+            current = self._parent.get(current)
+        return result
+
+    def descendants(self, commit_hash: str) -> List[str]:
+        if commit_hash not in self._parent:
+            return []
+        result = []
+        if commit_hash in self._pre:
+            start = self._pre[commit_hash]
+            result = self._order[start + 1 : start + self._size[commit_hash]]
+        result.extend(p for p in self._pending if p != commit_hash and self.is_ancestor(commit_hash, p))
+        return result
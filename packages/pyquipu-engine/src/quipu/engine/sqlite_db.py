@@ -1,43 +1,129 @@
+import hashlib
 import logging
+import re
 import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=64)
+def _compile_regex(pattern: str) -> "re.Pattern[str]":
+    return re.compile(pattern)
+
+
+def _regexp(pattern: str, value: Optional[str]) -> bool:
+    # SQLite 将 `X REGEXP Y` 转换为 regexp(Y, X)
+    return value is not None and _compile_regex(pattern).search(value) is not None
+
+
+def _blob_hash(data: bytes) -> str:
+    # 与 git 为相同内容计算的 blob 哈希一致，相同的计划内容只缓存一份
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
 class DatabaseManager:
-    def __init__(self, work_dir: Path):
+    # IN (...) 查询每批的参数数量，低于旧版 SQLite 999 个变量的上限
+    IN_QUERY_CHUNK = 500
+    # 未编号的 lineage 行超过该数量时，重新为整个历史编号
+    LINEAGE_RELABEL_THRESHOLD = 1024
+    # 访问时间的精度 (秒)：同一条缓存在该间隔内的重复读取不再写回访问时间
+    CONTENT_TOUCH_INTERVAL = 60.0
+    _INSERT_NODES_SQL = """
+        INSERT OR IGNORE INTO nodes
+        (commit_hash, owner_id, output_tree, node_type, timestamp, summary, generator_id, meta_json)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _INSERT_EDGES_SQL = "INSERT OR IGNORE INTO edges (child_hash, parent_hash) VALUES (?, ?)"
+
+    def __init__(self, work_dir: Path, busy_timeout: float = 5.0, content_cache_bytes: int = 32 * 1024 * 1024):
         self.db_path = work_dir / ".quipu" / "history.sqlite"
         self.db_path.parent.mkdir(exist_ok=True)
-        self._conn: Optional[sqlite3.Connection] = None
+        # 等待其他进程释放锁的秒数，超时后才报 "database is locked"
+        self.busy_timeout = busy_timeout
+        # 计划内容缓存 (压缩后) 的字节预算，超出后按最近最少使用淘汰
+        self.content_cache_bytes = content_cache_bytes
+        # 读连接按线程分配，线程之间互不串行；写入全部经由唯一的写连接并由锁串行化
+        self._read_conns: Dict[int, sqlite3.Connection] = {}
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._fts_enabled: Optional[bool] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            # 连接可能由 close() 在其他线程中关闭，因此关闭同线程检查
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # 开启外键约束
+            conn.execute("PRAGMA foreign_keys = ON;")
+            conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+            logger.debug(f"🗃️  成功连接到数据库: {self.db_path}")
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"❌ 数据库连接失败: {e}")
+            raise
 
     def _get_conn(self) -> sqlite3.Connection:
-        if self._conn is None:
+        thread_id = threading.get_ident()
+        conn = self._read_conns.get(thread_id)
+        if conn is not None:
+            return conn
+        with self._pool_lock:
+            # 回收已结束线程的连接，避免池随线程数增长
+            alive = {t.ident for t in threading.enumerate()}
+            for stale_id in [tid for tid in self._read_conns if tid not in alive]:
+                self._read_conns.pop(stale_id).close()
+            conn = self._read_conns[thread_id] = self._connect()
+        return conn
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            if self._write_conn is None:
+                conn = self._connect()
+                # WAL 模式下读者与写者互不阻塞；该设置持久化在数据库文件中
+                conn.execute("PRAGMA journal_mode = WAL;")
+                conn.execute("PRAGMA synchronous = NORMAL;")
+                self._write_conn = conn
+            conn = self._write_conn
+            with conn:
+                yield conn
+
+    @property
+    def fts_enabled(self) -> bool:
+        if self._fts_enabled is None:
             try:
-                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
-                self._conn.row_factory = sqlite3.Row
-                # 开启外键约束
-                self._conn.execute("PRAGMA foreign_keys = ON;")
-                logger.debug(f"🗃️  成功连接到数据库: {self.db_path}")
-            except sqlite3.Error as e:
-                logger.error(f"❌ 数据库连接失败: {e}")
-                raise
-        return self._conn
+                row = self._get_conn().execute("SELECT 1 FROM sqlite_master WHERE name = 'nodes_fts';").fetchone()
+                self._fts_enabled = row is not None
+            except sqlite3.Error:
+                self._fts_enabled = False
+        return self._fts_enabled
 
     def close(self):
-        if self._conn:
-            self._conn.close()
-            self._conn = None
+        with self._write_lock, self._pool_lock:
+            conns = list(self._read_conns.values())
+            if self._write_conn is not None:
+                conns.append(self._write_conn)
+            self._read_conns = {}
+            self._write_conn = None
+        for conn in conns:
+            conn.close()
+        if conns:
             logger.debug("🗃️  数据库连接已关闭。")
 
     def __del__(self):
         self.close()
 
     def init_schema(self):
-        conn = self._get_conn()
         try:
-            with conn:
+            with self._writing() as conn:
                 # nodes 表
                 conn.execute(
                     """
@@ -50,12 +136,22 @@ class DatabaseManager:
                         summary TEXT NOT NULL,
                         generator_id TEXT,
                         meta_json TEXT NOT NULL,
-                        plan_md_cache TEXT
+                        content_hash TEXT(40),
+                        content_indexed INTEGER NOT NULL DEFAULT 0
                     );
                     """
                 )
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(nodes);")}
+                if "content_hash" not in columns:
+                    conn.execute("ALTER TABLE nodes ADD COLUMN content_hash TEXT(40);")
+                if "content_indexed" not in columns:
+                    # 旧版中 content_hash 非空同时表示正文已在索引中
+                    conn.execute("ALTER TABLE nodes ADD COLUMN content_indexed INTEGER NOT NULL DEFAULT 0;")
+                    conn.execute("UPDATE nodes SET content_indexed = 1 WHERE content_hash IS NOT NULL;")
                 # 索引
-                conn.execute("CREATE INDEX IF NOT EXISTS IDX_nodes_timestamp ON nodes(timestamp);")
+                # 时间线的全序 (timestamp, commit_hash)：分页游标据此直接定位，取代旧的单列时间索引
+                conn.execute("CREATE INDEX IF NOT EXISTS IDX_nodes_timeline ON nodes(timestamp, commit_hash);")
+                conn.execute("DROP INDEX IF EXISTS IDX_nodes_timestamp;")
                 conn.execute("CREATE INDEX IF NOT EXISTS IDX_nodes_output_tree ON nodes(output_tree);")
 
                 # edges 表
@@ -72,6 +168,16 @@ class DatabaseManager:
                 )
                 conn.execute("CREATE INDEX IF NOT EXISTS IDX_edges_parent ON edges(parent_hash);")
 
+                # hydration_refs 表: 上次补水时看到的 ref -> commit 映射 (补水水位)
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS hydration_refs (
+                        ref_name TEXT PRIMARY KEY,
+                        commit_hash TEXT(40) NOT NULL
+                    );
+                    """
+                )
+
                 # private_data 表
                 conn.execute(
                     """
@@ -84,20 +190,333 @@ class DatabaseManager:
                     );
                     """
                 )
+                # content_cache 表: 按 blob 哈希去重、zlib 压缩的计划内容，accessed 用于 LRU 淘汰
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS content_cache (
+                        blob_hash TEXT(40) PRIMARY KEY,
+                        data BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        accessed REAL NOT NULL
+                    );
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS IDX_content_cache_accessed ON content_cache(accessed);")
+                self._init_lineage(conn)
+                self._init_fts(conn)
+                if "plan_md_cache" in columns:
+                    self._migrate_plan_md_cache(conn)
             logger.debug("✅ 数据库 Schema 已初始化/验证。")
         except sqlite3.Error as e:
             logger.error(f"❌ 初始化 Schema 失败: {e}")
             raise
 
-    def execute_write(self, sql: str, params: tuple = ()):
+    def _init_lineage(self, conn: sqlite3.Connection):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'lineage';").fetchone():
+            self._create_lineage_delete_trigger(conn)
+            return
+        # 沿单父节点树的先序编号与子树大小：a 是 b 的祖先 <=> a.pre < b.pre < a.pre + a.size。
+        # pre 与 size 均为 NULL 表示尚未编号 (新节点)；pre 为 NULL 而 size 为 0 表示无法编号
+        # (合并节点及其后代)。已编号节点的祖先均已编号，且只有一条父边。
+        conn.execute(
+            """
+            CREATE TABLE lineage (
+                commit_hash TEXT(40) PRIMARY KEY,
+                output_tree TEXT(40) NOT NULL,
+                pre INTEGER,
+                size INTEGER,
+                FOREIGN KEY (commit_hash) REFERENCES nodes(commit_hash) ON DELETE CASCADE
+            );
+            """
+        )
+        # 覆盖索引：区间查询直接返回 output_tree，也用于定位未编号的行
+        conn.execute("CREATE INDEX IDX_lineage_pre ON lineage(pre, size, output_tree);")
+        conn.execute(
+            """
+            CREATE TRIGGER lineage_insert AFTER INSERT ON nodes BEGIN
+                INSERT OR IGNORE INTO lineage (commit_hash, output_tree) VALUES (new.commit_hash, new.output_tree);
+            END;
+            """
+        )
+        # 已编号部分的结构发生变化时，编号整体作废，由下一次 refresh_lineage 重新编号
+        self._create_lineage_delete_trigger(conn)
+        for event, row in (("INSERT", "new"), ("DELETE", "old")):
+            conn.execute(
+                f"""
+                CREATE TRIGGER lineage_edge_{event.lower()} AFTER {event} ON edges
+                WHEN (SELECT pre FROM lineage WHERE commit_hash = {row}.child_hash) IS NOT NULL BEGIN
+                    UPDATE lineage SET pre = NULL, size = NULL;
+                END;
+                """
+            )
+        # 升级前已存在的节点作为未编号的行加入
+        conn.execute("INSERT INTO lineage (commit_hash, output_tree) SELECT commit_hash, output_tree FROM nodes;")
+
+    def _create_lineage_delete_trigger(self, conn: sqlite3.Connection):
+        # 编号已作废时跳过，批量删除只重写一次 lineage；旧版触发器对每个被删除的节点都重写整表
+        conn.execute("DROP TRIGGER IF EXISTS lineage_node_delete;")
+        conn.execute(
+            """
+            CREATE TRIGGER lineage_node_delete AFTER DELETE ON nodes
+            WHEN EXISTS (SELECT 1 FROM lineage WHERE pre IS NOT NULL) BEGIN
+                UPDATE lineage SET pre = NULL, size = NULL;
+            END;
+            """
+        )
+
+    def refresh_lineage(self, force: bool = False):
         conn = self._get_conn()
+        pending = conn.execute("SELECT COUNT(*) FROM lineage WHERE pre IS NULL AND size IS NULL;").fetchone()[0]
+        if not pending or (pending <= self.LINEAGE_RELABEL_THRESHOLD and not force):
+            # 少量未编号的节点由查询沿边逐个处理
+            return
         try:
-            with conn:
+            with self._writing() as conn:
+                self._relabel_lineage(conn)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 重新编号 lineage 失败: {e}")
+            raise
+
+    def _relabel_lineage(self, conn: sqlite3.Connection):
+        # 在写事务中读取，保证编号与边的快照一致
+        output_trees = dict(conn.execute("SELECT commit_hash, output_tree FROM lineage;").fetchall())
+        parents: Dict[str, List[str]] = {commit_hash: [] for commit_hash in output_trees}
+        children: Dict[Optional[str], List[str]] = {}
+        for child_hash, parent_hash in conn.execute("SELECT child_hash, parent_hash FROM edges;"):
+            parents.setdefault(child_hash, []).append(parent_hash)
+        for commit_hash, node_parents in parents.items():
+            if len(node_parents) <= 1:
+                children.setdefault(node_parents[0] if node_parents else None, []).append(commit_hash)
+
+        pre: Dict[str, int] = {}
+        size: Dict[str, int] = {}
+        # 迭代式 DFS，避免深链触发递归上限；(node, False) 为进入，(node, True) 为离开。
+        # 合并节点不在任何单父节点的子列表中，因此它与它的后代都不会被访问到
+        stack: List[Tuple[str, bool]] = [(root, False) for root in children.get(None, [])]
+        while stack:
+            node, leaving = stack.pop()
+            if leaving:
+                size[node] = len(pre) - pre[node]
+                continue
+            pre[node] = len(pre)
+            stack.append((node, True))
+            stack.extend((child, False) for child in children.get(node, []))
+
+        # 整表重写比逐行 UPDATE 更快：无需为每一行查找并移动索引项
+        conn.execute("DELETE FROM lineage;")
+        conn.executemany(
+            "INSERT INTO lineage (commit_hash, output_tree, pre, size) VALUES (?, ?, ?, ?);",
+            (
+                (commit_hash, output_tree, pre.get(commit_hash), size.get(commit_hash, 0))
+                for commit_hash, output_tree in output_trees.items()
+            ),
+        )
+        logger.debug(f"lineage 已重新编号: {len(pre)} 个节点，{len(output_trees) - len(pre)} 个无法编号")
+
+    def _init_fts(self, conn: sqlite3.Connection):
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'nodes_fts';").fetchone()
+        contentless = bool(row) and "content=''" in row[0]
+        if contentless and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'nodes_fts_stale';").fetchone():
+            self._fts_enabled = True
+            return
+        # 旧版触发器在每次删除时重建整个索引；旧版外部内容索引以 nodes.plan_md_cache 为内容，随该列一起迁移
+        for trigger in ("nodes_fts_insert", "nodes_fts_delete", "nodes_fts_update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        if row and not contentless:
+            conn.execute("DROP TABLE nodes_fts;")
+        if not contentless:
+            try:
+                # 无内容 (contentless) 索引：正文只存于可淘汰的内容缓存中，索引本身不保存文本；
+                # trigram 分词支持中文与任意子串匹配
+                conn.execute(
+                    """
+                    CREATE VIRTUAL TABLE nodes_fts USING fts5(
+                        summary, content, content='', tokenize='trigram'
+                    );
+                    """
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"当前 SQLite 不支持 FTS5 trigram 分词，搜索将回退为全表扫描: {e}")
+                self._fts_enabled = False
+                return
+        # 无内容索引只能凭原文删除条目；原文不可得时只能整体重建，此表非空即表示需要重建
+        conn.execute("CREATE TABLE IF NOT EXISTS nodes_fts_stale (flag INTEGER PRIMARY KEY);")
+
+        # 新节点先只索引摘要；正文在读取或预热时由 _store_contents 写入索引并设置 nodes.content_indexed
+        conn.execute(
+            """
+            CREATE TRIGGER nodes_fts_insert AFTER INSERT ON nodes BEGIN
+                INSERT INTO nodes_fts (rowid, summary, content) VALUES (new.rowid, new.summary, NULL);
+            END;
+            """
+        )
+        # 节点删除或摘要变化时：只索引了摘要的条目直接删除；已索引正文的条目无法可靠地提供原文，
+        # 只标记索引过期，由下一次 refresh_fts 整体重建一次
+        for event, condition, reinsert in (
+            ("DELETE", "", ""),
+            (
+                "UPDATE OF summary",
+                "WHEN old.summary IS NOT new.summary",
+                "INSERT INTO nodes_fts (rowid, summary, content) "
+                "SELECT new.rowid, new.summary, NULL WHERE NOT old.content_indexed;",
+            ),
+        ):
+            conn.execute(
+                f"""
+                CREATE TRIGGER nodes_fts_{event.split()[0].lower()} AFTER {event} ON nodes {condition} BEGIN
+                    INSERT INTO nodes_fts (nodes_fts, rowid, summary, content)
+                        SELECT 'delete', old.rowid, old.summary, NULL WHERE NOT old.content_indexed;
+                    {reinsert}
+                    INSERT OR IGNORE INTO nodes_fts_stale (flag) SELECT 1 WHERE old.content_indexed;
+                END;
+                """
+            )
+        if not contentless:
+            # 为升级前已存在的节点建立摘要索引
+            self._rebuild_fts(conn)
+        self._fts_enabled = True
+
+    def refresh_fts(self):
+        if not self.fts_enabled:
+            return
+        if not self._get_conn().execute("SELECT 1 FROM nodes_fts_stale;").fetchone():
+            return
+        try:
+            with self._writing() as conn:
+                self._rebuild_fts(conn)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 重建全文索引失败: {e}")
+            raise
+
+    def _rebuild_fts(self, conn: sqlite3.Connection):
+        # 只重置索引标记，content_hash 与内容缓存保持不变，正文可直接从缓存重新索引
+        conn.execute("INSERT INTO nodes_fts (nodes_fts) VALUES ('delete-all');")
+        conn.execute("INSERT INTO nodes_fts (rowid, summary, content) SELECT rowid, summary, NULL FROM nodes;")
+        conn.execute("UPDATE nodes SET content_indexed = 0 WHERE content_indexed;")
+        conn.execute("DELETE FROM nodes_fts_stale;")
+        logger.debug("全文索引已重建")
+
+    def _migrate_plan_md_cache(self, conn: sqlite3.Connection):
+        rows = conn.execute("SELECT commit_hash, plan_md_cache FROM nodes WHERE plan_md_cache IS NOT NULL;").fetchall()
+        self._store_contents(conn, [(row[0], row[1]) for row in rows])
+        try:
+            conn.execute("ALTER TABLE nodes DROP COLUMN plan_md_cache;")
+        except sqlite3.OperationalError:
+            # SQLite 3.35 以前不支持 DROP COLUMN，只清空旧列
+            conn.execute("UPDATE nodes SET plan_md_cache = NULL WHERE plan_md_cache IS NOT NULL;")
+        logger.debug(f"已将 {len(rows)} 条旧版内容缓存迁移到 content_cache")
+
+    def store_contents(self, entries: List[Tuple[str, str]], cache: bool = True):
+        try:
+            with self._writing() as conn:
+                self._store_contents(conn, entries, cache)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 写入内容缓存失败: {e}")
+            raise
+
+    def _store_contents(self, conn: sqlite3.Connection, entries: List[Tuple[str, str]], cache: bool = True):
+        now = time.time()
+        content_hashes: Dict[str, str] = {}
+        texts: Dict[str, str] = {}
+        blobs: Dict[str, bytes] = {}
+        for commit_hash, content in entries:
+            data = content.encode("utf-8")
+            blob_hash = _blob_hash(data)
+            content_hashes[commit_hash] = blob_hash
+            texts[commit_hash] = content
+            if cache and blob_hash not in blobs:
+                blobs[blob_hash] = zlib.compress(data)
+        if blobs:
+            conn.executemany(
+                "INSERT INTO content_cache (blob_hash, data, size, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(blob_hash) DO UPDATE SET accessed = excluded.accessed;",
+                ((blob_hash, data, len(data), now) for blob_hash, data in blobs.items()),
+            )
+            self._evict_contents(conn)
+
+        # content_hash 是内容缓存的键；只为尚未索引正文的节点写入全文索引
+        keys = list(content_hashes)
+        for start in range(0, len(keys), self.IN_QUERY_CHUNK):
+            chunk = keys[start : start + self.IN_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT rowid, commit_hash, summary, content_hash, content_indexed FROM nodes "
+                f"WHERE commit_hash IN ({placeholders});",
+                chunk,
+            ).fetchall()
+            unindexed = [row for row in rows if not row[4]]
+            if self.fts_enabled:
+                conn.executemany(
+                    "INSERT INTO nodes_fts (nodes_fts, rowid, summary, content) VALUES ('delete', ?, ?, NULL);",
+                    ((row[0], row[2]) for row in unindexed),
+                )
+                conn.executemany(
+                    "INSERT INTO nodes_fts (rowid, summary, content) VALUES (?, ?, ?);",
+                    ((row[0], row[2], texts[row[1]]) for row in unindexed),
+                )
+            conn.executemany(
+                "UPDATE nodes SET content_hash = ?, content_indexed = 1 WHERE commit_hash = ?;",
+                ((content_hashes[row[1]], row[1]) for row in rows if not row[4] or row[3] != content_hashes[row[1]]),
+            )
+
+    def _evict_contents(self, conn: sqlite3.Connection):
+        excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM content_cache;").fetchone()[0]
+        excess -= self.content_cache_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for blob_hash, size in conn.execute("SELECT blob_hash, size FROM content_cache ORDER BY accessed;"):
+            victims.append((blob_hash,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM content_cache WHERE blob_hash = ?;", victims)
+        logger.debug(f"内容缓存超出预算，已淘汰 {len(victims)} 条")
+
+    def get_cached_contents(self, commit_hashes: Iterable[str], touch: bool = True) -> Dict[str, str]:
+        conn = self._get_conn()
+        keys = list(commit_hashes)
+        contents: Dict[str, str] = {}
+        now = time.time()
+        stale: Set[str] = set()
+        try:
+            for start in range(0, len(keys), self.IN_QUERY_CHUNK):
+                chunk = keys[start : start + self.IN_QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT n.commit_hash, c.blob_hash, c.data, c.accessed FROM nodes n "
+                    f"JOIN content_cache c ON c.blob_hash = n.content_hash WHERE n.commit_hash IN ({placeholders});",
+                    chunk,
+                )
+                for commit_hash, blob_hash, data, accessed in cursor:
+                    contents[commit_hash] = zlib.decompress(data).decode("utf-8")
+                    if touch and accessed < now - self.CONTENT_TOUCH_INTERVAL:
+                        stale.add(blob_hash)
+        except (sqlite3.Error, zlib.error) as e:
+            logger.error(f"❌ 读取内容缓存失败: {e}")
+            return {}
+        if stale:
+            self.execute_write_many(
+                "UPDATE content_cache SET accessed = ? WHERE blob_hash = ?;", [(now, h) for h in stale]
+            )
+        return contents
+
+    def execute_write(self, sql: str, params: tuple = ()):
+        try:
+            with self._writing() as conn:
                 conn.execute(sql, params)
         except sqlite3.Error as e:
             logger.error(f"❌ 数据库写入失败: {e} | SQL: {sql}")
             raise
 
+    def execute_write_many(self, sql: str, params_seq: List[tuple]):
+        try:
+            with self._writing() as conn:
+                conn.executemany(sql, params_seq)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 数据库批量写入失败: {e} | SQL: {sql}")
+            raise
+
     def get_all_node_hashes(self) -> Set[str]:
         conn = self._get_conn()
         try:
@@ -107,26 +526,72 @@ class DatabaseManager:
             logger.error(f"❌ 查询节点哈希失败: {e}")
             return set()
 
-    def batch_insert_nodes(self, nodes: List[Tuple]):
+    def get_existing_node_hashes(self, commit_hashes: Iterable[str]) -> Set[str]:
         conn = self._get_conn()
-        sql = """
-            INSERT OR IGNORE INTO nodes 
-            (commit_hash, owner_id, output_tree, node_type, timestamp, summary, generator_id, meta_json, plan_md_cache)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
+        keys = list(commit_hashes)
+        existing: Set[str] = set()
         try:
-            with conn:
-                conn.executemany(sql, nodes)
+            for start in range(0, len(keys), self.IN_QUERY_CHUNK):
+                chunk = keys[start : start + self.IN_QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(f"SELECT commit_hash FROM nodes WHERE commit_hash IN ({placeholders});", chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"❌ 查询节点哈希失败: {e}")
+        return existing
+
+    def get_hydration_refs(self) -> Dict[str, str]:
+        conn = self._get_conn()
+        try:
+            cursor = conn.execute("SELECT ref_name, commit_hash FROM hydration_refs;")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"❌ 读取补水水位失败: {e}")
+            return {}
+
+    def save_hydration_refs(self, refs: Dict[str, str]):
+        try:
+            with self._writing() as conn:
+                conn.execute("DELETE FROM hydration_refs;")
+                conn.executemany("INSERT INTO hydration_refs (ref_name, commit_hash) VALUES (?, ?)", refs.items())
+        except sqlite3.Error as e:
+            logger.error(f"❌ 写入补水水位失败: {e}")
+            raise
+
+    def get_commit_by_output_tree(self, tree_hash: str) -> Optional[str]:
+        conn = self._get_conn()
+        try:
+            # 命中 IDX_nodes_output_tree；同一个 output_tree 有多个节点时取最新的
+            cursor = conn.execute(
+                "SELECT commit_hash FROM nodes WHERE output_tree = ? ORDER BY timestamp DESC LIMIT 1;", (tree_hash,)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"❌ 按 output_tree 查询节点失败: {e}")
+            return None
+
+    def batch_insert_nodes(self, nodes: List[Tuple]):
+        try:
+            with self._writing() as conn:
+                conn.executemany(self._INSERT_NODES_SQL, nodes)
         except sqlite3.Error as e:
             logger.error(f"❌ 批量插入节点失败: {e}")
             raise
 
     def batch_insert_edges(self, edges: List[Tuple]):
-        conn = self._get_conn()
-        sql = "INSERT OR IGNORE INTO edges (child_hash, parent_hash) VALUES (?, ?)"
         try:
-            with conn:
-                conn.executemany(sql, edges)
+            with self._writing() as conn:
+                conn.executemany(self._INSERT_EDGES_SQL, edges)
         except sqlite3.Error as e:
             logger.error(f"❌ 批量插入边失败: {e}")
             raise
+
+    def insert_nodes_and_edges(self, nodes: List[Tuple], edges: List[Tuple]):
+        try:
+            with self._writing() as conn:
+                conn.executemany(self._INSERT_NODES_SQL, nodes)
+                conn.executemany(self._INSERT_EDGES_SQL, edges)
+        except sqlite3.Error as e:
+            logger.error(f"❌ 批量插入节点与边失败: {e}")
+            raise
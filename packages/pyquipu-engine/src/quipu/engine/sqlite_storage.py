@@ -1,11 +1,13 @@
 import json
 import logging
+import re
 import sqlite3
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Set
 
 from quipu.engine.git_object_storage import GitObjectHistoryReader, GitObjectHistoryWriter
+from quipu.spec.models.compact_graph import CompactGraph, NodeRow
 from quipu.spec.models.graph import QuipuNode
 
 from quipu.spec.constants import EMPTY_TREE_HASH
@@ -14,8 +16,18 @@ from .sqlite_db import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+_REGEX_META = re.compile(r"[\\.^$*+?{}\[\]()|]")
+
 
 class SQLiteHistoryReader:
+    IN_QUERY_CHUNK = DatabaseManager.IN_QUERY_CHUNK
+    # trigram 分词器只能匹配不少于 3 个字符的词
+    FTS_MIN_TERM = 3
+    # 补齐内容缓存时每次 cat-file 批量读取的节点数
+    CONTENT_WARM_CHUNK = 2000
+    # 按时间排序的搜索先在最新的这么多个节点中查找
+    RECENT_WINDOW = 2000
+
     def __init__(self, db_manager: DatabaseManager, git_db: GitDB):
         self.db_manager = db_manager
         # git_reader 用于按需加载内容和解析二进制 tree
@@ -24,8 +36,11 @@ class SQLiteHistoryReader:
     def load_all_nodes(self) -> List[QuipuNode]:
         conn = self.db_manager._get_conn()
 
-        # 1. 一次性获取所有节点元数据
-        nodes_cursor = conn.execute("SELECT * FROM nodes ORDER BY timestamp DESC;")
+        # 1. 一次性获取所有节点元数据 (不含内容)
+        nodes_cursor = conn.execute(
+            "SELECT commit_hash, output_tree, timestamp, node_type, summary, owner_id "
+            "FROM nodes ORDER BY timestamp DESC;"
+        )
         nodes_data = nodes_cursor.fetchall()
 
         temp_nodes: Dict[str, QuipuNode] = {}
@@ -41,7 +56,7 @@ class SQLiteHistoryReader:
                 node_type=row["node_type"],
                 summary=row["summary"],
                 # 内容是懒加载的
-                content=row["plan_md_cache"] if row["plan_md_cache"] is not None else "",
+                content="",
                 owner_id=row["owner_id"],
             )
             temp_nodes[commit_hash] = node
@@ -82,6 +97,31 @@ class SQLiteHistoryReader:
 
         return list(temp_nodes.values())
 
+    def load_compact_graph(self) -> CompactGraph:
+        conn = self.db_manager._get_conn()
+        # 与 load_all_nodes 一致：每个节点只取遇到的第一条父边，并忽略自引用
+        parents: Dict[str, str] = {}
+        for child_hash, parent_hash in conn.execute("SELECT child_hash, parent_hash FROM edges;"):
+            if child_hash != parent_hash:
+                parents.setdefault(child_hash, parent_hash)
+
+        cursor = conn.execute(
+            "SELECT commit_hash, output_tree, timestamp, node_type, summary, owner_id "
+            "FROM nodes ORDER BY timestamp DESC;"
+        )
+        return CompactGraph.build(
+            NodeRow(
+                commit_hash=row["commit_hash"],
+                parent_hash=parents.get(row["commit_hash"]),
+                output_tree=row["output_tree"],
+                timestamp=row["timestamp"],
+                node_type=row["node_type"],
+                summary=row["summary"],
+                owner_id=row["owner_id"],
+            )
+            for row in cursor
+        )
+
     def get_node_count(self) -> int:
         conn = self.db_manager._get_conn()
         try:
@@ -95,15 +135,18 @@ class SQLiteHistoryReader:
     def get_node_position(self, output_tree_hash: str) -> int:
         conn = self.db_manager._get_conn()
         try:
-            # 1. 获取目标节点的最大时间戳（最新那个）
-            cursor = conn.execute("SELECT MAX(timestamp) FROM nodes WHERE output_tree = ?", (output_tree_hash,))
+            # 1. 获取产出该 Tree 的最新节点在时间线上的键
+            cursor = conn.execute(
+                "SELECT timestamp, commit_hash FROM nodes WHERE output_tree = ? "
+                "ORDER BY timestamp DESC, commit_hash DESC LIMIT 1",
+                (output_tree_hash,),
+            )
             row = cursor.fetchone()
-            if not row or row[0] is None:
+            if not row:
                 return -1
-            target_ts = row[0]
 
-            # 2. 计算有多少个节点比它新（时间戳更大）
-            cursor = conn.execute("SELECT COUNT(*) FROM nodes WHERE timestamp > ?", (target_ts,))
+            # 2. 计算时间线上排在它之前的节点数，与分页的排序一致
+            cursor = conn.execute("SELECT COUNT(*) FROM nodes WHERE (timestamp, commit_hash) > (?, ?)", tuple(row))
             count = cursor.fetchone()[0]
             return count
         except sqlite3.Error as e:
@@ -113,142 +156,161 @@ class SQLiteHistoryReader:
     def load_nodes_paginated(self, limit: int, offset: int) -> List[QuipuNode]:
         conn = self.db_manager._get_conn()
         try:
-            # 1. Fetch nodes
-            cursor = conn.execute("SELECT * FROM nodes ORDER BY timestamp DESC LIMIT ? OFFSET ?", (limit, offset))
-            rows = cursor.fetchall()
-
-            if not rows:
-                return []
+            cursor = conn.execute(
+                "SELECT * FROM nodes ORDER BY timestamp DESC, commit_hash DESC LIMIT ? OFFSET ?", (limit, offset)
+            )
+            return self._build_page(conn, cursor.fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load paginated nodes: {e}")
+            return []
 
-            nodes_map = {}
-            node_hashes = []
-
-            for row in rows:
-                commit_hash = row["commit_hash"]
-                node_hashes.append(commit_hash)
-                nodes_map[commit_hash] = QuipuNode(
-                    commit_hash=commit_hash,
-                    input_tree="",  # Placeholder
-                    output_tree=row["output_tree"],
-                    timestamp=datetime.fromtimestamp(row["timestamp"]),
-                    filename=Path(f".quipu/git_objects/{commit_hash}"),
-                    node_type=row["node_type"],
-                    summary=row["summary"],
-                    content=row["plan_md_cache"] if row["plan_md_cache"] is not None else "",
-                    owner_id=row["owner_id"],
+    def load_nodes_page(self, limit: int, after: Optional[str] = None, before: Optional[str] = None) -> List[QuipuNode]:
+        conn = self.db_manager._get_conn()
+        # 游标节点的键从表中读取：经由 datetime 往返的时间戳会丢失精度，无法用于精确比较
+        key = "(SELECT timestamp, commit_hash FROM nodes WHERE commit_hash = ?)"
+        try:
+            if before is not None:
+                # 沿索引反向读取紧邻游标之前的一页，再恢复为时间倒序
+                cursor = conn.execute(
+                    f"SELECT * FROM nodes WHERE (timestamp, commit_hash) > {key} "
+                    "ORDER BY timestamp ASC, commit_hash ASC LIMIT ?",
+                    (before, limit),
                 )
+                rows = cursor.fetchall()[::-1]
+            elif after is not None:
+                cursor = conn.execute(
+                    f"SELECT * FROM nodes WHERE (timestamp, commit_hash) < {key} "
+                    "ORDER BY timestamp DESC, commit_hash DESC LIMIT ?",
+                    (after, limit),
+                )
+                rows = cursor.fetchall()
+            else:
+                cursor = conn.execute("SELECT * FROM nodes ORDER BY timestamp DESC, commit_hash DESC LIMIT ?", (limit,))
+                rows = cursor.fetchall()
+            return self._build_page(conn, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load nodes page: {e}")
+            return []
+
+    def _build_page(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> List[QuipuNode]:
+        if not rows:
+            return []
 
-            # 2. Fetch edges to identify parents
-            placeholders = ",".join("?" * len(node_hashes))
-            edges_cursor = conn.execute(
-                f"SELECT child_hash, parent_hash FROM edges WHERE child_hash IN ({placeholders})", tuple(node_hashes)
+        # 1. Build nodes
+        nodes_map = {}
+        node_hashes = []
+
+        for row in rows:
+            commit_hash = row["commit_hash"]
+            node_hashes.append(commit_hash)
+            nodes_map[commit_hash] = QuipuNode(
+                commit_hash=commit_hash,
+                input_tree="",  # Placeholder
+                output_tree=row["output_tree"],
+                timestamp=datetime.fromtimestamp(row["timestamp"]),
+                filename=Path(f".quipu/git_objects/{commit_hash}"),
+                node_type=row["node_type"],
+                summary=row["summary"],
+                owner_id=row["owner_id"],
             )
-            edges = edges_cursor.fetchall()
-
-            child_to_parent = {row["child_hash"]: row["parent_hash"] for row in edges}
-            parent_hashes = [row["parent_hash"] for row in edges]
-
-            # 3. Fetch parent output_tree for input_tree linking
-            parent_info = {}
-            if parent_hashes:
-                p_placeholders = ",".join("?" * len(parent_hashes))
-                p_cursor = conn.execute(
-                    f"SELECT commit_hash, output_tree FROM nodes WHERE commit_hash IN ({p_placeholders})",
-                    tuple(parent_hashes),
-                )
-                parent_info = {row["commit_hash"]: row["output_tree"] for row in p_cursor.fetchall()}
-
-            results = []
-            for commit_hash in node_hashes:
-                node = nodes_map[commit_hash]
-                parent_hash = child_to_parent.get(commit_hash)
-
-                if parent_hash:
-                    # Set input_tree from parent's output_tree
-                    node.input_tree = parent_info.get(parent_hash, EMPTY_TREE_HASH)
-
-                    # Link objects if parent is in the same page
-                    if parent_hash in nodes_map:
-                        parent_node = nodes_map[parent_hash]
-                        node.parent = parent_node
-                        parent_node.children.append(node)
-                else:
-                    node.input_tree = EMPTY_TREE_HASH
 
-                results.append(node)
+        # 2. Fetch edges to identify parents
+        placeholders = ",".join("?" * len(node_hashes))
+        edges_cursor = conn.execute(
+            f"SELECT child_hash, parent_hash FROM edges WHERE child_hash IN ({placeholders})", tuple(node_hashes)
+        )
+        edges = edges_cursor.fetchall()
+
+        child_to_parent = {row["child_hash"]: row["parent_hash"] for row in edges}
+        parent_hashes = [row["parent_hash"] for row in edges]
+
+        # 3. Fetch parent output_tree for input_tree linking
+        parent_info = {}
+        if parent_hashes:
+            p_placeholders = ",".join("?" * len(parent_hashes))
+            p_cursor = conn.execute(
+                f"SELECT commit_hash, output_tree FROM nodes WHERE commit_hash IN ({p_placeholders})",
+                tuple(parent_hashes),
+            )
+            parent_info = {row["commit_hash"]: row["output_tree"] for row in p_cursor.fetchall()}
 
-            # Sort children for consistency (though partial)
-            for node in results:
-                node.children.sort(key=lambda n: n.timestamp)
+        results = []
+        for commit_hash in node_hashes:
+            node = nodes_map[commit_hash]
+            parent_hash = child_to_parent.get(commit_hash)
+
+            if parent_hash:
+                # Set input_tree from parent's output_tree
+                node.input_tree = parent_info.get(parent_hash, EMPTY_TREE_HASH)
+
+                # Link objects if parent is in the same page
+                if parent_hash in nodes_map:
+                    parent_node = nodes_map[parent_hash]
+                    node.parent = parent_node
+                    parent_node.children.append(node)
+            else:
+                node.input_tree = EMPTY_TREE_HASH
 
-            return results
+            results.append(node)
 
-        except sqlite3.Error as e:
-            logger.error(f"Failed to load paginated nodes: {e}")
-            return []
+        # Sort children for consistency (though partial)
+        for node in results:
+            node.children.sort(key=lambda n: n.timestamp)
+
+        return results
 
     def get_descendant_output_trees(self, start_output_tree_hash: str) -> Set[str]:
+        # 已编号的后代是起点的先序区间；未编号的后代 (新节点或合并节点之后) 只能挂在起点、
+        # 起点的已编号后代或其他未编号节点之下，从这些挂载点沿子边向下展开
+        sql = """
+        WITH RECURSIVE
+        starts(h, pre, size) AS (
+            SELECT l.commit_hash, l.pre, l.size FROM nodes n JOIN lineage l ON l.commit_hash = n.commit_hash
+            WHERE n.output_tree = ?
+        ),
+        unlabeled(h) AS (
+            SELECT u.commit_hash FROM lineage u
+            JOIN edges e ON e.child_hash = u.commit_hash
+            JOIN lineage p ON p.commit_hash = e.parent_hash
+            JOIN starts s ON p.pre >= s.pre AND p.pre < s.pre + s.size
+            WHERE u.pre IS NULL
+            UNION
+            SELECT e.child_hash FROM starts s JOIN edges e ON e.parent_hash = s.h WHERE s.pre IS NULL
+            UNION
+            SELECT e.child_hash FROM unlabeled d JOIN edges e ON e.parent_hash = d.h
+        )
+        SELECT d.output_tree FROM starts s JOIN lineage d ON d.pre > s.pre AND d.pre < s.pre + s.size
+        UNION
+        SELECT l.output_tree FROM unlabeled d JOIN lineage l ON l.commit_hash = d.h;
+        """
         conn = self.db_manager._get_conn()
         try:
-            cursor = conn.execute("SELECT commit_hash FROM nodes WHERE output_tree = ?", (start_output_tree_hash,))
-            rows = cursor.fetchall()
-            if not rows:
-                return set()
-            start_commit_hashes = [row[0] for row in rows]
-
-            all_descendant_trees = set()
-            for commit_hash in start_commit_hashes:
-                sql = """
-                WITH RECURSIVE descendants(h) AS (
-                    SELECT child_hash FROM edges WHERE parent_hash = ?
-                    UNION ALL
-                    SELECT e.child_hash FROM edges e, descendants d WHERE e.parent_hash = d.h AND e.child_hash IS NOT NULL
-                )
-                SELECT h FROM descendants WHERE h IS NOT NULL;
-                """
-                c_cursor = conn.execute(sql, (commit_hash,))
-                descendant_commit_hashes = {r[0] for r in c_cursor.fetchall()}
-
-                if descendant_commit_hashes:
-                    placeholders = ",".join("?" * len(descendant_commit_hashes))
-                    sql_out = f"SELECT output_tree FROM nodes WHERE commit_hash IN ({placeholders})"
-                    out_cursor = conn.execute(sql_out, tuple(descendant_commit_hashes))
-                    all_descendant_trees.update(r[0] for r in out_cursor.fetchall())
-            return all_descendant_trees
-
+            return {row[0] for row in conn.execute(sql, (start_output_tree_hash,))}
         except sqlite3.Error as e:
             logger.error(f"Failed to get descendants for {start_output_tree_hash[:7]}: {e}")
             return set()
 
     def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
+        # 沿父边向上只需走过未编号的节点；遇到第一个已编号的祖先后，其余祖先是覆盖它的先序区间
+        sql = """
+        WITH RECURSIVE ancestors(h, pre) AS (
+            SELECT e.parent_hash, l.pre FROM nodes s
+            JOIN edges e ON e.child_hash = s.commit_hash
+            JOIN lineage l ON l.commit_hash = e.parent_hash
+            WHERE s.output_tree = ?
+            UNION
+            SELECT e.parent_hash, l.pre FROM ancestors a
+            JOIN edges e ON e.child_hash = a.h
+            JOIN lineage l ON l.commit_hash = e.parent_hash
+            WHERE a.pre IS NULL
+        )
+        SELECT l.output_tree FROM ancestors a JOIN lineage l ON l.commit_hash = a.h
+        UNION
+        SELECT l.output_tree FROM ancestors a JOIN lineage l ON l.pre < a.pre AND l.pre + l.size > a.pre;
+        """
         conn = self.db_manager._get_conn()
         try:
-            cursor = conn.execute("SELECT commit_hash FROM nodes WHERE output_tree = ?", (start_output_tree_hash,))
-            rows = cursor.fetchall()
-            if not rows:
-                return set()
-            start_commit_hashes = [row[0] for row in rows]
-
-            all_ancestor_trees = set()
-            for commit_hash in start_commit_hashes:
-                sql = """
-                WITH RECURSIVE ancestors(h) AS (
-                    SELECT parent_hash FROM edges WHERE child_hash = ?
-                    UNION ALL
-                    SELECT e.parent_hash FROM edges e, ancestors a WHERE e.child_hash = a.h AND e.parent_hash IS NOT NULL
-                )
-                SELECT h FROM ancestors WHERE h IS NOT NULL;
-                """
-                c_cursor = conn.execute(sql, (commit_hash,))
-                ancestor_commit_hashes = {r[0] for r in c_cursor.fetchall()}
-
-                if ancestor_commit_hashes:
-                    placeholders = ",".join("?" * len(ancestor_commit_hashes))
-                    sql_out = f"SELECT output_tree FROM nodes WHERE commit_hash IN ({placeholders})"
-                    out_cursor = conn.execute(sql_out, tuple(ancestor_commit_hashes))
-                    all_ancestor_trees.update(r[0] for r in out_cursor.fetchall())
-            return all_ancestor_trees
-
+            return {row[0] for row in conn.execute(sql, (start_output_tree_hash,))}
         except sqlite3.Error as e:
             logger.error(f"Failed to get ancestors for {start_output_tree_hash[:7]}: {e}")
             return set()
@@ -263,60 +325,190 @@ class SQLiteHistoryReader:
             logger.error(f"Failed to get private data for {node_commit_hash[:7]}: {e}")
             return None
 
+    def _select_in(self, sql: str, keys: List[str]) -> Dict[str, Any]:
+        # sql 须包含一个 {placeholders} 占位，并返回 (key, value) 两列
+        conn = self.db_manager._get_conn()
+        results: Dict[str, Any] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), self.IN_QUERY_CHUNK):
+            chunk = unique_keys[start : start + self.IN_QUERY_CHUNK]
+            cursor = conn.execute(sql.format(placeholders=",".join("?" * len(chunk))), chunk)
+            results.update((row[0], row[1]) for row in cursor.fetchall())
+        return results
+
+    def get_private_data_many(self, node_commit_hashes: List[str]) -> Dict[str, str]:
+        try:
+            return self._select_in(
+                "SELECT node_hash, intent_md FROM private_data WHERE node_hash IN ({placeholders})",
+                node_commit_hashes,
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Failed to get private data for {len(node_commit_hashes)} nodes: {e}")
+            return {}
+
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         return self._git_reader.get_node_blobs(commit_hash)
 
     def get_node_content(self, node: QuipuNode) -> str:
         if node.content:
             return node.content
-
-        commit_hash = node.commit_hash
-
-        # 尝试从 Git 加载内容
-        content = self._git_reader.get_node_content(node)
-
-        # 如果成功加载，回填到缓存
-        if content:
+        return self.get_node_contents([node]).get(node.commit_hash, "")
+
+    def get_node_contents(self, nodes: List[QuipuNode]) -> Dict[str, str]:
+        contents = {node.commit_hash: node.content for node in nodes if node.content}
+        pending = [node for node in nodes if node.commit_hash not in contents]
+        if not pending:
+            return contents
+
+        # 1. 一次查询取回已缓存的内容
+        cached = self.db_manager.get_cached_contents(node.commit_hash for node in pending)
+        for node in pending:
+            if node.commit_hash in cached:
+                node.content = cached[node.commit_hash]
+                contents[node.commit_hash] = node.content
+
+        # 2. 其余节点从 Git 批量加载，并在一个事务中写回缓存
+        misses = [node for node in pending if node.commit_hash not in contents]
+        if not misses:
+            return contents
+        loaded = self._git_reader.get_node_contents(misses)
+        contents.update(loaded)
+
+        backfill = [(commit_hash, content) for commit_hash, content in loaded.items() if content]
+        if backfill:
             try:
-                self.db_manager.execute_write(
-                    "UPDATE nodes SET plan_md_cache = ? WHERE commit_hash = ?", (content, commit_hash)
-                )
-                logger.debug(f"缓存已回填: {commit_hash[:7]}")
+                self.db_manager.store_contents(backfill)
+                logger.debug(f"缓存已回填: {len(backfill)} 个节点")
             except Exception as e:
-                logger.warning(f"回填缓存失败: {commit_hash[:7]}: {e}")
-
-        return content
+                logger.warning(f"批量回填缓存失败: {e}")
+        return contents
+
+    def _cat_contents(self, commit_hashes: List[str]) -> Dict[str, str]:
+        revs = [f"{commit_hash}:content.md" for commit_hash in commit_hashes]
+        blobs = self._git_reader.git_db.batch_cat_file(revs)
+        # 没有 content.md 的节点记为空字符串，避免每次搜索都重新读取
+        return {
+            commit_hash: blobs[rev].decode("utf-8", errors="ignore") if rev in blobs else ""
+            for commit_hash, rev in zip(commit_hashes, revs)
+        }
+
+    def _index_contents(self):
+        # 全文索引只覆盖已读取过的内容；首次内容搜索时批量补齐其余节点，之后的搜索直接命中索引。
+        # 优先使用内容缓存 (索引重建后无需再读 Git)，其余从 Git 读取；补齐的正文只写入索引，
+        # 不进入内容缓存，也不刷新访问时间，以免一次搜索挤掉缓存中的常用内容
+        conn = self.db_manager._get_conn()
+        missing = [row[0] for row in conn.execute("SELECT commit_hash FROM nodes WHERE NOT content_indexed;")]
+        if not missing:
+            return
+        logger.debug(f"正在为全文搜索索引 {len(missing)} 个节点的内容")
+        for start in range(0, len(missing), self.CONTENT_WARM_CHUNK):
+            chunk = missing[start : start + self.CONTENT_WARM_CHUNK]
+            contents = self.db_manager.get_cached_contents(chunk, touch=False)
+            misses = [commit_hash for commit_hash in chunk if commit_hash not in contents]
+            if misses:
+                try:
+                    contents.update(self._cat_contents(misses))
+                except Exception as e:
+                    logger.warning(f"批量读取节点内容失败: {e}")
+                    return
+            self.db_manager.store_contents(list(contents.items()), cache=False)
+
+    def _scan_contents(self, cursor: sqlite3.Cursor, terms: List[str], limit: int) -> List[sqlite3.Row]:
+        # trigram 无法匹配过短的词：按时间倒序逐批读取正文，在内存中做不区分大小写的子串匹配
+        terms = [term.lower() for term in terms]
+        rows: List[sqlite3.Row] = []
+        while len(rows) < limit:
+            batch = cursor.fetchmany(self.CONTENT_WARM_CHUNK)
+            if not batch:
+                break
+            commit_hashes = [row["commit_hash"] for row in batch]
+            contents = self.db_manager.get_cached_contents(commit_hashes)
+            misses = [commit_hash for commit_hash in commit_hashes if commit_hash not in contents]
+            if misses:
+                try:
+                    contents.update(self._cat_contents(misses))
+                except Exception as e:
+                    logger.warning(f"批量读取节点内容失败: {e}")
+            for row in batch:
+                # 词中不含空白，以换行分隔摘要与正文不会产生跨界匹配
+                text = f"{row['summary']}\n{contents.get(row['commit_hash'], '')}".lower()
+                if all(term in text for term in terms):
+                    rows.append(row)
+        return rows[:limit]
+
+    def _find_in_recent(
+        self, conn: sqlite3.Connection, conditions: List[str], params: List[Any], limit: int
+    ) -> Optional[List[sqlite3.Row]]:
+        # 若最新的一段节点中已能凑满结果，按时间倒序的前 limit 个必然就在其中，无需查询全文索引或扫描全表
+        rows = conn.execute(
+            "SELECT * FROM (SELECT * FROM nodes ORDER BY timestamp DESC LIMIT ?) AS nodes "
+            f"WHERE {' AND '.join(conditions)} ORDER BY nodes.timestamp DESC LIMIT ?",
+            (self.RECENT_WINDOW, *params, limit),
+        ).fetchall()
+        return rows if len(rows) >= limit else None
+
+    @staticmethod
+    def _fts_phrase(text: str) -> str:
+        return '"' + text.replace('"', '""') + '"'
 
     def find_nodes(
         self,
         summary_regex: Optional[str] = None,
         node_type: Optional[str] = None,
         limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]:
-        query = "SELECT * FROM nodes"
         conditions = []
-        params = []
+        params: List[Any] = []
+        # FTS5 MATCH 表达式的各个部分，以 AND 连接
+        match_parts: List[str] = []
+        fts_enabled = self.db_manager.fts_enabled
+        if fts_enabled:
+            self.db_manager.refresh_fts()
 
         if node_type:
-            conditions.append("node_type = ?")
+            conditions.append("nodes.node_type = ?")
             params.append(node_type)
 
-        # 注意: 标准 SQLite 不支持 REGEXP。
-        # 此处使用 LIKE 实现简单的子字符串匹配作为替代。
-        # 完整的正则支持需要加载扩展或在 Python 端进行二次过滤。
         if summary_regex:
-            conditions.append("summary LIKE ?")
-            params.append(f"%{summary_regex}%")
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limit)
+            try:
+                re.compile(summary_regex)
+            except re.error as e:
+                logger.error(f"无效的正则表达式: {summary_regex} ({e})")
+                return []
+            # REGEXP 保证精确的正则语义 (与 Git 后端一致，不区分大小写)
+            conditions.append("nodes.summary REGEXP ?")
+            params.append(f"(?i){summary_regex}")
+            # 不含元字符的模式即是子串，可先用索引缩小候选范围
+            if fts_enabled and len(summary_regex) >= self.FTS_MIN_TERM and not _REGEX_META.search(summary_regex):
+                match_parts.append(f"summary : {self._fts_phrase(summary_regex)}")
+
+        terms = content_query.split() if content_query else []
+        ranked = False
+        if terms and fts_enabled and all(len(term) >= self.FTS_MIN_TERM for term in terms):
+            self._index_contents()
+            match_parts.extend(self._fts_phrase(term) for term in terms)
+            ranked = True
 
         conn = self.db_manager._get_conn()
-        cursor = conn.execute(query, tuple(params))
-        rows = cursor.fetchall()
+        if terms and not ranked:
+            query = "SELECT nodes.* FROM nodes"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            rows = self._scan_contents(conn.execute(query + " ORDER BY nodes.timestamp DESC", params), terms, limit)
+        else:
+            rows = self._find_in_recent(conn, conditions, params, limit) if conditions and not ranked else None
+        if rows is None:
+            query = "SELECT nodes.* FROM nodes"
+            if match_parts:
+                query += " JOIN nodes_fts ON nodes_fts.rowid = nodes.rowid"
+                conditions = ["nodes_fts MATCH ?", *conditions]
+                params = [" AND ".join(match_parts), *params]
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            # 内容搜索按 bm25 相关度排序，其余按时间倒序
+            query += " ORDER BY nodes_fts.rank LIMIT ?" if ranked else " ORDER BY nodes.timestamp DESC LIMIT ?"
+            rows = conn.execute(query, (*params, limit)).fetchall()
 
         # 将查询结果行映射回 QuipuNode 对象 (不含父子关系)
         results = []
@@ -329,7 +521,6 @@ class SQLiteHistoryReader:
                 filename=Path(f".quipu/git_objects/{row['commit_hash']}"),
                 node_type=row["node_type"],
                 summary=row["summary"],
-                content=row["plan_md_cache"] if row["plan_md_cache"] is not None else "",
                 owner_id=row["owner_id"],
             )
             results.append(node)
@@ -341,6 +532,8 @@ class SQLiteHistoryWriter:
     def __init__(self, git_writer: GitObjectHistoryWriter, db_manager: DatabaseManager):
         self.git_writer = git_writer
         self.db_manager = db_manager
+        # nodes 表 (及 hydration) 即是 output_tree -> commit 索引，父节点反查直接走 IDX_nodes_output_tree
+        self.git_writer.parent_resolver = db_manager.get_commit_by_output_tree
 
     def create_node(
         self,
@@ -362,7 +555,7 @@ class SQLiteHistoryWriter:
             start_time = kwargs.get("start_time", git_node.timestamp.timestamp())
             summary = self.git_writer._generate_summary(node_type, content, input_tree, output_tree, **kwargs)
             metadata = {
-                "meta_version": "1.0",
+                "meta_version": self.git_writer.META_VERSION,
                 "summary": summary,
                 "type": node_type,
                 "generator": self.git_writer._get_generator_info(),
@@ -372,13 +565,19 @@ class SQLiteHistoryWriter:
             meta_json_str = json.dumps(metadata)
 
             # 2.2 写入 'nodes' 表
+            # 使用 upsert 而非 REPLACE：REPLACE 会先删除旧行，既不触发全文索引的删除触发器，也会级联删除边
             owner_id = kwargs.get("owner_id", "unknown-local-user")
             self.db_manager.execute_write(
                 """
-                INSERT OR REPLACE INTO nodes
+                INSERT INTO nodes
                 (commit_hash, owner_id, output_tree, node_type, timestamp, summary,
-                 generator_id, meta_json, plan_md_cache)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 generator_id, meta_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (commit_hash) DO UPDATE SET
+                    owner_id = excluded.owner_id, output_tree = excluded.output_tree,
+                    node_type = excluded.node_type, timestamp = excluded.timestamp,
+                    summary = excluded.summary, generator_id = excluded.generator_id,
+                    meta_json = excluded.meta_json
                 """,
                 (
                     commit_hash,
@@ -389,9 +588,10 @@ class SQLiteHistoryWriter:
                     summary,
                     metadata["generator"]["id"],
                     meta_json_str,
-                    content,  # 热缓存: 新创建的节点内容直接写入缓存
                 ),
             )
+            # 热缓存: 新创建的节点内容直接写入缓存与全文索引
+            self.db_manager.store_contents([(commit_hash, content)])
 
             # 2.3 写入 'edges' 表
             # 关键修改：直接使用 GitWriter 传递回来的确切父节点信息，不再进行 Tree 反查
@@ -402,7 +602,10 @@ class SQLiteHistoryWriter:
                     (commit_hash, parent_commit_hash),
                 )
 
-            # 2.4 (未来) 写入 'private_data' 表
+            # 2.4 未编号的节点积累过多时重新编号 lineage
+            self.db_manager.refresh_lineage()
+
+            # 2.5 (未来) 写入 'private_data' 表
             # intent = kwargs.get("intent_md")
             # if intent: ...
 
@@ -6,6 +6,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from quipu.common.identity import get_user_id_from_email
 from quipu.spec.constants import EMPTY_TREE_HASH
+from quipu.spec.models.compact_graph import CompactGraph, NodeView
 from quipu.spec.models.graph import QuipuNode
 from quipu.spec.protocols.storage import HistoryReader, HistoryWriter
 
@@ -85,15 +86,63 @@ class Engine:
         self.reader = reader
         self.writer = writer
         self.db_manager = db_manager  # 持有数据库管理器引用
-        self.history_graph: Dict[str, QuipuNode] = {}
+        self._history_graph: Optional[Dict[str, QuipuNode]] = None
+        # 本引擎创建的节点；对齐或加载完整图时代替存储中的副本，使调用方持有的节点对象仍在图中
+        self._created_nodes: Dict[str, QuipuNode] = {}
         self.current_node: Optional[QuipuNode] = None
+        self._compact_graph: Optional[CompactGraph] = None
 
         if isinstance(db, GitDB):
             self._sync_persistent_ignores()
 
+    @property
+    def compact_graph(self) -> CompactGraph:
+        # 按需由 reader 直接构建紧凑图，不经过 history_graph 中的 QuipuNode；历史变化后失效
+        if self._compact_graph is None:
+            self._compact_graph = self.reader.load_compact_graph()
+        return self._compact_graph
+
+    @property
+    def history_graph(self) -> Dict[str, QuipuNode]:
+        # 完整的 QuipuNode 图只在调用方确实需要时才加载；对齐、检出与导航只使用紧凑图
+        if self._history_graph is None:
+            graph = {node.commit_hash: node for node in self.reader.load_all_nodes()}
+            for node in self._created_nodes.values():
+                loaded = graph.get(node.commit_hash)
+                if loaded is not None:
+                    self._graft(loaded, node)
+                    graph[node.commit_hash] = node
+            self._history_graph = graph
+        return self._history_graph
+
+    @history_graph.setter
+    def history_graph(self, graph: Dict[str, QuipuNode]):
+        self._history_graph = graph
+
+    @staticmethod
+    def _graft(loaded: QuipuNode, node: QuipuNode):
+        node.parent, node.children = loaded.parent, loaded.children
+        if node.parent:
+            siblings = node.parent.children
+            siblings[siblings.index(loaded)] = node
+        for child in node.children:
+            child.parent = node
+
+    def _to_node(self, view: NodeView) -> QuipuNode:
+        # 已加载完整图时返回其中带父子关系的节点，否则只物化这一个节点
+        if self._history_graph is not None and view.commit_hash in self._history_graph:
+            return self._history_graph[view.commit_hash]
+        return self._created_nodes.get(view.commit_hash) or view.materialize()
+
+    def _invalidate_graphs(self):
+        self._history_graph = None
+        self._compact_graph = None
+
     def close(self):
         if self.db_manager:
             self.db_manager.close()
+        if isinstance(self.git_db, GitDB):
+            self.git_db.close()
 
     def _get_current_user_id(self) -> str:
         # 1. 尝试从 Quipu 配置中读取
@@ -222,18 +271,18 @@ class Engine:
             except Exception as e:
                 logger.error(f"❌ 自动数据补水失败: {e}", exc_info=True)
 
-        all_nodes = self.reader.load_all_nodes()
-        self.history_graph = {node.commit_hash: node for node in all_nodes}
-        if all_nodes:
-            logger.info(f"从存储中加载了 {len(all_nodes)} 个历史事件，形成 {len(self.history_graph)} 个唯一状态节点。")
+        self._invalidate_graphs()
+        graph = self.compact_graph
+        if len(graph):
+            logger.info(f"从存储中加载了 {len(graph)} 个历史事件。")
 
         current_hash = self.git_db.get_tree_hash()
-        if current_hash == EMPTY_TREE_HASH and not self.history_graph:
+        if current_hash == EMPTY_TREE_HASH and not len(graph):
             logger.info("✅ 状态对齐：检测到创世状态 (空仓库)。")
             self.current_node = None
             return "CLEAN"
 
-        matches = [node for node in self.history_graph.values() if node.output_tree == current_hash]
+        matches = [view for view in graph if view.output_tree == current_hash]
         if matches:
             matches.sort(key=lambda n: (1 if n.parent else 0, n.timestamp), reverse=True)
             found_node = matches[0]
@@ -241,13 +290,13 @@ class Engine:
             found_node = None
 
         if found_node:
-            self.current_node = found_node
+            self.current_node = self._to_node(found_node)
             logger.info(f"✅ 状态对齐：当前工作区匹配节点 {self.current_node.short_hash}")
             self._write_head(current_hash)
             return "CLEAN"
 
         logger.warning(f"⚠️  状态漂移：当前 Tree Hash {current_hash[:7]} 未在历史中找到。")
-        if not self.history_graph:
+        if not len(graph):
             return "ORPHAN"
         return "DIRTY"
 
@@ -256,11 +305,13 @@ class Engine:
         summary_regex: Optional[str] = None,
         node_type: Optional[str] = None,
         limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]:
         return self.reader.find_nodes(
             summary_regex=summary_regex,
             node_type=node_type,
             limit=limit,
+            content_query=content_query,
         )
 
     def capture_drift(self, current_hash: str, message: Optional[str] = None) -> QuipuNode:
@@ -271,17 +322,16 @@ class Engine:
         head_tree_hash = self._read_head()
         parent_node = None
 
+        graph = self.compact_graph
         if head_tree_hash:
             # 正确的逻辑：遍历节点，用 output_tree 匹配 head 的 tree hash
-            parent_node = next(
-                (node for node in self.history_graph.values() if node.output_tree == head_tree_hash), None
-            )
+            parent_node = next((view for view in graph if view.output_tree == head_tree_hash), None)
 
         if parent_node:
             input_hash = parent_node.output_tree
-        elif self.history_graph:
+        elif len(graph):
             # 只有当 HEAD 指针无效或丢失时，才执行回退逻辑
-            last_node = max(self.history_graph.values(), key=lambda node: node.timestamp)
+            last_node = max(graph, key=lambda node: node.timestamp)
             input_hash = last_node.output_tree
             logger.warning(
                 f"⚠️  HEAD 指针 '{head_tree_hash[:7] if head_tree_hash else 'N/A'}' 无效或丢失，"
@@ -308,13 +358,7 @@ class Engine:
             owner_id=user_id,
         )
 
-        if new_node.parent and new_node.parent.commit_hash in self.history_graph:
-            real_parent = self.history_graph[new_node.parent.commit_hash]
-            new_node.parent = real_parent
-            if new_node not in real_parent.children:
-                real_parent.children.append(new_node)
-
-        self.history_graph[new_node.commit_hash] = new_node
+        self._add_to_history(new_node)
         self.current_node = new_node
         self._write_head(current_hash)
         self._append_nav(current_hash)
@@ -322,6 +366,19 @@ class Engine:
         logger.info(f"✅ 捕获完成，新节点已创建: {new_node.filename.name}")
         return new_node
 
+    def _add_to_history(self, new_node: QuipuNode):
+        # 完整图尚未加载时无需维护，下次访问时会从存储中重新加载
+        graph = self._history_graph
+        if graph is not None:
+            if new_node.parent and new_node.parent.commit_hash in graph:
+                real_parent = graph[new_node.parent.commit_hash]
+                new_node.parent = real_parent
+                if new_node not in real_parent.children:
+                    real_parent.children.append(new_node)
+            graph[new_node.commit_hash] = new_node
+        self._created_nodes[new_node.commit_hash] = new_node
+        self._compact_graph = None
+
     def create_plan_node(
         self, input_tree: str, output_tree: str, plan_content: str, summary_override: Optional[str] = None
     ) -> QuipuNode:
@@ -341,13 +398,7 @@ class Engine:
             owner_id=user_id,
         )
 
-        if new_node.parent and new_node.parent.commit_hash in self.history_graph:
-            real_parent = self.history_graph[new_node.parent.commit_hash]
-            new_node.parent = real_parent
-            if new_node not in real_parent.children:
-                real_parent.children.append(new_node)
-
-        self.history_graph[new_node.commit_hash] = new_node
+        self._add_to_history(new_node)
         self.current_node = new_node
         self._write_head(output_tree)
         self._append_nav(output_tree)
@@ -356,16 +407,17 @@ class Engine:
         return new_node
 
     def checkout(self, target_hash: str):
-        # 获取切换前的 tree hash 作为 "old_tree"
-        current_head_hash = self._read_head()
+        # 以工作区的真实状态作为 "old_tree"，而不是 HEAD 记录：
+        # 例如 discard 时 HEAD 已指向目标，但工作区中仍有需要删除的新文件
+        current_tree_hash = self.git_db.get_tree_hash()
 
-        # 调用已优化的 checkout_tree 方法
-        self.git_db.checkout_tree(new_tree_hash=target_hash, old_tree_hash=current_head_hash)
+        # 调用已优化的 checkout_tree 方法，只处理两个快照之间的差异
+        self.git_db.checkout_tree(new_tree_hash=target_hash, old_tree_hash=current_tree_hash)
 
         self._write_head(target_hash)
         self.current_node = None
-        for node in self.history_graph.values():
-            if node.output_tree == target_hash:
-                self.current_node = node
+        for view in self.compact_graph:
+            if view.output_tree == target_hash:
+                self.current_node = self._to_node(view)
                 break
         logger.info(f"🔄 状态已切换至: {target_hash[:7]}")
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from quipu.engine.sqlite_db import DatabaseManager
+
+NODE_SQL = (
+    "INSERT INTO nodes (commit_hash, output_tree, node_type, timestamp, summary, meta_json) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def _node(i: int) -> tuple:
+    return (f"{i:040x}", "a" * 40, "plan", float(i), f"Node {i}", "{}")
+
+
+@pytest.fixture
+def db_manager(tmp_path: Path):
+    manager = DatabaseManager(tmp_path, busy_timeout=0.5)
+    manager.init_schema()
+    yield manager
+    manager.close()
+
+
+class TestConnectionPool:
+    def test_schema_init_enables_wal(self, db_manager):
+        mode = db_manager._get_conn().execute("PRAGMA journal_mode;").fetchone()[0]
+        assert mode == "wal"
+
+    def test_read_connections_are_per_thread(self, db_manager):
+        main_conn = db_manager._get_conn()
+        assert db_manager._get_conn() is main_conn
+
+        other = []
+        worker = threading.Thread(target=lambda: other.append(db_manager._get_conn()))
+        worker.start()
+        worker.join()
+
+        assert other[0] is not main_conn
+        assert other[0] is not db_manager._write_conn
+
+    def test_open_write_does_not_block_readers(self, db_manager, tmp_path):
+        db_manager.execute_write(NODE_SQL, _node(1))
+        # 另一个 DatabaseManager 模拟并发的第二个进程 (例如 `quipu ui`)
+        other_process = DatabaseManager(tmp_path, busy_timeout=0.5)
+        try:
+            with db_manager._writing() as conn:
+                conn.execute(NODE_SQL, _node(2))
+                start = time.monotonic()
+                # 写事务尚未提交：读者看到提交前的快照，且不需要等待锁
+                assert other_process.get_all_node_hashes() == {f"{1:040x}"}
+                assert db_manager.get_all_node_hashes() == {f"{1:040x}"}
+                assert time.monotonic() - start < 0.5
+            assert len(other_process.get_all_node_hashes()) == 2
+        finally:
+            other_process.close()
+
+    def test_concurrent_writers_are_serialized(self, db_manager):
+        errors = []
+
+        def write_batch(offset: int):
+            try:
+                for i in range(20):
+                    db_manager.execute_write(NODE_SQL, _node(offset + i))
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=write_batch, args=(n * 100,)) for n in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert errors == []
+        assert len(db_manager.get_all_node_hashes()) == 80
+
+    def test_close_releases_all_connections(self, db_manager):
+        db_manager._get_conn()
+        db_manager.execute_write(NODE_SQL, _node(1))
+        db_manager.close()
+
+        assert db_manager._read_conns == {}
+        assert db_manager._write_conn is None
+        # 关闭后再次使用时按需重新连接
+        assert db_manager.get_all_node_hashes() == {f"{1:040x}"}
+
+
+def _hash(i: int) -> str:
+    return f"{i:040x}"
+
+
+class TestLineage:
+    def _labels(self, db_manager) -> dict:
+        rows = db_manager._get_conn().execute("SELECT commit_hash, pre, size FROM lineage;")
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def _chain(self, db_manager, start: int, count: int, parent=None):
+        nodes, edges = [], []
+        for i in range(start, start + count):
+            nodes.append((_hash(i), "user", "a" * 40, "plan", float(i), f"Node {i}", None, "{}"))
+            if parent is not None:
+                edges.append((_hash(i), _hash(parent)))
+            parent = i
+        db_manager.insert_nodes_and_edges(nodes, edges)
+
+    def test_relabel_assigns_preorder_intervals(self, db_manager):
+        self._chain(db_manager, 0, 3)
+        self._chain(db_manager, 10, 2, parent=0)
+        # 未达到阈值时新节点保持未编号
+        db_manager.refresh_lineage()
+        assert set(self._labels(db_manager).values()) == {(None, None)}
+
+        db_manager.refresh_lineage(force=True)
+        labels = self._labels(db_manager)
+        assert labels[_hash(0)] == (0, 5)
+        # 每个分支的区间恰好覆盖它的后代
+        for first, second in ((1, 2), (10, 11)):
+            assert labels[_hash(first)][1] == 2
+            assert labels[_hash(second)] == (labels[_hash(first)][0] + 1, 1)
+
+    def test_merge_nodes_and_descendants_stay_unlabeled(self, db_manager, monkeypatch):
+        self._chain(db_manager, 0, 2)
+        self._chain(db_manager, 10, 1, parent=0)
+        self._chain(db_manager, 20, 2, parent=1)
+        db_manager.execute_write("INSERT INTO edges (child_hash, parent_hash) VALUES (?, ?)", (_hash(20), _hash(10)))
+
+        db_manager.refresh_lineage(force=True)
+        labels = self._labels(db_manager)
+        assert labels[_hash(20)] == (None, 0)
+        assert labels[_hash(21)] == (None, 0)
+        assert labels[_hash(10)][0] is not None
+
+        # 无法编号的节点不算作待编号，不会导致每次都重新编号
+        calls = []
+        monkeypatch.setattr(db_manager, "LINEAGE_RELABEL_THRESHOLD", 0)
+        monkeypatch.setattr(db_manager, "_relabel_lineage", calls.append)
+        db_manager.refresh_lineage()
+        assert calls == []
+
+    def test_structural_changes_invalidate_labels(self, db_manager):
+        self._chain(db_manager, 0, 3)
+        self._chain(db_manager, 10, 1)
+        db_manager.refresh_lineage(force=True)
+
+        # 为已编号的节点追加父边后，所有编号作废
+        db_manager.execute_write("INSERT INTO edges (child_hash, parent_hash) VALUES (?, ?)", (_hash(10), _hash(2)))
+        assert set(self._labels(db_manager).values()) == {(None, None)}
+
+        db_manager.refresh_lineage(force=True)
+        db_manager.execute_write("DELETE FROM nodes WHERE commit_hash = ?", (_hash(10),))
+        assert set(self._labels(db_manager).values()) == {(None, None)}
+        assert len(self._labels(db_manager)) == 3
+
+        # 一次删除多个节点同样使编号作废
+        db_manager.refresh_lineage(force=True)
+        db_manager.execute_write("DELETE FROM nodes WHERE commit_hash != ?", (_hash(0),))
+        assert self._labels(db_manager) == {_hash(0): (None, None)}
+
+    def test_existing_database_is_backfilled(self, db_manager):
+        self._chain(db_manager, 0, 3)
+        with db_manager._writing() as conn:
+            for name in ("lineage_insert", "lineage_node_delete", "lineage_edge_insert", "lineage_edge_delete"):
+                conn.execute(f"DROP TRIGGER {name}")
+            conn.execute("DROP TABLE lineage")
+
+        db_manager.init_schema()
+        assert set(self._labels(db_manager)) == {_hash(0), _hash(1), _hash(2)}
+
+
+class TestContentCache:
+    def _nodes(self, db_manager, count: int):
+        db_manager.batch_insert_nodes(
+            [(_hash(i), "user", "a" * 40, "plan", float(i), f"Node {i}", None, "{}") for i in range(count)]
+        )
+
+    def _cache_rows(self, db_manager) -> dict:
+        rows = db_manager._get_conn().execute("SELECT blob_hash, size, accessed FROM content_cache;")
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def test_contents_are_compressed_and_deduplicated(self, db_manager):
+        self._nodes(db_manager, 3)
+        plan = "重复的计划内容\n" * 200
+        db_manager.store_contents([(_hash(0), plan), (_hash(1), plan), (_hash(2), "另一份计划")])
+
+        # 相同内容只存一份，以 git blob 哈希为键，并按压缩后的大小计入预算
+        data = plan.encode("utf-8")
+        blob_hash = hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+        rows = self._cache_rows(db_manager)
+        assert len(rows) == 2
+        assert rows[blob_hash][0] < len(data) // 10
+        assert db_manager.get_cached_contents([_hash(0), _hash(1), _hash(2)]) == {
+            _hash(0): plan,
+            _hash(1): plan,
+            _hash(2): "另一份计划",
+        }
+
+    def test_least_recently_used_contents_are_evicted(self, db_manager, monkeypatch):
+        self._nodes(db_manager, 4)
+        # 随机内容压缩后大小相近；预算可容纳两条，第三条写入时需要淘汰一条
+        contents = {_hash(i): os.urandom(500).hex() for i in range(3)}
+        clock = iter(range(100, 200))
+        monkeypatch.setattr(time, "time", lambda: float(next(clock)))
+        monkeypatch.setattr(db_manager, "CONTENT_TOUCH_INTERVAL", 0)
+
+        db_manager.store_contents([(_hash(0), contents[_hash(0)])])
+        entry_size = sum(size for size, _ in self._cache_rows(db_manager).values())
+        db_manager.content_cache_bytes = entry_size * 5 // 2
+        db_manager.store_contents([(_hash(1), contents[_hash(1)])])
+        # 读取使 0 比 1 更新，超出预算时先淘汰 1
+        assert db_manager.get_cached_contents([_hash(0)]) == {_hash(0): contents[_hash(0)]}
+        db_manager.store_contents([(_hash(2), contents[_hash(2)])])
+
+        assert set(db_manager.get_cached_contents(contents)) == {_hash(0), _hash(2)}
+        assert sum(size for size, _ in self._cache_rows(db_manager).values()) <= db_manager.content_cache_bytes
+
+    def test_recent_reads_do_not_rewrite_access_time(self, db_manager, monkeypatch):
+        self._nodes(db_manager, 1)
+        db_manager.store_contents([(_hash(0), "plan")])
+        writes = []
+        monkeypatch.setattr(db_manager, "execute_write_many", lambda sql, params: writes.append(params))
+
+        assert db_manager.get_cached_contents([_hash(0)]) == {_hash(0): "plan"}
+        assert writes == []
+
+    def _fts_match(self, db_manager, phrase: str) -> int:
+        conn = db_manager._get_conn()
+        return conn.execute("SELECT COUNT(*) FROM nodes_fts WHERE nodes_fts MATCH ?", (f'"{phrase}"',)).fetchone()[0]
+
+    def test_deleting_summary_only_nodes_updates_index_in_place(self, db_manager):
+        self._nodes(db_manager, 3)
+        db_manager.execute_write("DELETE FROM nodes WHERE commit_hash != ?", (_hash(2),))
+
+        conn = db_manager._get_conn()
+        assert conn.execute("SELECT COUNT(*) FROM nodes_fts_stale").fetchone()[0] == 0
+        assert self._fts_match(db_manager, "Node 0") == 0
+        assert self._fts_match(db_manager, "Node 2") == 1
+
+    def test_rebuild_resets_index_flag_but_keeps_cache(self, db_manager):
+        self._nodes(db_manager, 3)
+        db_manager.store_contents([(_hash(i), f"计划正文 {i}") for i in range(3)])
+
+        # 已索引正文的节点被删除时只标记过期，由 refresh_fts 统一重建一次
+        db_manager.execute_write("DELETE FROM nodes WHERE commit_hash != ?", (_hash(2),))
+        conn = db_manager._get_conn()
+        assert conn.execute("SELECT COUNT(*) FROM nodes_fts_stale").fetchone()[0] == 1
+        db_manager.refresh_fts()
+
+        assert conn.execute("SELECT COUNT(*) FROM nodes_fts_stale").fetchone()[0] == 0
+        assert conn.execute("SELECT SUM(content_indexed) FROM nodes").fetchone()[0] == 0
+        assert self._fts_match(db_manager, "Node 0") == 0
+        assert self._fts_match(db_manager, "Node 2") == 1
+        assert db_manager.get_cached_contents([_hash(2)]) == {_hash(2): "计划正文 2"}
+
+        db_manager.store_contents([(_hash(2), "计划正文 2")], cache=False)
+        assert self._fts_match(db_manager, "计划正文") == 1
+
+    def test_legacy_plan_md_cache_is_migrated(self, db_manager):
+        self._nodes(db_manager, 2)
+        # 模拟旧版 schema：内容缓存存放在 nodes.plan_md_cache，全文索引以 nodes 为外部内容
+        with db_manager._writing() as conn:
+            for name in ("nodes_fts_insert", "nodes_fts_delete", "nodes_fts_update"):
+                conn.execute(f"DROP TRIGGER {name}")
+            conn.execute("DROP TABLE nodes_fts")
+            conn.execute("UPDATE nodes SET content_hash = NULL")
+            conn.execute("ALTER TABLE nodes ADD COLUMN plan_md_cache TEXT")
+            conn.execute("UPDATE nodes SET plan_md_cache = ? WHERE commit_hash = ?", ("旧的缓存内容", _hash(0)))
+            conn.execute(
+                "CREATE VIRTUAL TABLE nodes_fts USING fts5(summary, plan_md_cache, content='nodes', tokenize='trigram')"
+            )
+
+        db_manager.init_schema()
+
+        conn = db_manager._get_conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(nodes);")}
+        assert "plan_md_cache" not in columns
+        assert db_manager.get_cached_contents([_hash(0), _hash(1)]) == {_hash(0): "旧的缓存内容"}
+        matches = conn.execute("SELECT rowid FROM nodes_fts WHERE nodes_fts MATCH ?", ('"缓存内容"',)).fetchall()
+        assert len(matches) == 1
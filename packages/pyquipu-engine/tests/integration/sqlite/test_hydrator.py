@@ -1,7 +1,11 @@
+import json
+import sqlite3
 import subprocess
 from pathlib import Path
+from unittest.mock import MagicMock, call
 
 import pytest
+from needle.pointer import L
 from quipu.engine.git_db import GitDB
 from quipu.engine.git_object_storage import GitObjectHistoryWriter
 from quipu.engine.hydrator import Hydrator
@@ -53,7 +57,7 @@ class TestHydration:
         # 验证 Node B 的内容
         node_b_row = conn.execute("SELECT * FROM nodes WHERE summary = ?", ("Node B",)).fetchone()
         assert node_b_row is not None
-        assert node_b_row["plan_md_cache"] is None  # 必须是冷数据
+        assert db_manager.get_cached_contents([node_b_row["commit_hash"]]) == {}  # 必须是冷数据
 
         # 验证边关系
         edge_row = conn.execute("SELECT * FROM edges WHERE child_hash = ?", (node_b_row["commit_hash"],)).fetchone()
@@ -96,3 +100,186 @@ class TestHydration:
         hydrator.sync("test-user")
 
         assert len(db_manager.get_all_node_hashes()) == 1
+
+    def test_hydration_labels_lineage(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        monkeypatch.setattr(db_manager, "LINEAGE_RELABEL_THRESHOLD", 1)
+        input_tree = "genesis"
+        for name in ("a", "b"):
+            (repo / f"{name}.txt").touch()
+            output_tree = git_db.get_tree_hash()
+            writer.create_node("plan", input_tree, output_tree, f"Node {name}")
+            input_tree = output_tree
+
+        hydrator.sync("test-user")
+
+        rows = db_manager._get_conn().execute("SELECT pre, size FROM lineage ORDER BY pre").fetchall()
+        assert [tuple(row) for row in rows] == [(0, 2), (1, 1)]
+
+    def test_trailer_nodes_skip_object_reads(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+
+        # 一个旧格式 (1.0) 节点与一个带完整 trailer 的新节点
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        with monkeypatch.context() as m:
+            m.setattr(
+                writer,
+                "_build_commit_message",
+                lambda summary, output_tree, *_: f"{summary}\n\nX-Quipu-Output-Tree: {output_tree}",
+            )
+            legacy = writer.create_node("plan", "genesis", hash_a, "Legacy Node", start_time=1000)
+        (repo / "b.txt").touch()
+        hash_b = git_db.get_tree_hash()
+        current = writer.create_node("plan", hash_a, hash_b, "Trailer Node", start_time=2000, owner_id="alice")
+
+        cat_requests = []
+        original_iter = git_db.iter_cat_file
+        monkeypatch.setattr(git_db, "iter_cat_file", lambda objs: cat_requests.extend(objs) or original_iter(objs))
+        hydrator.sync("test-user")
+
+        # 只有旧节点需要读取 tree 与 metadata.json
+        assert len(cat_requests) == 2
+        conn = db_manager._get_conn()
+        rows = {r["commit_hash"]: r for r in conn.execute("SELECT * FROM nodes").fetchall()}
+        assert rows[legacy.commit_hash]["summary"] == "Legacy Node"
+        row = rows[current.commit_hash]
+        assert (row["summary"], row["node_type"], row["timestamp"]) == ("Trailer Node", "plan", 2000.0)
+        assert row["generator_id"] == "manual"
+        assert json.loads(row["meta_json"])["meta_version"] == "1.1"
+        edge = conn.execute("SELECT parent_hash FROM edges WHERE child_hash = ?", (current.commit_hash,)).fetchone()
+        assert edge["parent_hash"] == legacy.commit_hash
+
+
+class TestHydrationWatermark:
+    def test_unchanged_refs_skip_history_walk(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        node_a = writer.create_node("plan", "genesis", git_db.get_tree_hash(), "Node A")
+        hydrator.sync("test-user")
+
+        assert db_manager.get_hydration_refs() == {f"refs/quipu/local/heads/{node_a.commit_hash}": node_a.commit_hash}
+
+        monkeypatch.setattr(git_db, "iter_log", lambda revs: pytest.fail("unexpected git log"))
+        monkeypatch.setattr(db_manager, "get_existing_node_hashes", lambda hashes: pytest.fail("unexpected query"))
+        hydrator.sync("test-user")
+
+    def test_new_refs_walk_only_new_commits(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        hash_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", "genesis", hash_a, "Node A")
+        hydrator.sync("test-user")
+
+        (repo / "b.txt").touch()
+        node_b = writer.create_node("plan", hash_a, git_db.get_tree_hash(), "Node B")
+
+        walked = []
+        original_iter_log = git_db.iter_log
+
+        def recording_iter_log(revisions):
+            for entry in original_iter_log(revisions):
+                walked.append(entry["hash"])
+                yield entry
+
+        monkeypatch.setattr(git_db, "iter_log", recording_iter_log)
+        hydrator.sync("test-user")
+
+        # 已补水的 A 被排除在遍历之外
+        assert walked == [node_b.commit_hash]
+        assert db_manager.get_all_node_hashes() == {node_a.commit_hash, node_b.commit_hash}
+        assert node_b.commit_hash in db_manager.get_hydration_refs().values()
+        # 指向遍历边界之外 (已补水) 父节点的边同样被写入
+        conn = db_manager._get_conn()
+        edge = conn.execute("SELECT parent_hash FROM edges WHERE child_hash = ?", (node_b.commit_hash,)).fetchone()
+        assert edge["parent_hash"] == node_a.commit_hash
+
+    def test_failed_hydration_keeps_old_watermark(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        (repo / "a.txt").touch()
+        writer.create_node("plan", "genesis", git_db.get_tree_hash(), "Node A")
+
+        def failing_insert(nodes, edges):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        with monkeypatch.context() as m:
+            m.setattr(db_manager, "insert_nodes_and_edges", failing_insert)
+            with pytest.raises(sqlite3.OperationalError):
+                hydrator.sync("test-user")
+        assert db_manager.get_hydration_refs() == {}
+
+        # 下一次补水重新处理同一段历史
+        hydrator.sync("test-user")
+        assert len(db_manager.get_all_node_hashes()) == 1
+
+
+class TestChunkedHydration:
+    def _build_chain(self, writer, git_db, repo, count):
+        nodes = []
+        input_tree = "genesis"
+        for i in range(count):
+            (repo / f"{i}.txt").touch()
+            output_tree = git_db.get_tree_hash()
+            nodes.append(writer.create_node("plan", input_tree, output_tree, f"Node {i}", start_time=1000 + i))
+            input_tree = output_tree
+        return nodes
+
+    def test_hydration_is_written_in_chunks(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        nodes = self._build_chain(writer, git_db, repo, 5)
+        monkeypatch.setattr(hydrator, "CHUNK_SIZE", 2)
+        mock_bus = MagicMock()
+        monkeypatch.setattr("quipu.engine.hydrator.bus", mock_bus)
+
+        chunks = []
+        original_insert = db_manager.insert_nodes_and_edges
+
+        def recording_insert(node_rows, edge_rows):
+            chunks.append([row[0] for row in node_rows])
+            original_insert(node_rows, edge_rows)
+
+        monkeypatch.setattr(db_manager, "insert_nodes_and_edges", recording_insert)
+        hydrator.sync("test-user")
+
+        # 父节点优先：每个分块的边都指向已写入的节点
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        assert sum(chunks, []) == [n.commit_hash for n in nodes]
+        conn = db_manager._get_conn()
+        assert conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0] == 4
+        assert mock_bus.info.call_args_list[-1] == call(L.engine.hydrator.info.progress, done=5, total=5)
+
+    def test_interrupted_hydration_resumes(self, hydrator_setup, monkeypatch):
+        hydrator, writer, git_db, db_manager, repo = hydrator_setup
+        nodes = self._build_chain(writer, git_db, repo, 5)
+        monkeypatch.setattr(hydrator, "CHUNK_SIZE", 2)
+        monkeypatch.setattr("quipu.engine.hydrator.bus", MagicMock())
+
+        original_insert = db_manager.insert_nodes_and_edges
+        inserted = []
+
+        def crashing_insert(node_rows, edge_rows):
+            if inserted:
+                raise sqlite3.OperationalError("disk I/O error")
+            inserted.append([row[0] for row in node_rows])
+            original_insert(node_rows, edge_rows)
+
+        with monkeypatch.context() as m:
+            m.setattr(db_manager, "insert_nodes_and_edges", crashing_insert)
+            with pytest.raises(sqlite3.OperationalError):
+                hydrator.sync("test-user")
+        # 第一个分块已提交，水位未前进
+        assert db_manager.get_all_node_hashes() == {n.commit_hash for n in nodes[:2]}
+        assert db_manager.get_hydration_refs() == {}
+
+        resumed = []
+
+        def recording_insert(node_rows, edge_rows):
+            resumed.extend(row[0] for row in node_rows)
+            original_insert(node_rows, edge_rows)
+
+        monkeypatch.setattr(db_manager, "insert_nodes_and_edges", recording_insert)
+        hydrator.sync("test-user")
+
+        # 只补水剩余的节点
+        assert resumed == [n.commit_hash for n in nodes[2:]]
+        assert db_manager.get_all_node_hashes() == {n.commit_hash for n in nodes}
@@ -1,3 +1,4 @@
+import random
 import subprocess
 import time
 from pathlib import Path
@@ -73,14 +74,11 @@ class TestSQLiteHistoryReader:
         node_c_git = git_writer.create_node("plan", EMPTY_TREE_HASH, hash_c, "Cache Test Content")
         commit_hash_c = node_c_git.commit_hash
 
-        # 2. 补水 (这将创建一个 plan_md_cache 为 NULL 的记录)
+        # 2. 补水 (补水只写入元数据，不缓存内容)
         hydrator.sync("test-user")
 
-        # 3. 验证初始状态：缓存为 NULL
-        conn = db_manager._get_conn()
-        cursor = conn.execute("SELECT plan_md_cache FROM nodes WHERE commit_hash = ?", (commit_hash_c,))
-        row = cursor.fetchone()
-        assert row["plan_md_cache"] is None, "Cache should be NULL for cold data."
+        # 3. 验证初始状态：缓存为空
+        assert db_manager.get_cached_contents([commit_hash_c]) == {}, "Cache should be empty for cold data."
 
         # 4. 使用 Reader 加载节点并触发 get_node_content
         nodes = reader.load_all_nodes()
@@ -94,9 +92,196 @@ class TestSQLiteHistoryReader:
         assert content == "Cache Test Content"
 
         # 5. 再次验证数据库：缓存应该已被回填
-        cursor_after = conn.execute("SELECT plan_md_cache FROM nodes WHERE commit_hash = ?", (commit_hash_c,))
-        row_after = cursor_after.fetchone()
-        assert row_after["plan_md_cache"] == "Cache Test Content", "Cache was not written back to DB."
+        cached = db_manager.get_cached_contents([commit_hash_c])
+        assert cached == {commit_hash_c: "Cache Test Content"}, "Cache was not written back to DB."
+        # load_all_nodes 不读取内容列，即使内容已被缓存
+        assert all(not n.content for n in reader.load_all_nodes())
+
+    def test_batch_contents_use_cache_and_backfill_once(self, sqlite_reader_setup, monkeypatch):
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        input_tree = EMPTY_TREE_HASH
+        for name in ("x", "y", "z"):
+            (repo / f"{name}.txt").touch()
+            output_tree = git_db.get_tree_hash()
+            git_writer.create_node("plan", input_tree, output_tree, f"Content {name}")
+            input_tree = output_tree
+        hydrator.sync("test-user")
+
+        nodes = reader.load_all_nodes()
+        cached = next(n for n in nodes if n.summary == "Content x")
+        db_manager.store_contents([(cached.commit_hash, "Cached x")])
+        nodes = reader.load_all_nodes()
+
+        writes = []
+        original_store = db_manager.store_contents
+        monkeypatch.setattr(
+            db_manager,
+            "store_contents",
+            lambda entries, cache=True: writes.append(entries) or original_store(entries, cache),
+        )
+        contents = reader.get_node_contents(nodes)
+
+        by_summary = {n.summary: contents[n.commit_hash] for n in nodes}
+        assert by_summary == {"Content x": "Cached x", "Content y": "Content y", "Content z": "Content z"}
+        # 只有缓存缺失的两个节点被回填，且只执行一次批量写入
+        assert len(writes) == 1 and len(writes[0]) == 2
+        conn = db_manager._get_conn()
+        assert conn.execute("SELECT COUNT(*) FROM nodes WHERE content_hash IS NULL").fetchone()[0] == 0
+
+    def test_compact_graph_matches_loaded_nodes(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        input_tree = EMPTY_TREE_HASH
+        for name in ("a", "b"):
+            (repo / f"{name}.txt").touch()
+            output_tree = git_db.get_tree_hash()
+            git_writer.create_node("plan", input_tree, output_tree, f"Content {name}")
+            input_tree = output_tree
+        hydrator.sync("test-user")
+
+        nodes = {n.commit_hash: n for n in reader.load_all_nodes()}
+        graph = reader.load_compact_graph()
+
+        assert len(graph) == len(nodes)
+        for view in graph:
+            node = nodes[view.commit_hash]
+            assert view.summary == node.summary
+            assert view.owner_id == node.owner_id
+            assert view.input_tree == node.input_tree
+            assert [c.commit_hash for c in view.children] == [c.commit_hash for c in node.children]
+
+
+class TestSQLiteFullTextSearch:
+    def _create(self, git_writer, git_db, repo, specs):
+        nodes = []
+        input_tree = EMPTY_TREE_HASH
+        for i, (summary, content) in enumerate(specs):
+            (repo / f"{i}.txt").write_text(content)
+            output_tree = git_db.get_tree_hash()
+            nodes.append(
+                git_writer.create_node("plan", input_tree, output_tree, content, summary_override=summary, start_time=i)
+            )
+            input_tree = output_tree
+        return nodes
+
+    def test_content_search_is_ranked_and_indexes_contents(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        nodes = self._create(
+            git_writer,
+            git_db,
+            repo,
+            [
+                ("修复登录", "修复 session 过期问题"),
+                ("重构缓存", "缓存层的 session 处理，session 复用，session 失效"),
+                ("无关节点", "更新文档"),
+            ],
+        )
+        hydrator.sync("test-user")
+        assert db_manager.fts_enabled
+
+        results = reader.find_nodes(content_query="session")
+
+        # 出现次数更多的节点排在前面；冷节点的内容已写入索引，但不占用内容缓存
+        assert [n.commit_hash for n in results] == [nodes[1].commit_hash, nodes[0].commit_hash]
+        conn = db_manager._get_conn()
+        assert conn.execute("SELECT COUNT(*) FROM nodes WHERE NOT content_indexed").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM content_cache").fetchone()[0] == 0
+        # 中文子串与多个词 (AND 语义)
+        assert [n.summary for n in reader.find_nodes(content_query="缓存层 复用")] == ["重构缓存"]
+        # 过短的词退回逐批读取正文匹配
+        assert [n.summary for n in reader.find_nodes(content_query="文档")] == ["无关节点"]
+
+    def test_summary_regex_has_exact_semantics(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        self._create(git_writer, git_db, repo, [("feat: login", "a"), ("fix: logout", "b"), ("Feature flag", "c")])
+        hydrator.sync("test-user")
+
+        assert [n.summary for n in reader.find_nodes(summary_regex="^fe")] == ["Feature flag", "feat: login"]
+        assert [n.summary for n in reader.find_nodes(summary_regex="log(in|out)$")] == ["fix: logout", "feat: login"]
+        # 纯字面量经由索引预筛选，结果仍不区分大小写
+        assert [n.summary for n in reader.find_nodes(summary_regex="FEAT")] == ["Feature flag", "feat: login"]
+        assert reader.find_nodes(summary_regex="(") == []
+
+    def test_recent_window_falls_back_to_full_search(self, sqlite_reader_setup, monkeypatch):
+        reader, git_writer, hydrator, _, repo, git_db = sqlite_reader_setup
+        self._create(git_writer, git_db, repo, [("fix: a", "a"), ("feat: b", "b"), ("fix: c", "c"), ("fix: d", "d")])
+        hydrator.sync("test-user")
+        monkeypatch.setattr(reader, "RECENT_WINDOW", 2)
+
+        # 最新的两个节点中能凑满结果时直接返回；凑不满时退回完整查询，结果一致
+        assert [n.summary for n in reader.find_nodes(summary_regex="fix", limit=1)] == ["fix: d"]
+        assert [n.summary for n in reader.find_nodes(summary_regex="fix", limit=3)] == ["fix: d", "fix: c", "fix: a"]
+        assert [n.summary for n in reader.find_nodes(summary_regex="feat")] == ["feat: b"]
+
+    def test_index_follows_writes_and_existing_rows(self, sqlite_reader_setup):
+        reader, git_writer, hydrator, db_manager, repo, git_db = sqlite_reader_setup
+        (node,) = self._create(git_writer, git_db, repo, [("初始摘要", "内容")])
+        hydrator.sync("test-user")
+
+        db_manager.execute_write(
+            "UPDATE nodes SET summary = ? WHERE commit_hash = ?", ("更新后的摘要", node.commit_hash)
+        )
+        assert reader.find_nodes(content_query="初始摘要") == []
+        assert [n.commit_hash for n in reader.find_nodes(content_query="更新后的")] == [node.commit_hash]
+
+        # 升级前创建的数据库：重新初始化时为已有的节点建立索引
+        with db_manager._writing() as conn:
+            for name in ("nodes_fts_insert", "nodes_fts_delete", "nodes_fts_update"):
+                conn.execute(f"DROP TRIGGER {name}")
+            conn.execute("DROP TABLE nodes_fts")
+        db_manager.init_schema()
+        assert [n.commit_hash for n in reader.find_nodes(content_query="更新后的")] == [node.commit_hash]
+
+
+class TestSQLiteLineageQueries:
+    def _expected(self, edges, start_tree, trees, upward):
+        # 直接沿边遍历得到的参照结果
+        step = {}
+        for child, parent in edges:
+            a, b = (child, parent) if upward else (parent, child)
+            step.setdefault(a, []).append(b)
+        frontier = [c for c, tree in trees.items() if tree == start_tree]
+        seen = set()
+        while frontier:
+            for nxt in step.get(frontier.pop(), []):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    frontier.append(nxt)
+        return {trees[c] for c in seen}
+
+    def test_queries_match_edge_walk_in_every_labeling_state(self, sqlite_reader_setup):
+        reader, _, _, db_manager, _, _ = sqlite_reader_setup
+        rng = random.Random(7)
+        trees, edges = {}, []
+
+        def add(count):
+            rows, new_edges = [], []
+            for _ in range(count):
+                i = len(trees)
+                commit_hash = f"{i:040x}"
+                # 少数节点复用已有的 output_tree，与真实历史中回到旧状态的情形一致
+                trees[commit_hash] = (
+                    rng.choice(list(trees.values())) if i and rng.random() < 0.05 else f"{i:040x}"[::-1]
+                )
+                rows.append((commit_hash, "user", trees[commit_hash], "plan", float(i), "s", None, "{}"))
+                if i and rng.random() < 0.9:
+                    new_edges.append((commit_hash, f"{rng.randrange(max(0, i - 5), i):040x}"))
+                    if rng.random() < 0.05:
+                        # 合并节点：第二个父节点
+                        new_edges.append((commit_hash, f"{rng.randrange(i):040x}"))
+            edges.extend(new_edges)
+            db_manager.insert_nodes_and_edges(rows, new_edges)
+
+        def check():
+            for tree in set(trees.values()):
+                assert reader.get_ancestor_output_trees(tree) == self._expected(edges, tree, trees, upward=True)
+                assert reader.get_descendant_output_trees(tree) == self._expected(edges, tree, trees, upward=False)
+
+        add(60)
+        check()  # 全部未编号
+        db_manager.refresh_lineage(force=True)
+        check()  # 已编号 (合并节点及其后代除外)
+        add(30)
+        check()  # 已编号与新追加的未编号节点混合
 
 
 @pytest.fixture(scope="class")
@@ -175,6 +360,32 @@ class TestSQLiteReaderPaginated:
         nodes = reader.load_nodes_paginated(limit=5, offset=20)
         assert len(nodes) == 0
 
+    def test_keyset_pages_match_offset_pages(self, populated_db):
+        reader, _, _, _ = populated_db
+        forward = [reader.load_nodes_page(limit=4)]
+        while forward[-1]:
+            forward.append(reader.load_nodes_page(limit=4, after=forward[-1][-1].commit_hash))
+        forward.pop()
+        expected = [reader.load_nodes_paginated(limit=4, offset=offset) for offset in range(0, 15, 4)]
+        assert [[n.commit_hash for n in page] for page in forward] == [[n.commit_hash for n in p] for p in expected]
+
+        # 反向翻页得到同样的分页，且仍按时间倒序排列
+        backward = reader.load_nodes_page(limit=4, before=forward[2][0].commit_hash)
+        assert [n.commit_hash for n in backward] == [n.commit_hash for n in forward[1]]
+        assert reader.load_nodes_page(limit=4, before=forward[0][0].commit_hash) == []
+        assert reader.load_nodes_page(limit=4, after="f" * 40) == []
+
+    def test_keyset_pages_break_timestamp_ties(self, sqlite_reader_setup):
+        reader, _, _, db_manager, _, _ = sqlite_reader_setup
+        rows = [(f"{i:040x}", "user", f"{i:040x}"[::-1], "plan", 1.5, f"Node {i}", None, "{}") for i in range(5)]
+        db_manager.insert_nodes_and_edges(rows, [])
+
+        first = reader.load_nodes_page(limit=2)
+        second = reader.load_nodes_page(limit=2, after=first[-1].commit_hash)
+        third = reader.load_nodes_page(limit=2, after=second[-1].commit_hash)
+        assert [n.summary for n in first + second + third] == [f"Node {i}" for i in range(4, -1, -1)]
+        assert reader.get_node_position(f"{2:040x}"[::-1]) == 2
+
     def test_get_private_data_found(self, populated_db):
         reader, _, commit_hashes, _ = populated_db
         private_data = reader.get_private_data(commit_hashes[3])
@@ -185,6 +396,13 @@ class TestSQLiteReaderPaginated:
         private_data = reader.get_private_data(commit_hashes[4])
         assert private_data is None
 
+    def test_get_private_data_many(self, populated_db, monkeypatch):
+        reader, _, commit_hashes, _ = populated_db
+        # 强制分批，覆盖多次 IN 查询的合并
+        monkeypatch.setattr(reader, "IN_QUERY_CHUNK", 2)
+        private_data = reader.get_private_data_many(commit_hashes)
+        assert private_data == {commit_hashes[3]: "This is a secret intent."}
+
     def test_get_ancestors_with_cte(self, populated_db):
         reader, db_manager, commit_hashes, output_tree_hashes = populated_db
         # We want ancestors of the last created node (Node 14)
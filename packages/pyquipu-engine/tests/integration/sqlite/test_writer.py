@@ -80,7 +80,7 @@ class TestSQLiteWriterIntegration:
         assert node_row is not None
         assert node_row["summary"] == "Write: b.txt"
         # 验证缓存已被写入 (Hot Path)
-        assert node_row["plan_md_cache"] == "Plan B Content"
+        assert db_manager.get_cached_contents([commit_hash_b]) == {commit_hash_b: "Plan B Content"}
 
         # Check Edge A -> B
         cursor_edge = conn.execute("SELECT * FROM edges WHERE child_hash = ?", (commit_hash_b,))
@@ -89,3 +89,40 @@ class TestSQLiteWriterIntegration:
         assert edge_row["parent_hash"] == commit_hash_a, "The edge should point to Node A."
 
         db_manager.close()
+
+    def test_parent_lookup_uses_nodes_index(self, sqlite_setup, monkeypatch):
+        writer, db_manager, git_db, ws = sqlite_setup
+        (ws / "a.txt").write_text("A")
+        hash_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", EMPTY_TREE_HASH, hash_a, "Plan A", summary_override="A")
+
+        def no_grep(*args, **kwargs):
+            raise AssertionError("parent lookup must not fall back to git log --grep")
+
+        monkeypatch.setattr(git_db, "get_commit_by_output_tree", no_grep)
+        (ws / "b.txt").write_text("B")
+        node_b = writer.create_node("plan", hash_a, git_db.get_tree_hash(), "Plan B", summary_override="B")
+
+        assert node_b.parent.commit_hash == node_a.commit_hash
+        assert db_manager.get_commit_by_output_tree(hash_a) == node_a.commit_hash
+        assert db_manager.get_commit_by_output_tree("f" * 40) is None
+
+    def test_writes_maintain_lineage(self, sqlite_setup, monkeypatch):
+        writer, db_manager, git_db, ws = sqlite_setup
+        monkeypatch.setattr(db_manager, "LINEAGE_RELABEL_THRESHOLD", 1)
+        input_tree = EMPTY_TREE_HASH
+        nodes = []
+        for name in ("a", "b", "c"):
+            (ws / f"{name}.txt").write_text(name)
+            output_tree = git_db.get_tree_hash()
+            nodes.append(writer.create_node("plan", input_tree, output_tree, name, summary_override=name))
+            input_tree = output_tree
+
+        labels = {
+            row[0]: (row[1], row[2])
+            for row in db_manager._get_conn().execute("SELECT commit_hash, pre, size FROM lineage")
+        }
+        # 第二次写入时待编号节点超过阈值而重新编号；第三个节点仍待编号
+        assert labels[nodes[0].commit_hash] == (0, 2)
+        assert labels[nodes[1].commit_hash] == (1, 1)
+        assert labels[nodes[2].commit_hash] == (None, None)
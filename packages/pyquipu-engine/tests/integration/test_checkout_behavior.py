@@ -103,3 +103,68 @@ class TestCheckoutBehavior:
         assert mtime_after == mtime_before, "Unchanged file was touched! Optimization failed."
 
         assert changing_file.read_text() == "v2", "Changed file was not updated."
+
+
+class TestDiffDrivenCheckout:
+    @staticmethod
+    def _record_git_calls(monkeypatch):
+        calls = []
+        original_run = subprocess.run
+        monkeypatch.setattr(subprocess, "run", lambda args, **kw: calls.append(args[1]) or original_run(args, **kw))
+        return calls
+
+    def test_removes_only_paths_deleted_between_snapshots(self, git_env, monkeypatch):
+        repo, db = git_env
+        (repo / ".gitignore").write_text("build/\n")
+        (repo / "keep.txt").write_text("keep")
+        hash_a = db.get_tree_hash()
+
+        (repo / "pkg" / "sub").mkdir(parents=True)
+        (repo / "pkg" / "sub" / "new.py").write_text("new")
+        (repo / "extra.txt").write_text("extra")
+        hash_b = db.get_tree_hash()
+
+        (repo / "build").mkdir()
+        (repo / "build" / "artifact.o").write_text("ignored")
+
+        calls = self._record_git_calls(monkeypatch)
+        db.checkout_tree(new_tree_hash=hash_a, old_tree_hash=hash_b)
+        monkeypatch.undo()
+
+        assert "clean" not in calls
+        assert not (repo / "pkg").exists(), "Directories emptied by the checkout should be removed"
+        assert not (repo / "extra.txt").exists()
+        assert (repo / "keep.txt").read_text() == "keep"
+        assert (repo / "build" / "artifact.o").exists(), "Ignored files must never be touched"
+        assert db.get_tree_hash() == hash_a
+
+    def test_handles_file_and_directory_swaps(self, git_env):
+        repo, db = git_env
+        (repo / "node").write_text("file")
+        hash_file = db.get_tree_hash()
+
+        (repo / "node").unlink()
+        (repo / "node").mkdir()
+        (repo / "node" / "child.txt").write_text("child")
+        hash_dir = db.get_tree_hash()
+
+        db.checkout_tree(new_tree_hash=hash_file, old_tree_hash=hash_dir)
+        assert (repo / "node").read_text() == "file"
+
+        db.checkout_tree(new_tree_hash=hash_dir, old_tree_hash=hash_file)
+        assert (repo / "node" / "child.txt").read_text() == "child"
+
+    def test_clean_mode_falls_back_to_git_clean(self, git_env, monkeypatch):
+        repo, _ = git_env
+        db = GitDB(repo, checkout_mode="clean")
+        (repo / "a.txt").write_text("a")
+        hash_a = db.get_tree_hash()
+        (repo / "stray.txt").write_text("stray")
+        hash_b = db.get_tree_hash()
+
+        calls = self._record_git_calls(monkeypatch)
+        db.checkout_tree(new_tree_hash=hash_a, old_tree_hash=hash_b)
+        monkeypatch.undo()
+
+        assert "clean" in calls and "diff-tree" not in calls
+        assert not (repo / "stray.txt").exists()
@@ -0,0 +1,91 @@
+import subprocess
+
+import pytest
+from quipu.engine.diff_service import DiffService
+from quipu.engine.git_db import GitDB
+from quipu.engine.git_object_storage import GitObjectHistoryWriter
+
+
+@pytest.fixture
+def two_trees(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    db = GitDB(root)
+
+    (root / "keep.txt").write_text("keep")
+    (root / "change.txt").write_text("v1\n")
+    (root / "gone.txt").write_text("bye\n")
+    old_tree = db.get_tree_hash()
+
+    (root / "change.txt").write_text("v2\nv3\n")
+    (root / "gone.txt").unlink()
+    (root / "dir").mkdir()
+    (root / "dir" / "new.txt").write_text("new\n")
+    new_tree = db.get_tree_hash()
+    return db, old_tree, new_tree
+
+
+def _git_output(root, *args) -> str:
+    return subprocess.run(["git", *args], cwd=root, check=True, capture_output=True, text=True).stdout
+
+
+def _count_diff_tree_calls(monkeypatch):
+    calls = []
+    original_run = subprocess.run
+
+    def recording_run(args, **kwargs):
+        if "diff-tree" in args:
+            calls.append(args)
+        return original_run(args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", recording_run)
+    return calls
+
+
+class TestDiffService:
+    def test_single_pass_matches_git(self, two_trees):
+        db, old_tree, new_tree = two_trees
+        tree_diff = DiffService(db.root).diff(old_tree, new_tree)
+
+        expected_status = _git_output(db.root, "diff-tree", "-r", "--name-status", old_tree, new_tree)
+        assert [f"{s}\t{p}" for s, p in tree_diff.name_status] == expected_status.splitlines()
+        assert tree_diff.stat == _git_output(db.root, "diff-tree", "--stat=,,30", old_tree, new_tree).strip()
+
+    def test_repeated_comparisons_are_served_from_cache(self, two_trees, monkeypatch):
+        db, old_tree, new_tree = two_trees
+        calls = _count_diff_tree_calls(monkeypatch)
+
+        db.get_diff_stat(old_tree, new_tree)
+        db.get_diff_name_status(old_tree, new_tree)
+        db.get_tree_diff(old_tree, new_tree)
+
+        assert len(calls) == 1
+        assert (db.diff_service.hits, db.diff_service.misses) == (2, 1)
+
+    def test_evicts_least_recently_used_past_byte_budget(self, two_trees):
+        db, old_tree, new_tree = two_trees
+        service = DiffService(db.root)
+        entry_size = service.diff(old_tree, new_tree).size
+        service.max_bytes = entry_size * 2 + 1
+
+        service.diff(new_tree, old_tree)
+        service.diff(old_tree, new_tree)  # 刷新为最近使用
+        service.diff(old_tree, old_tree)  # 挤出最久未使用的 (new, old)
+
+        assert (old_tree, new_tree, 30) in service._cache
+        assert (new_tree, old_tree, 30) not in service._cache
+        assert service._bytes <= service.max_bytes
+
+    def test_capture_diffs_each_tree_pair_once(self, two_trees, monkeypatch):
+        db, old_tree, new_tree = two_trees
+        writer = GitObjectHistoryWriter(db)
+        stat = db.get_diff_stat(old_tree, new_tree)  # Engine.capture_drift 生成正文
+        calls = _count_diff_tree_calls(monkeypatch)
+
+        node = writer.create_node("capture", old_tree, new_tree, stat)
+
+        assert calls == []
+        assert node.summary.startswith("Capture: M change.txt")
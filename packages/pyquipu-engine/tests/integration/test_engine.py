@@ -220,3 +220,46 @@ def test_align_prefers_connected_node(engine_instance: Engine):
     # 5. 验证是否优先对齐到连接链更完备的节点
     assert engine.current_node is not None
     assert engine.current_node.commit_hash == node_connected.commit_hash
+
+
+def test_checkout_removes_files_created_since_head(engine_instance: Engine):
+    engine = engine_instance
+    repo_path = engine.root_dir
+
+    (repo_path / "file.txt").write_text("v1")
+    hash_a = engine.git_db.get_tree_hash()
+    engine.capture_drift(hash_a)
+
+    # HEAD 仍指向 hash_a，但工作区新增了未提交的文件 (discard 的典型场景)
+    (repo_path / "scratch").mkdir()
+    (repo_path / "scratch" / "notes.txt").write_text("draft")
+
+    engine.visit(hash_a)
+
+    assert not (repo_path / "scratch").exists()
+    assert engine.git_db.get_tree_hash() == hash_a
+
+
+def test_align_and_checkout_use_compact_graph(engine_instance: Engine, monkeypatch):
+    engine = engine_instance
+    repo_path = engine.root_dir
+
+    (repo_path / "file.txt").write_text("v1")
+    hash_a = engine.git_db.get_tree_hash()
+    node_a = engine.capture_drift(hash_a)
+    (repo_path / "file.txt").write_text("v2")
+    hash_b = engine.git_db.get_tree_hash()
+    node_b = engine.capture_drift(hash_b)
+
+    def fail_load_all_nodes():
+        raise AssertionError("load_all_nodes should not be called")
+
+    monkeypatch.setattr(engine.reader, "load_all_nodes", fail_load_all_nodes)
+
+    assert engine.align() == "CLEAN"
+    assert engine.current_node is node_b
+    assert engine.compact_graph.get(node_b.commit_hash).parent.commit_hash == node_a.commit_hash
+
+    engine.visit(hash_a)
+    assert engine.current_node is node_a
+    assert (repo_path / "file.txt").read_text() == "v1"
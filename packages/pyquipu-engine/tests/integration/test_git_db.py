@@ -1,3 +1,4 @@
+import shutil
 import subprocess
 from pathlib import Path
 from unittest.mock import MagicMock
@@ -25,6 +26,14 @@ def db(git_repo):
     return GitDB(git_repo)
 
 
+@pytest.fixture
+def subprocess_db(git_repo):
+    # 关闭进程内读取器，强制所有读取都经过 cat-file 协进程
+    db = GitDB(git_repo, native_odb=False)
+    yield db
+    db.close()
+
+
 class TestGitDBPlumbing:
     def test_get_tree_hash_stability(self, git_repo, db):
         f = git_repo / "test.txt"
@@ -62,8 +71,8 @@ class TestGitDBPlumbing:
         status_after = subprocess.check_output(["git", "status", "--porcelain"], cwd=git_repo).decode()
         assert status_after == status_before
 
-        # 验证 Shadow Index 文件已被清理
-        assert not (git_repo / ".quipu" / "tmp_index").exists()
+        # 影子索引持久保留在 .quipu 中，且不会被用户的 git status 看到
+        assert (git_repo / ".quipu" / "shadow_index").exists()
 
     def test_exclude_quipu_dir(self, git_repo, db):
         (git_repo / "main.py").touch()
@@ -233,6 +242,53 @@ class TestGitDBPlumbing:
         logs = db.log_ref("refs/heads/non-existent")
         assert logs == []
 
+    def test_ref_fingerprint_tracks_quipu_refs(self, git_repo, db):
+        tree_hash = db.get_tree_hash()
+        commit_hash = db.commit_tree(tree_hash, parent_hashes=None, message="fp")
+        empty = db.ref_fingerprint()
+        assert db.ref_fingerprint() == empty
+
+        db.update_ref(f"refs/quipu/local/heads/{commit_hash}", commit_hash)
+        loose = db.ref_fingerprint()
+        assert loose != empty
+        assert db.ref_fingerprint() == loose
+
+        db.pack_refs_if_needed(threshold=0)
+        packed = db.ref_fingerprint()
+        assert packed not in (empty, loose)
+
+        db.delete_ref(f"refs/quipu/local/heads/{commit_hash}")
+        assert db.ref_fingerprint() != packed
+
+    def test_iter_log_streams_revisions_and_exclusions(self, git_repo, db):
+        hashes = []
+        for i in range(3):
+            (git_repo / f"f{i}").touch()
+            subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+            # 正文中包含旧版本的文本分隔符，不能再截断记录
+            message = f"commit {i}\n\n---QUIPU-LOG-ENTRY---\nline {i}"
+            subprocess.run(["git", "commit", "-m", message], cwd=git_repo, check=True)
+            hashes.append(subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=git_repo, text=True).strip())
+
+        entries = list(db.iter_log([hashes[2], f"^{hashes[0]}"]))
+
+        assert [e["hash"] for e in entries] == [hashes[2], hashes[1]]
+        assert entries[0]["parent"] == hashes[1]
+        assert entries[0]["body"].strip() == "commit 2\n\n---QUIPU-LOG-ENTRY---\nline 2"
+
+    def test_iter_log_stops_cleanly_when_abandoned(self, git_repo, db):
+        for i in range(3):
+            (git_repo / f"f{i}").touch()
+            subprocess.run(["git", "add", "."], cwd=git_repo, check=True)
+            subprocess.run(["git", "commit", "-m", f"commit {i}"], cwd=git_repo, check=True)
+
+        stream = db.iter_log(["HEAD"])
+        assert next(stream)["body"].strip() == "commit 2"
+        stream.close()
+
+        assert list(db.iter_log([])) == []
+        assert list(db.iter_log(["refs/heads/non-existent"])) == []
+
     def test_cat_file_types(self, git_repo, db):
         # 1. Prepare data: create file, add, and commit
         (git_repo / "test_file").write_text("file content", encoding="utf-8")
@@ -275,3 +331,368 @@ class TestGitDBPlumbing:
         assert results[h1] == b"obj1"
         assert results[h2] == b"obj2"
         assert h3_missing not in results
+
+    def test_cat_file_missing_object_raises(self, db):
+        with pytest.raises(RuntimeError):
+            db.cat_file("b" * 40, "blob")
+
+    def test_get_blobs_from_tree(self, db):
+        h1 = db.hash_object(b"alpha")
+        h2 = db.hash_object(b"beta")
+        sub_tree = db.mktree(f"100644 blob {h1}\tinner.txt")
+        tree_hash = db.mktree(f"100644 blob {h1}\ta.txt\n100644 blob {h2}\tb.txt\n040000 tree {sub_tree}\tsub")
+
+        blobs = db.get_blobs_from_tree(tree_hash)
+
+        assert blobs == {"a.txt": b"alpha", "b.txt": b"beta"}
+
+    def test_get_object_info(self, db):
+        blob_hash = db.hash_object(b"12345")
+
+        assert db.get_object_info(blob_hash) == ("blob", 5)
+        assert db.get_object_info("c" * 40) is None
+
+
+class TestPersistentShadowIndex:
+    @staticmethod
+    def _fresh_tree_hash(db):
+        db.invalidate_shadow_index()
+        return db.get_tree_hash()
+
+    def test_reused_while_user_index_unchanged(self, git_repo, db, monkeypatch):
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        db.get_tree_hash()
+
+        copies = []
+        monkeypatch.setattr("quipu.engine.git_db.shutil.copy2", lambda *args: copies.append(args))
+        (git_repo / "b.txt").write_text("b", encoding="utf-8")
+        reused_hash = db.get_tree_hash()
+
+        assert copies == []
+        monkeypatch.undo()
+        assert reused_hash == self._fresh_tree_hash(db)
+
+    def test_reseeded_when_user_index_changes(self, git_repo, db, monkeypatch):
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        db.get_tree_hash()
+
+        subprocess.run(["git", "add", "a.txt"], cwd=git_repo, check=True)
+        copies = []
+        original_copy = shutil.copy2
+        monkeypatch.setattr(
+            "quipu.engine.git_db.shutil.copy2", lambda *args: copies.append(args) or original_copy(*args)
+        )
+        db.get_tree_hash()
+
+        assert len(copies) == 1
+
+    def test_newly_ignored_files_are_dropped(self, git_repo, db):
+        (git_repo / "build").mkdir()
+        (git_repo / "build" / "out.bin").write_text("artifact", encoding="utf-8")
+        (git_repo / "src.py").write_text("print()", encoding="utf-8")
+        with_artifact = db.get_tree_hash()
+
+        (git_repo / ".gitignore").write_text("build/\n", encoding="utf-8")
+        reused_hash = db.get_tree_hash()
+
+        assert reused_hash != with_artifact
+        assert reused_hash == self._fresh_tree_hash(db)
+
+    def test_user_tracked_ignored_files_are_kept(self, git_repo, db):
+        (git_repo / "vendored.lock").write_text("pinned", encoding="utf-8")
+        subprocess.run(["git", "add", "vendored.lock"], cwd=git_repo, check=True)
+        (git_repo / ".gitignore").write_text("*.lock\n", encoding="utf-8")
+        db.get_tree_hash()
+
+        (git_repo / "other.txt").write_text("x", encoding="utf-8")
+        reused_hash = db.get_tree_hash()
+
+        assert reused_hash == self._fresh_tree_hash(db)
+        listing = subprocess.check_output(["git", "ls-tree", "--name-only", reused_hash], cwd=git_repo).decode()
+        assert "vendored.lock" in listing
+
+    def test_corrupt_shadow_index_is_rebuilt(self, git_repo, db):
+        (git_repo / "a.txt").write_text("a", encoding="utf-8")
+        expected = db.get_tree_hash()
+
+        (git_repo / ".quipu" / "shadow_index").write_bytes(b"not an index")
+
+        assert db.get_tree_hash() == expected
+
+    def test_invalidate_removes_persisted_state(self, git_repo, db):
+        db.get_tree_hash()
+
+        db.invalidate_shadow_index()
+
+        assert not (git_repo / ".quipu" / "shadow_index").exists()
+        assert not (git_repo / ".quipu" / "shadow_index.seed").exists()
+
+
+class TestRefTransaction:
+    @staticmethod
+    def _commits(db, n):
+        return [db.commit_tree(db.mktree(""), None, f"c{i}") for i in range(n)]
+
+    def test_commit_applies_all_ops_in_one_process(self, db, monkeypatch):
+        c1, c2, c3 = self._commits(db, 3)
+        db.update_ref("refs/quipu/local/heads/old", c1)
+        db.update_ref("refs/quipu/local/heads/moved", c1)
+
+        calls = []
+        original_run = subprocess.run
+        monkeypatch.setattr(subprocess, "run", lambda args, **kw: calls.append(args) or original_run(args, **kw))
+        with db.ref_transaction() as tx:
+            tx.create("refs/quipu/local/heads/new", c2)
+            tx.update("refs/quipu/local/heads/moved", c3, c1)
+            tx.delete("refs/quipu/local/heads/old", c1)
+        monkeypatch.undo()
+
+        assert calls == [["git", "update-ref", "--stdin"]]
+        assert sorted(db.get_all_ref_heads("refs/quipu/local/heads/")) == sorted(
+            [(c2, "refs/quipu/local/heads/new"), (c3, "refs/quipu/local/heads/moved")]
+        )
+
+    def test_failed_transaction_applies_nothing(self, db):
+        c1, c2 = self._commits(db, 2)
+        db.update_ref("refs/quipu/local/heads/existing", c1)
+
+        with pytest.raises(RuntimeError, match="update-ref"):
+            with db.ref_transaction() as tx:
+                tx.create("refs/quipu/local/heads/fresh", c2)
+                tx.create("refs/quipu/local/heads/existing", c2)
+
+        assert db.get_all_ref_heads("refs/quipu/local/heads/") == [(c1, "refs/quipu/local/heads/existing")]
+
+    def test_exception_in_block_discards_queue(self, db):
+        (c1,) = self._commits(db, 1)
+
+        with pytest.raises(ValueError):
+            with db.ref_transaction() as tx:
+                tx.create("refs/quipu/local/heads/never", c1)
+                raise ValueError("abort")
+
+        assert db.get_all_ref_heads("refs/quipu/local/heads/") == []
+        assert tx.committed is False
+
+    def test_reconcile_and_prune_use_snapshots(self, db, monkeypatch):
+        c1, c2, c3 = self._commits(db, 3)
+        remote = "refs/quipu/remotes/origin/alice/heads/"
+        local = "refs/quipu/local/heads/"
+        db.update_ref(f"{remote}{c1}", c1)
+        db.update_ref(f"{remote}{c2}", c2)
+        db.update_ref(f"{local}{c1}", c1)
+        db.update_ref(f"{local}{c3}", c3)
+        monkeypatch.setattr("quipu.engine.git_db.bus", MagicMock())
+
+        db.reconcile_local_with_remote("origin", "alice")
+        assert {ref for _, ref in db.get_all_ref_heads(local)} == {f"{local}{c1}", f"{local}{c2}", f"{local}{c3}"}
+
+        db.prune_local_from_remote("origin", "alice")
+        assert {ref for _, ref in db.get_all_ref_heads(local)} == {f"{local}{c1}", f"{local}{c2}"}
+
+
+class TestHeadCompaction:
+    def test_collapses_all_ancestor_heads(self, db):
+        root = db.commit_tree(db.mktree(""), None, "root")
+        mid = db.commit_tree(db.mktree(""), [root], "mid")
+        tip = db.commit_tree(db.mktree(""), [mid], "tip")
+        side = db.commit_tree(db.mktree(""), [root], "side")
+        for commit in (root, mid, tip, side):
+            db.update_ref(f"refs/quipu/local/heads/{commit}", commit)
+        db.update_ref(f"refs/quipu/remotes/origin/bob/heads/{mid}", mid)
+
+        assert sorted(c for c, _ in db.find_redundant_heads()) == sorted([root, mid])
+        assert db.compact_heads() == 2
+
+        assert {c for c, _ in db.get_all_ref_heads("refs/quipu/local/heads/")} == {tip, side}
+        # 其他命名空间中的引用不受影响
+        assert db.get_all_ref_heads("refs/quipu/remotes/") == [(mid, f"refs/quipu/remotes/origin/bob/heads/{mid}")]
+        assert db.compact_heads() == 0
+
+    def test_pack_refs_only_past_threshold(self, db):
+        commits = [db.commit_tree(db.mktree(""), None, f"c{i}") for i in range(4)]
+        for commit in commits:
+            db.update_ref(f"refs/quipu/local/heads/{commit}", commit)
+
+        assert db.count_loose_refs() == 4
+        assert db.pack_refs_if_needed(threshold=4) is False
+        assert db.pack_refs_if_needed(threshold=3) is True
+        assert db.count_loose_refs() == 0
+        assert len(db.get_all_ref_heads("refs/quipu/local/heads/")) == 4
+
+
+def _make_quipu_remote(base_dir: Path, db: GitDB, user_ids, heads_per_user=1) -> Path:
+    # 直接在裸仓库中为每个用户写入 heads，模拟多人推送后的远程
+    remote = base_dir / "remote.git"
+    subprocess.run(["git", "init", "--bare", "-q", str(remote)], check=True)
+    git = ["git", "-C", str(remote), "-c", "user.name=Quipu Test", "-c", "user.email=test@quipu.dev"]
+    empty_tree = subprocess.run(git + ["mktree"], input="", capture_output=True, text=True, check=True).stdout.strip()
+
+    commands = []
+    for user_id in user_ids:
+        for i in range(heads_per_user):
+            commit = subprocess.run(
+                git + ["commit-tree", empty_tree, "-m", f"{user_id} {i}"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+            commands.append(f"create refs/quipu/users/{user_id}/heads/{commit} {commit}\n")
+    subprocess.run(git + ["update-ref", "--stdin"], input="".join(commands), text=True, check=True)
+    subprocess.run(["git", "remote", "add", "origin", str(remote)], cwd=db.root, check=True)
+    return remote
+
+
+class TestFetchQuipuRefsMany:
+    USERS = [f"user{i:02d}" for i in range(12)]
+
+    def test_fetches_all_users_in_one_process(self, tmp_path, db, monkeypatch):
+        _make_quipu_remote(tmp_path, db, self.USERS, heads_per_user=2)
+        mock_bus = MagicMock()
+        monkeypatch.setattr("quipu.engine.git_db.bus", mock_bus)
+
+        calls = []
+        original_run = subprocess.run
+        monkeypatch.setattr(subprocess, "run", lambda args, **kw: calls.append(args) or original_run(args, **kw))
+        failures = db.fetch_quipu_refs_many("origin", self.USERS)
+        monkeypatch.undo()
+
+        assert failures == {}
+        assert len([args for args in calls if "fetch" in args]) == 1
+        for user_id in self.USERS:
+            assert len(db.get_all_ref_heads(f"refs/quipu/remotes/origin/{user_id}/heads/")) == 2
+            mock_bus.info.assert_any_call(L.engine.git.info.fetchedUser, user_id=user_id, count=2)
+
+    def test_failing_user_does_not_block_others(self, tmp_path, db, monkeypatch):
+        _make_quipu_remote(tmp_path, db, self.USERS[:3])
+        mock_bus = MagicMock()
+        monkeypatch.setattr("quipu.engine.git_db.bus", mock_bus)
+
+        # 非法的用户 ID 会产生无效的 refspec，使批量 fetch 整体失败
+        failures = db.fetch_quipu_refs_many("origin", self.USERS[:3] + ["bad..id"], max_workers=2)
+
+        assert list(failures) == ["bad..id"]
+        for user_id in self.USERS[:3]:
+            assert len(db.get_all_ref_heads(f"refs/quipu/remotes/origin/{user_id}/heads/")) == 1
+        mock_bus.warning.assert_called_once()
+        assert mock_bus.warning.call_args.args[0] == L.engine.git.warning.fetchFailed
+
+    def test_prunes_heads_removed_from_remote(self, tmp_path, db, monkeypatch):
+        remote = _make_quipu_remote(tmp_path, db, self.USERS[:2])
+        monkeypatch.setattr("quipu.engine.git_db.bus", MagicMock())
+        db.fetch_quipu_refs_many("origin", self.USERS[:2])
+
+        (_, gone_ref), *_ = db.get_all_ref_heads(f"refs/quipu/remotes/origin/{self.USERS[0]}/heads/")
+        remote_ref = gone_ref.replace("refs/quipu/remotes/origin/", "refs/quipu/users/")
+        subprocess.run(["git", "-C", str(remote), "update-ref", "-d", remote_ref], check=True)
+        db.fetch_quipu_refs_many("origin", self.USERS[:2])
+
+        assert db.get_all_ref_heads(f"refs/quipu/remotes/origin/{self.USERS[0]}/heads/") == []
+        assert len(db.get_all_ref_heads(f"refs/quipu/remotes/origin/{self.USERS[1]}/heads/")) == 1
+
+
+class TestCatFileCoprocess:
+    def test_coprocess_is_reused(self, subprocess_db):
+        h1 = subprocess_db.hash_object(b"first")
+        h2 = subprocess_db.hash_object(b"second")
+
+        assert subprocess_db.cat_file(h1, "blob") == b"first"
+        pid = subprocess_db._cat_file_batch().pid
+        assert pid is not None
+
+        assert subprocess_db.batch_cat_file([h1, h2]) == {h1: b"first", h2: b"second"}
+        assert subprocess_db.cat_file(h2, "blob") == b"second"
+        assert subprocess_db._cat_file_batch().pid == pid
+
+    def test_coprocess_restarts_after_crash(self, subprocess_db):
+        blob_hash = subprocess_db.hash_object(b"survivor")
+        assert subprocess_db.cat_file(blob_hash, "blob") == b"survivor"
+
+        proc = subprocess_db._cat_file_batch()._proc
+        proc.kill()
+        proc.wait()
+
+        assert subprocess_db.cat_file(blob_hash, "blob") == b"survivor"
+        assert subprocess_db._cat_file_batch().pid not in (None, proc.pid)
+
+    def test_batch_larger_than_pipeline_window(self, subprocess_db):
+        hashes = [subprocess_db.hash_object(f"obj-{i}".encode()) for i in range(300)]
+
+        results = subprocess_db.batch_cat_file(hashes)
+
+        assert len(results) == 300
+        assert results[hashes[-1]] == b"obj-299"
+
+    def test_close_shuts_down_coprocess(self, subprocess_db):
+        blob_hash = subprocess_db.hash_object(b"bye")
+        subprocess_db.cat_file(blob_hash, "blob")
+        proc = subprocess_db._cat_file_batch()._proc
+
+        subprocess_db.close()
+
+        assert proc.poll() is not None
+        # 关闭后再次读取会懒启动一个新的协进程
+        assert subprocess_db.cat_file(blob_hash, "blob") == b"bye"
+        subprocess_db.close()
+
+    def test_engine_close_shuts_down_coprocess(self, engine_instance):
+        git_db = engine_instance.git_db
+        blob_hash = git_db.hash_object(b"engine")
+        git_db._cat_file_batch().query([blob_hash])
+        proc = git_db._cat_file_batch()._proc
+
+        engine_instance.close()
+
+        assert proc.poll() is not None
+
+
+class TestCatFileStreaming:
+    def test_iter_cat_file_yields_in_request_order(self, subprocess_db):
+        h1 = subprocess_db.hash_object(b"one")
+        h2 = subprocess_db.hash_object(b"two")
+        missing = "d" * 40
+
+        entries = list(subprocess_db.iter_cat_file([h2, missing, h1, h2]))
+
+        assert [(h, t, size) for h, t, size, _ in entries] == [(h2, "blob", 3), (h1, "blob", 3)]
+        assert isinstance(entries[0][3], memoryview)
+        assert bytes(entries[0][3]) == b"two"
+
+    def test_iter_cat_file_respects_inflight_budget(self, subprocess_db, monkeypatch):
+        from quipu.engine import git_cat_file
+
+        hashes = [subprocess_db.hash_object(bytes([65 + i % 26]) * 1000 + str(i).encode()) for i in range(50)]
+        peaks = []
+        original_reserve = git_cat_file._StreamState.reserve
+
+        def tracking_reserve(state, size):
+            original_reserve(state, size)
+            peaks.append(state.inflight_bytes)
+
+        monkeypatch.setattr(git_cat_file._StreamState, "reserve", tracking_reserve)
+
+        count = 0
+        for _, _, size, view in subprocess_db.iter_cat_file(hashes, max_inflight_bytes=3000):
+            assert len(view) == size
+            count += 1
+
+        assert count == 50
+        assert max(peaks) <= 3000
+
+    def test_iter_cat_file_early_break_keeps_protocol_in_sync(self, subprocess_db):
+        hashes = [subprocess_db.hash_object(f"item-{i}".encode()) for i in range(600)]
+
+        for _ in subprocess_db.iter_cat_file(hashes):
+            break
+
+        # 提前中断后，后续读取必须依然正确
+        assert subprocess_db.batch_cat_file(hashes[-2:]) == {hashes[-2]: b"item-598", hashes[-1]: b"item-599"}
+        assert len(list(subprocess_db.iter_cat_file(hashes))) == 600
+
+    def test_nested_streams(self, subprocess_db):
+        outer = [subprocess_db.hash_object(b"outer-a"), subprocess_db.hash_object(b"outer-b")]
+        inner = [subprocess_db.hash_object(b"inner")]
+
+        seen = []
+        for obj_hash, _, _, view in subprocess_db.iter_cat_file(outer):
+            nested = [bytes(v) for _, _, _, v in subprocess_db.iter_cat_file(inner)]
+            seen.append((bytes(view), nested))
+
+        assert seen == [(b"outer-a", [b"inner"]), (b"outer-b", [b"inner"])]
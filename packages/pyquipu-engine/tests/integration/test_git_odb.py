@@ -0,0 +1,137 @@
+import subprocess
+
+import pytest
+from quipu.engine.git_db import GitDB
+from quipu.engine.git_odb import ObjectStore, apply_delta
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    subprocess.run(["git", "init"], cwd=root, check=True, capture_output=True)
+    subprocess.run(["git", "config", "user.email", "test@quipu.dev"], cwd=root, check=True)
+    subprocess.run(["git", "config", "user.name", "Quipu Test"], cwd=root, check=True)
+    return root
+
+
+def _git(root, *args) -> str:
+    return subprocess.run(["git", *args], cwd=root, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _git_cat(root, object_hash) -> bytes:
+    object_type = _git(root, "cat-file", "-t", object_hash)
+    return subprocess.run(
+        ["git", "cat-file", object_type, object_hash], cwd=root, check=True, capture_output=True
+    ).stdout
+
+
+def _build_history(root, revisions=12):
+    # 反复修改同一个大文件，使 repack 产生 delta 链
+    base = "".join(f"line {i}: the quick brown fox jumps over the lazy dog\n" for i in range(400))
+    for rev in range(revisions):
+        (root / "big.txt").write_text(base + f"revision {rev}\n" * (rev + 1), encoding="utf-8")
+        (root / f"small_{rev}.txt").write_text(f"small {rev}", encoding="utf-8")
+        _git(root, "add", "-A")
+        _git(root, "commit", "-q", "-m", f"rev {rev}")
+
+
+def _all_object_hashes(root):
+    return [line.split(" ", 1)[0] for line in _git(root, "rev-list", "--all", "--objects").split("\n")]
+
+
+class TestObjectStore:
+    def test_reads_loose_objects(self, git_repo):
+        _build_history(git_repo, revisions=3)
+        store = ObjectStore(git_repo / ".git" / "objects")
+
+        for object_hash in _all_object_hashes(git_repo):
+            object_type, content = store.read(object_hash)
+            assert object_type == _git(git_repo, "cat-file", "-t", object_hash)
+            assert content == _git_cat(git_repo, object_hash)
+        store.close()
+
+    @pytest.mark.parametrize("delta_base_offset", ["true", "false"], ids=["ofs_delta", "ref_delta"])
+    def test_reads_packed_objects_with_deltas(self, git_repo, delta_base_offset):
+        _build_history(git_repo)
+        _git(git_repo, "-c", f"repack.useDeltaBaseOffset={delta_base_offset}", "repack", "-a", "-d", "-f", "-q")
+        _git(git_repo, "prune-packed")
+        assert {p.name for p in (git_repo / ".git" / "objects").iterdir()} <= {"pack", "info"}
+
+        verify = _git(git_repo, "verify-pack", "-v", *map(str, (git_repo / ".git/objects/pack").glob("*.idx")))
+        assert "chain length" in verify  # 确认确实生成了 delta
+
+        store = ObjectStore(git_repo / ".git" / "objects")
+        for object_hash in _all_object_hashes(git_repo):
+            object_type, content = store.read(object_hash)
+            assert content == _git_cat(git_repo, object_hash)
+        store.close()
+
+    def test_missing_and_unsupported_hashes_return_none(self, git_repo):
+        store = ObjectStore(git_repo / ".git" / "objects")
+        assert store.read("e" * 40) is None
+        assert store.read("HEAD") is None
+
+    def test_picks_up_packs_created_after_first_read(self, git_repo):
+        _build_history(git_repo, revisions=2)
+        store = ObjectStore(git_repo / ".git" / "objects")
+        assert store.read("e" * 40) is None  # 触发首次 pack 扫描
+
+        _git(git_repo, "repack", "-a", "-d", "-q")
+        _git(git_repo, "prune-packed")
+        head_tree = _git(git_repo, "rev-parse", "HEAD^{tree}")
+
+        assert store.read(head_tree)[0] == "tree"
+        store.close()
+
+    def test_apply_delta(self):
+        base = b"hello world"
+        # src=11, dst=16, copy(offset=0,size=6), insert "quipu ", copy(offset=6,size=4)
+        delta = bytes([11, 16, 0x90, 6, 6]) + b"quipu " + bytes([0x91, 6, 4])
+        assert apply_delta(base, delta) == b"hello quipu worl"
+
+        with pytest.raises(ValueError):
+            apply_delta(b"short", delta)
+
+
+class TestGitDBNativeReads:
+    def test_native_reads_do_not_start_coprocess(self, git_repo):
+        _build_history(git_repo, revisions=2)
+        _git(git_repo, "gc", "-q")
+        head = _git(git_repo, "rev-parse", "HEAD")
+        db = GitDB(git_repo)
+
+        assert db.cat_file(head, "tree") == _git_cat(git_repo, _git(git_repo, "rev-parse", "HEAD^{tree}"))
+        blobs = db.batch_cat_file([f"{head}:small_1.txt", f"{head}^{{tree}}"])
+        assert blobs[f"{head}:small_1.txt"] == b"small 1"
+        assert {"big.txt", "small_0.txt"} <= set(db.get_blobs_from_tree(head))
+        assert [bytes(v) for *_, v in db.iter_cat_file([f"{head}:small_0.txt"])] == [b"small 0"]
+
+        assert db._cat_file_batch().pid is None
+        assert db._cat_file_stream().pid is None
+        db.close()
+
+    def test_falls_back_to_coprocess_for_unsupported_revs(self, git_repo):
+        _build_history(git_repo, revisions=1)
+        db = GitDB(git_repo)
+
+        assert db.batch_cat_file(["HEAD:small_0.txt"]) == {"HEAD:small_0.txt": b"small 0"}
+        assert db._cat_file_batch().pid is not None
+        db.close()
+
+    def test_read_errors_fall_back_to_coprocess(self, git_repo, monkeypatch):
+        _build_history(git_repo, revisions=1)
+        blob_hash = _git(git_repo, "rev-parse", "HEAD:small_0.txt")
+        db = GitDB(git_repo)
+
+        def corrupt_read(object_hash):
+            raise ValueError("corrupt object")
+
+        monkeypatch.setattr(db._odb, "read", corrupt_read)
+
+        assert db.cat_file(blob_hash, "blob") == b"small 0"
+        db.close()
+
+    def test_native_odb_can_be_disabled(self, git_repo):
+        db = GitDB(git_repo, native_odb=False)
+        assert db._odb is None
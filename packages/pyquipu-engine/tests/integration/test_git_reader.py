@@ -183,3 +183,262 @@ class TestGitObjectHistoryReader:
         # C should be correctly parented to A, effectively ignoring the bad commit.
         assert found_node_c.parent == found_node_a
         assert found_node_a.children == [found_node_c]
+
+
+class TestBatchContents:
+    def test_contents_are_loaded_in_one_batch(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        input_tree = EMPTY_TREE_HASH
+        for name in ("a", "b", "c"):
+            (repo / name).write_text(name)
+            output_tree = git_db.get_tree_hash()
+            writer.create_node("plan", input_tree, output_tree, f"Plan {name}")
+            input_tree = output_tree
+        nodes = reader.load_all_nodes()
+
+        calls = []
+        original_batch = git_db.batch_cat_file
+        monkeypatch.setattr(git_db, "batch_cat_file", lambda revs: calls.append(revs) or original_batch(revs))
+        contents = reader.get_node_contents(nodes)
+
+        assert len(calls) == 1
+        assert sorted(c.strip() for c in contents.values()) == ["Plan a", "Plan b", "Plan c"]
+        # 内容被缓存到节点上，再次调用不再访问 Git
+        assert all(n.content for n in nodes)
+        assert reader.get_node_contents(nodes) == contents
+        assert len(calls) == 1
+
+
+class TestCompactGraph:
+    def test_compact_graph_matches_loaded_nodes(self, reader_setup):
+        reader, writer, git_db, repo = reader_setup
+        input_tree = EMPTY_TREE_HASH
+        for name in ("a", "b"):
+            (repo / name).write_text(name)
+            output_tree = git_db.get_tree_hash()
+            writer.create_node("plan", input_tree, output_tree, f"Plan {name}")
+        # 两个节点都以空树为输入，各自成为根节点
+        nodes = {n.commit_hash: n for n in reader.load_all_nodes()}
+        graph = reader.load_compact_graph()
+
+        assert len(graph) == len(nodes)
+        for view in graph:
+            node = nodes[view.commit_hash]
+            assert (view.summary, view.node_type, view.output_tree) == (node.summary, node.node_type, node.output_tree)
+            assert view.input_tree == node.input_tree
+            assert view.timestamp == node.timestamp
+            assert (view.parent.commit_hash if view.parent else None) == (
+                node.parent.commit_hash if node.parent else None
+            )
+
+    def test_compact_graph_keeps_output_tree_index_in_sync(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        (repo / "a").write_text("a")
+        node_a = writer.create_node("plan", EMPTY_TREE_HASH, git_db.get_tree_hash(), "Plan a")
+        reader.load_all_nodes()
+        assert git_db.output_tree_index.initialized
+
+        # 模拟 fetch 带来的节点：提交时不经过本地索引
+        (repo / "b").write_text("b")
+        with monkeypatch.context() as m:
+            m.setattr(git_db.output_tree_index, "record", lambda tree_hash, commit_hash: None)
+            node_b = writer.create_node("plan", node_a.output_tree, git_db.get_tree_hash(), "Plan b")
+
+        # 先由紧凑图消费节点表的变化，之后的加载不再看到变化
+        reader.load_compact_graph()
+        reader.load_all_nodes()
+        assert git_db.get_commit_by_output_tree(node_b.output_tree) == node_b.commit_hash
+
+
+class TestTrailerMetadata:
+    def test_trailer_nodes_load_without_object_reads(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        (repo / "a").touch()
+        h1 = git_db.get_tree_hash()
+        writer.create_node("plan", EMPTY_TREE_HASH, h1, "Plan A", start_time=1000, owner_id="alice")
+        (repo / "b").touch()
+        h2 = git_db.get_tree_hash()
+        writer.create_node("capture", h1, h2, "", summary_override="多行摘要\n\n第二段", start_time=2000)
+
+        monkeypatch.setattr(git_db, "iter_cat_file", lambda objs: pytest.fail("unexpected object read"))
+        nodes = sorted(reader.load_all_nodes(), key=lambda n: n.timestamp)
+
+        assert [(n.node_type, n.summary, n.timestamp.timestamp()) for n in nodes] == [
+            ("plan", "Plan A", 1000.0),
+            ("capture", "多行摘要\n\n第二段", 2000.0),
+        ]
+        assert nodes[0].owner_id == "alice"
+        assert nodes[1].parent is nodes[0]
+
+    def test_legacy_nodes_fall_back_to_metadata_json(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        (repo / "a").touch()
+        h1 = git_db.get_tree_hash()
+        with monkeypatch.context() as m:
+            m.setattr(
+                writer,
+                "_build_commit_message",
+                lambda summary, output_tree, *_: f"{summary}\n\nX-Quipu-Output-Tree: {output_tree}",
+            )
+            legacy = writer.create_node("plan", EMPTY_TREE_HASH, h1, "Legacy", start_time=1000)
+        (repo / "b").touch()
+        h2 = git_db.get_tree_hash()
+        current = writer.create_node("plan", h1, h2, "Current", start_time=2000)
+
+        nodes = {n.commit_hash: n for n in reader.load_all_nodes()}
+
+        assert nodes[legacy.commit_hash].summary == "Legacy"
+        assert nodes[legacy.commit_hash].timestamp.timestamp() == 1000.0
+        assert nodes[current.commit_hash].parent is nodes[legacy.commit_hash]
+
+
+class TestContentSearch:
+    def test_content_search_ranks_by_occurrences(self, reader_setup):
+        reader, writer, git_db, repo = reader_setup
+        input_tree = EMPTY_TREE_HASH
+        for i, content in enumerate(["cache once", "cache cache twice", "nothing here"]):
+            (repo / str(i)).write_text(content)
+            output_tree = git_db.get_tree_hash()
+            writer.create_node("plan", input_tree, output_tree, content, summary_override=f"Plan {i}", start_time=i)
+            input_tree = output_tree
+
+        results = reader.find_nodes(content_query="cache")
+        assert [n.summary for n in results] == ["Plan 1", "Plan 0"]
+        # 所有词都须出现
+        assert [n.summary for n in reader.find_nodes(content_query="CACHE once")] == ["Plan 0"]
+        assert reader.find_nodes(content_query="cache", node_type="capture") == []
+
+
+class TestNodeTable:
+    def _build_chain(self, writer, git_db, repo, names):
+        nodes = []
+        input_tree = EMPTY_TREE_HASH
+        for i, name in enumerate(names):
+            (repo / name).write_text(name)
+            output_tree = git_db.get_tree_hash()
+            nodes.append(writer.create_node("plan", input_tree, output_tree, name, start_time=1000 + i))
+            input_tree = output_tree
+        return nodes
+
+    def test_unchanged_history_skips_git_walk(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        self._build_chain(writer, git_db, repo, ["a", "b", "c"])
+        first = reader.load_all_nodes()
+        assert reader.node_table.path.exists()
+
+        def fail(*args, **kwargs):
+            raise AssertionError("history should come from the node table")
+
+        monkeypatch.setattr(git_db, "iter_log", fail)
+        monkeypatch.setattr(git_db, "iter_cat_file", fail)
+        second = reader.load_all_nodes()
+
+        assert sorted(n.commit_hash for n in second) == sorted(n.commit_hash for n in first)
+        by_summary = {n.summary: n for n in second}
+        assert by_summary["c"].parent.commit_hash == by_summary["b"].commit_hash
+        assert by_summary["c"].input_tree == by_summary["b"].output_tree
+
+    def test_new_head_walks_only_new_commits(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        node_a, node_b = self._build_chain(writer, git_db, repo, ["a", "b"])
+        reader.load_all_nodes()
+
+        (repo / "c").write_text("c")
+        node_c = writer.create_node("plan", node_b.output_tree, git_db.get_tree_hash(), "c", start_time=2000)
+
+        walked = []
+        original_iter_log = git_db.iter_log
+
+        def recording_iter_log(revisions):
+            for entry in original_iter_log(revisions):
+                walked.append(entry["hash"])
+                yield entry
+
+        monkeypatch.setattr(git_db, "iter_log", recording_iter_log)
+        nodes = reader.load_all_nodes()
+
+        assert walked == [node_c.commit_hash]
+        assert len(nodes) == 3
+        found_c = next(n for n in nodes if n.commit_hash == node_c.commit_hash)
+        assert found_c.parent.commit_hash == node_b.commit_hash
+        assert found_c.input_tree == node_b.output_tree
+
+    def test_removed_head_drops_unreachable_nodes(self, reader_setup):
+        reader, writer, git_db, repo = reader_setup
+        (node_a,) = self._build_chain(writer, git_db, repo, ["a"])
+        (repo / "fork").write_text("fork")
+        fork = writer.create_node("plan", node_a.output_tree, git_db.get_tree_hash(), "fork", start_time=3000)
+        assert len(reader.load_all_nodes()) == 2
+
+        git_db.delete_ref(f"refs/quipu/local/heads/{fork.commit_hash}")
+        nodes = reader.load_all_nodes()
+
+        assert [n.commit_hash for n in nodes] == [node_a.commit_hash]
+        heads, records = reader.node_table.load()
+        assert fork.commit_hash not in records
+
+    def test_removed_head_is_dropped_from_output_tree_index(self, reader_setup):
+        reader, writer, git_db, repo = reader_setup
+        (node_a,) = self._build_chain(writer, git_db, repo, ["a"])
+        (repo / "fork").write_text("fork")
+        fork = writer.create_node("plan", node_a.output_tree, git_db.get_tree_hash(), "fork", start_time=3000)
+        reader.load_all_nodes()
+        assert git_db.get_commit_by_output_tree(fork.output_tree) == fork.commit_hash
+
+        git_db.delete_ref(f"refs/quipu/local/heads/{fork.commit_hash}")
+        reader.load_all_nodes()
+
+        # 被剪除的提交不能再作为新节点的父节点
+        assert git_db.get_commit_by_output_tree(fork.output_tree) is None
+        assert git_db.get_commit_by_output_tree(node_a.output_tree) == node_a.commit_hash
+
+    def test_corrupt_table_is_rebuilt(self, reader_setup):
+        reader, writer, git_db, repo = reader_setup
+        self._build_chain(writer, git_db, repo, ["a", "b"])
+        reader.node_table.path.parent.mkdir(exist_ok=True)
+        reader.node_table.path.write_text("{not json")
+
+        nodes = reader.load_all_nodes()
+
+        assert len(nodes) == 2
+        heads, records = reader.node_table.load()
+        assert set(records) == {n.commit_hash for n in nodes}
+
+
+class TestGraphSnapshot:
+    def test_queries_share_one_snapshot_until_refs_change(self, reader_setup, monkeypatch):
+        reader, writer, git_db, repo = reader_setup
+        (repo / "a").write_text("a")
+        node_a = writer.create_node("plan", EMPTY_TREE_HASH, git_db.get_tree_hash(), "a", start_time=1000)
+        (repo / "b").write_text("b")
+        node_b = writer.create_node("plan", node_a.output_tree, git_db.get_tree_hash(), "b", start_time=2000)
+
+        loads = []
+        original_load = reader._load_nodes
+
+        def counting_load():
+            loads.append(1)
+            return original_load()
+
+        monkeypatch.setattr(reader, "_load_nodes", counting_load)
+
+        assert reader.get_node_count() == 2
+        assert reader.get_node_position(node_b.output_tree) == 0
+        assert [n.commit_hash for n in reader.load_nodes_paginated(limit=1, offset=1)] == [node_a.commit_hash]
+        assert [n.commit_hash for n in reader.load_nodes_page(limit=1, after=node_b.commit_hash)] == [
+            node_a.commit_hash
+        ]
+        assert [n.commit_hash for n in reader.load_nodes_page(limit=5, before=node_a.commit_hash)] == [
+            node_b.commit_hash
+        ]
+        assert reader.get_ancestor_output_trees(node_b.output_tree) == {node_a.output_tree}
+        assert reader.get_descendant_output_trees(node_a.output_tree) == {node_b.output_tree}
+        assert len(reader.find_nodes(node_type="plan")) == 2
+        assert len(loads) == 1
+
+        (repo / "c").write_text("c")
+        node_c = writer.create_node("plan", node_b.output_tree, git_db.get_tree_hash(), "c", start_time=3000)
+
+        assert reader.get_node_position(node_c.output_tree) == 0
+        assert reader.get_node_count() == 3
+        assert len(loads) == 2
@@ -84,6 +84,8 @@ class TestGitObjectHistoryWriterIntegration:
         assert "tree " in commit_data
         assert "feat: Initial implementation" in commit_data
         assert f"X-Quipu-Output-Tree: {output_tree}" in commit_data
+        assert "X-Quipu-Meta-Version: 1.1" in commit_data
+        assert "X-Quipu-Type: plan" in commit_data
 
         # 3.3 检查 Tree 内容
         tree_hash = commit_data.splitlines()[0].split(" ")[1]
@@ -98,7 +100,144 @@ class TestGitObjectHistoryWriterIntegration:
         )
         meta_data = json.loads(meta_content_str)
 
-        assert meta_data["meta_version"] == "1.0"
+        assert meta_data["meta_version"] == "1.1"
         assert meta_data["type"] == "plan"
         assert meta_data["summary"] == "feat: Initial implementation"
         assert meta_data["generator"]["id"] == "manual"
+
+
+class TestBatchedWriteSession:
+    def test_session_objects_match_git_plumbing(self, git_writer_setup, monkeypatch):
+        _, git_db, _ = git_writer_setup
+        monkeypatch.setenv("GIT_AUTHOR_DATE", "1700000000 +0800")
+        monkeypatch.setenv("GIT_COMMITTER_DATE", "1700000000 +0800")
+        session = git_db.write_session()
+
+        content = "内容 with unicode\n".encode("utf-8")
+        blob_hash = git_db.hash_object(content)
+        assert session.hash_object(content) == blob_hash
+
+        descriptor = (
+            f"100444 blob {blob_hash}\tmetadata.json\n"
+            f"100444 blob {blob_hash}\tcontent.md\n"
+            f"040000 tree {EMPTY_TREE_HASH}\tsnapshot"
+        )
+        tree_hash = git_db.mktree(descriptor)
+        assert session.mktree(descriptor) == tree_hash
+
+        message = f"feat: 摘要\n\nX-Quipu-Output-Tree: {EMPTY_TREE_HASH}"
+        parent = git_db.commit_tree(tree_hash, None, "root")
+        assert session.commit_tree(tree_hash, [parent], message) == git_db.commit_tree(tree_hash, [parent], message)
+
+    def test_batched_nodes_spawn_no_processes(self, git_writer_setup, monkeypatch):
+        _, git_db, repo_path = git_writer_setup
+        writer = GitObjectHistoryWriter(git_db, batched=True)
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        output_tree = git_db.get_tree_hash()
+
+        parent = writer.create_node("plan", EMPTY_TREE_HASH, output_tree, "# warm up").commit_hash
+
+        spawned = []
+        original_popen = subprocess.Popen.__init__
+
+        def counting_popen(self, args, *a, **kw):
+            spawned.append(args)
+            original_popen(self, args, *a, **kw)
+
+        monkeypatch.setattr(subprocess.Popen, "__init__", counting_popen)
+        for i in range(5):
+            node = writer.create_node(
+                "plan", output_tree, output_tree, f"# step {i}", parent_commit_hash=parent, summary_override=f"s{i}"
+            )
+            parent = node.commit_hash
+        monkeypatch.undo()
+
+        assert spawned == []
+        heads = subprocess.check_output(["git", "for-each-ref", "refs/quipu/local/heads/"], cwd=repo_path, text=True)
+        assert len(heads.splitlines()) == 6
+        subprocess.run(["git", "fsck", "--strict"], cwd=repo_path, check=True, capture_output=True)
+        git_db.close()
+
+    def test_failed_ref_update_raises_and_recovers(self, git_writer_setup):
+        _, git_db, _ = git_writer_setup
+        session = git_db.write_session()
+
+        with pytest.raises(RuntimeError, match="update-ref"):
+            session.update_ref("refs/quipu/local/heads/bogus", "1" * 40)
+
+        commit_hash = git_db.commit_tree(EMPTY_TREE_HASH, None, "ok")
+        session.update_ref("refs/quipu/local/heads/ok", commit_hash)
+        assert git_db.get_all_ref_heads("refs/quipu/local/heads/") == [(commit_hash, "refs/quipu/local/heads/ok")]
+        git_db.close()
+
+
+class TestHeadCompaction:
+    @pytest.mark.parametrize("batched", [False, True], ids=["plumbing", "session"])
+    def test_writes_keep_only_branch_tips(self, git_writer_setup, batched):
+        _, git_db, repo_path = git_writer_setup
+        writer = GitObjectHistoryWriter(git_db, batched=batched, compact_heads=True)
+
+        root = writer.create_node("plan", EMPTY_TREE_HASH, EMPTY_TREE_HASH, "# root").commit_hash
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        leaf_a = writer.create_node("plan", EMPTY_TREE_HASH, tree_a, "# a", parent_commit_hash=root).commit_hash
+        (repo_path / "a.txt").write_text("b", "utf-8")
+        tree_b = git_db.get_tree_hash()
+        leaf_b = writer.create_node("plan", EMPTY_TREE_HASH, tree_b, "# b", parent_commit_hash=root).commit_hash
+
+        heads = {commit for commit, _ in git_db.get_all_ref_heads("refs/quipu/local/heads/")}
+        assert heads == {leaf_a, leaf_b}
+        assert git_db.find_redundant_heads() == []
+
+    def test_packs_refs_past_threshold(self, git_writer_setup, monkeypatch):
+        _, git_db, repo_path = git_writer_setup
+        monkeypatch.setattr(GitDB, "PACK_REFS_THRESHOLD", 2)
+        writer = GitObjectHistoryWriter(git_db, compact_heads=True)
+
+        for i in range(3):
+            (repo_path / "f.txt").write_text(str(i), "utf-8")
+            writer.create_node("plan", EMPTY_TREE_HASH, git_db.get_tree_hash(), f"# detached {i}")
+
+        assert git_db.count_loose_refs() <= 2
+        assert len(git_db.get_all_ref_heads("refs/quipu/local/heads/")) == 3
+        assert "refs/quipu/local/heads/" in (repo_path / ".git" / "packed-refs").read_text()
+
+
+class TestOutputTreeIndexLookup:
+    def test_parent_resolved_from_index_after_load(self, git_writer_setup, monkeypatch):
+        from quipu.engine.git_object_storage import GitObjectHistoryReader
+
+        writer, git_db, repo_path = git_writer_setup
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", EMPTY_TREE_HASH, tree_a, "# A")
+
+        # 加载历史即建立索引
+        GitObjectHistoryReader(git_db).load_all_nodes()
+        assert git_db.output_tree_index.initialized
+
+        original_run = git_db._run
+
+        def guarded_run(args, **kwargs):
+            assert args[0] != "log", "parent lookup must not run git log --grep"
+            return original_run(args, **kwargs)
+
+        monkeypatch.setattr(git_db, "_run", guarded_run)
+        (repo_path / "b.txt").write_text("b", "utf-8")
+        tree_b = git_db.get_tree_hash()
+        node_b = writer.create_node("plan", tree_a, tree_b, "# B")
+        node_c = writer.create_node("plan", tree_b, tree_b, "# C")
+
+        assert node_b.parent.commit_hash == node_a.commit_hash
+        # 写入时同步更新索引
+        assert node_c.parent.commit_hash == node_b.commit_hash
+        assert git_db.get_commit_by_output_tree("f" * 40) is None
+
+    def test_falls_back_to_grep_before_index_exists(self, git_writer_setup):
+        writer, git_db, repo_path = git_writer_setup
+        (repo_path / "a.txt").write_text("a", "utf-8")
+        tree_a = git_db.get_tree_hash()
+        node_a = writer.create_node("plan", EMPTY_TREE_HASH, tree_a, "# A")
+
+        assert not git_db.output_tree_index.initialized
+        assert git_db.get_commit_by_output_tree(tree_a) == node_a.commit_hash
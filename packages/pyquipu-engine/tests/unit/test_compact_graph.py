@@ -0,0 +1,76 @@
+from datetime import datetime
+from pathlib import Path
+
+from quipu.spec.constants import EMPTY_TREE_HASH
+from quipu.spec.models.compact_graph import CompactGraph, NodeRow, NodeView
+from quipu.spec.models.graph import QuipuNode
+
+
+def _h(i: int, prefix: str = "c") -> str:
+    return f"{prefix}{i:039x}"
+
+
+def _rows():
+    # 0 -> 1 -> 3, 0 -> 2 (分叉)，4 为另一棵树的根；行顺序故意打乱
+    return [
+        NodeRow(_h(3), _h(1), _h(3, "a"), 4000.0, "plan", "three", "alice"),
+        NodeRow(_h(0), None, _h(0, "a"), 1000.0, "capture", "zero", None),
+        NodeRow(_h(2), _h(0), _h(2, "a"), 3000.0, "plan", "two", "bob"),
+        NodeRow(_h(1), _h(0), _h(1, "a"), 2000.0, "plan", "one", "alice"),
+        NodeRow(_h(4), _h(99), _h(4, "a"), 5000.0, "plan", "orphan", None),
+    ]
+
+
+def test_views_expose_the_node_api():
+    graph = CompactGraph.build(_rows())
+
+    assert len(graph) == 5
+    root = graph.get(_h(0))
+    assert isinstance(root, NodeView)
+    assert root.parent is None
+    assert root.input_tree == EMPTY_TREE_HASH
+    assert root.node_type == "capture"
+    assert root.timestamp == datetime.fromtimestamp(1000.0)
+    assert root.filename == Path(f".quipu/git_objects/{_h(0)}")
+    # 子节点按时间戳排序
+    assert [c.summary for c in root.children] == ["one", "two"]
+
+    three = graph.get(_h(3))
+    assert three.parent == graph.get(_h(1))
+    assert three.input_tree == _h(1, "a")
+    assert three.owner_id == "alice"
+    assert three.short_hash == _h(3, "a")[:7]
+    assert [s.summary for s in graph.get(_h(2)).siblings] == ["one", "two"]
+
+    # 父节点不在图中时视为根
+    assert graph.get(_h(4)).parent is None
+    assert graph.get(_h(42)) is None
+    assert _h(1) in graph
+
+
+def test_to_nodes_round_trips_through_quipu_nodes():
+    graph = CompactGraph.build(_rows())
+    nodes = graph.to_nodes()
+
+    assert all(isinstance(n, QuipuNode) for n in nodes.values())
+    assert nodes[_h(3)].parent is nodes[_h(1)]
+    assert [c.commit_hash for c in nodes[_h(0)].children] == [_h(1), _h(2)]
+
+    rebuilt = CompactGraph.from_nodes(nodes.values())
+    for view in rebuilt:
+        original = nodes[view.commit_hash]
+        assert view.materialize().summary == original.summary
+        assert view.input_tree == original.input_tree
+        assert [c.commit_hash for c in view.children] == [c.commit_hash for c in original.children]
+
+
+def test_hashes_are_interned_once():
+    rows = [
+        NodeRow(_h(0), None, _h(7, "a"), 1.0, "plan", "a"),
+        # 与上一个节点产出相同的 tree
+        NodeRow(_h(1), _h(0), _h(7, "a"), 2.0, "plan", "b"),
+    ]
+    graph = CompactGraph.build(rows)
+
+    assert len(graph._hash_table) == 3 * 20
+    assert graph.get(_h(1)).output_tree == graph.get(_h(0)).output_tree
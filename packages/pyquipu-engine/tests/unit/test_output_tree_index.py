@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+from quipu.engine.output_tree_index import OutputTreeIndex
+
+
+def _h(i: int, prefix: str = "a") -> str:
+    return f"{prefix}{i:039x}"
+
+
+@pytest.fixture
+def index_path(tmp_path: Path) -> Path:
+    return tmp_path / ".quipu" / "output_tree.idx"
+
+
+def test_uninitialized_index_ignores_appends(index_path: Path):
+    index = OutputTreeIndex(index_path)
+    index.record(_h(1), _h(1, "c"))
+
+    assert not index.initialized
+    assert index.lookup(_h(1)) is None
+
+
+def test_rebuild_and_lookup(index_path: Path):
+    index = OutputTreeIndex(index_path)
+    index.rebuild([(_h(i), _h(i, "c")) for i in range(100)])
+
+    assert index.initialized
+    assert index.lookup(_h(42)) == _h(42, "c")
+    assert index.lookup(_h(100)) is None
+    # 文件大小为 header + 每条 40 字节
+    assert index_path.stat().st_size == 12 + 100 * 40
+
+
+def test_appends_are_visible_to_other_instances(index_path: Path):
+    writer = OutputTreeIndex(index_path)
+    writer.rebuild([(_h(1), _h(1, "c"))])
+    reader = OutputTreeIndex(index_path)
+    assert reader.lookup(_h(1)) == _h(1, "c")
+
+    writer.record(_h(2), _h(2, "c"))
+    # 同一个 output_tree 的新记录覆盖旧记录
+    writer.record(_h(1), _h(9, "c"))
+
+    assert reader.lookup(_h(2)) == _h(2, "c")
+    assert reader.lookup(_h(1)) == _h(9, "c")
+
+
+def test_compaction_keeps_latest_entries(index_path: Path, monkeypatch):
+    monkeypatch.setattr(OutputTreeIndex, "COMPACT_THRESHOLD", 4)
+    index = OutputTreeIndex(index_path)
+    index.rebuild([])
+
+    for i in range(10):
+        index.record(_h(i % 3), _h(i, "c"))
+
+    assert index.lookup(_h(0)) == _h(9, "c")
+    assert index.lookup(_h(1)) == _h(7, "c")
+    assert index.lookup(_h(2)) == _h(8, "c")
+    assert len(index._tail) <= 4
+
+
+def test_missing_reports_stale_entries(index_path: Path):
+    index = OutputTreeIndex(index_path)
+    index.rebuild([(_h(1), _h(1, "c")), (_h(2), _h(2, "c"))])
+
+    missing = index.missing({_h(1): _h(1, "c"), _h(2): _h(5, "c"), _h(3): _h(3, "c")})
+
+    assert missing == [(_h(2), _h(5, "c")), (_h(3), _h(3, "c"))]
+
+
+def test_corrupt_index_raises_value_error(index_path: Path):
+    index_path.parent.mkdir(parents=True)
+    index_path.write_bytes(b"garbage-without-header")
+
+    with pytest.raises(ValueError):
+        OutputTreeIndex(index_path).lookup(_h(1))
@@ -0,0 +1,92 @@
+import random
+from typing import Dict, Optional, Set
+
+from quipu.engine.reachability import ReachabilityIndex
+
+
+def _random_forest(count: int, seed: int) -> Dict[str, Optional[str]]:
+    rng = random.Random(seed)
+    edges: Dict[str, Optional[str]] = {}
+    for i in range(count):
+        commit = f"c{i}"
+        edges[commit] = rng.choice(list(edges)) if edges and rng.random() > 0.1 else None
+    return edges
+
+
+def _brute_ancestors(edges: Dict[str, Optional[str]], commit: str) -> Set[str]:
+    result = set()
+    current = edges[commit]
+    while current is not None:
+        result.add(current)
+        current = edges[current]
+    return result
+
+
+def _assert_matches(index: ReachabilityIndex, edges: Dict[str, Optional[str]]):
+    assert len(index) == len(edges)
+    for commit in edges:
+        ancestors = _brute_ancestors(edges, commit)
+        assert set(index.ancestors(commit)) == ancestors
+        descendants = {other for other in edges if commit in _brute_ancestors(edges, other)}
+        assert set(index.descendants(commit)) == descendants
+        assert len(index.descendants(commit)) == len(descendants)
+        for other in edges:
+            assert index.is_ancestor(commit, other) == (other in descendants)
+
+
+def test_rebuild_matches_brute_force():
+    edges = _random_forest(150, seed=1)
+    index = ReachabilityIndex()
+    index.rebuild(edges.items())
+
+    _assert_matches(index, edges)
+
+
+def test_appended_nodes_are_queryable_before_and_after_relabel(monkeypatch):
+    monkeypatch.setattr(ReachabilityIndex, "RELABEL_THRESHOLD", 20)
+    edges = _random_forest(120, seed=2)
+    items = list(edges.items())
+    index = ReachabilityIndex()
+    index.rebuild(items[:60])
+
+    for commit, parent in items[60:75]:
+        index.add(commit, parent)
+    # 追加区尚未超过阈值
+    assert len(index._pending) == 15
+    _assert_matches(index, dict(items[:75]))
+
+    for commit, parent in items[75:]:
+        index.add(commit, parent)
+    assert len(index._pending) < 20
+    _assert_matches(index, edges)
+
+
+def test_update_appends_new_nodes_and_rebuilds_on_removal():
+    edges = {"a": None, "b": "a", "c": "b", "d": "a"}
+    index = ReachabilityIndex()
+    index.update(edges.items())
+
+    # 子节点先于父节点出现也能正确追加
+    edges.update({"f": "e", "e": "c"})
+    index.update(edges.items())
+    assert index.is_ancestor("a", "f")
+    assert index.ancestors("f") == ["e", "c", "b", "a"]
+
+    del edges["d"]
+    index.update(edges.items())
+    assert "d" not in index
+    assert index._pending == {}
+    _assert_matches(index, edges)
+
+
+def test_unknown_commits_and_deep_chains():
+    index = ReachabilityIndex()
+    # 深链不能触发递归上限
+    index.rebuild((f"c{i}", f"c{i - 1}" if i else None) for i in range(5000))
+
+    assert index.is_ancestor("c0", "c4999")
+    assert not index.is_ancestor("c4999", "c0")
+    assert len(index.descendants("c0")) == 4999
+    assert index.ancestors("missing") == []
+    assert index.descendants("missing") == []
+    assert not index.is_ancestor("missing", "c1")
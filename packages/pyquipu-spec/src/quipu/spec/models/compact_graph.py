@@ -0,0 +1,232 @@
+from __future__ import annotations
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from ..constants import EMPTY_TREE_HASH
+from .graph import QuipuNode
+
+
+class NodeRow(NamedTuple):
+    commit_hash: str
+    parent_hash: Optional[str]
+    output_tree: str
+    timestamp: float
+    node_type: str
+    summary: str
+    owner_id: Optional[str] = None
+
+
+class _StringTable:
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class CompactGraph:
+    _HASH_LEN = 20
+
+    def __init__(self):
+        # 所有 commit 与 output_tree 哈希以 20 字节形式驻留在同一张表中
+        self._hash_table = bytearray()
+        self._hash_ids: Dict[bytes, int] = {}
+        self._commit_ids = array("i")
+        self._tree_ids = array("i")
+        # 父节点的行号，根节点为 -1
+        self._parents = array("i")
+        self._timestamps = array("d")
+        self._type_codes = array("B")
+        self._owner_codes = array("H")
+        self._types = _StringTable()
+        self._owners = _StringTable()
+        self._summaries: List[str] = []
+        # CSR 邻接：第 i 行的子节点为 _children[_child_offsets[i] : _child_offsets[i + 1]]
+        self._child_offsets = array("i", [0])
+        self._children = array("i")
+        self._row_by_commit: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def build(cls, rows: Iterable[NodeRow]) -> CompactGraph:
+        graph = cls()
+        rows = list(rows)
+        row_by_commit = {row.commit_hash: i for i, row in enumerate(rows)}
+        for row in rows:
+            graph._commit_ids.append(graph._intern(row.commit_hash))
+            graph._tree_ids.append(graph._intern(row.output_tree))
+            parent = row_by_commit.get(row.parent_hash, -1) if row.parent_hash else -1
+            graph._parents.append(parent)
+            graph._timestamps.append(row.timestamp)
+            graph._type_codes.append(graph._types.code(row.node_type))
+            graph._owner_codes.append(graph._owners.code(row.owner_id))
+            graph._summaries.append(row.summary)
+        graph._build_children()
+        # 构建用的查找表不随图常驻；按哈希查找时再惰性建立
+        graph._hash_ids = {}
+        return graph
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[QuipuNode]) -> CompactGraph:
+        return cls.build(
+            NodeRow(
+                commit_hash=node.commit_hash,
+                parent_hash=node.parent.commit_hash if node.parent else None,
+                output_tree=node.output_tree,
+                timestamp=node.timestamp.timestamp(),
+                node_type=node.node_type,
+                summary=node.summary,
+                owner_id=node.owner_id,
+            )
+            for node in nodes
+        )
+
+    def _intern(self, hex_hash: str) -> int:
+        key = bytes.fromhex(hex_hash)
+        hash_id = self._hash_ids.get(key)
+        if hash_id is None:
+            hash_id = self._hash_ids[key] = len(self._hash_table) // self._HASH_LEN
+            self._hash_table += key
+        return hash_id
+
+    def _hash(self, hash_id: int) -> str:
+        start = hash_id * self._HASH_LEN
+        return self._hash_table[start : start + self._HASH_LEN].hex()
+
+    def _build_children(self):
+        count = len(self._parents)
+        degree = array("i", [0]) * (count + 1)
+        for parent in self._parents:
+            if parent >= 0:
+                degree[parent + 1] += 1
+        for i in range(count):
+            degree[i + 1] += degree[i]
+        children = array("i", [0]) * degree[count]
+        cursor = array("i", degree)
+        # 按时间顺序填充，使每个节点的子节点天然按时间戳排序
+        for row in sorted(range(count), key=self._timestamps.__getitem__):
+            parent = self._parents[row]
+            if parent >= 0:
+                children[cursor[parent]] = row
+                cursor[parent] += 1
+        self._child_offsets, self._children = degree, children
+
+    def __len__(self) -> int:
+        return len(self._parents)
+
+    def __iter__(self) -> Iterator[NodeView]:
+        return (NodeView(self, row) for row in range(len(self)))
+
+    def __contains__(self, commit_hash: str) -> bool:
+        return self.row_of(commit_hash) is not None
+
+    def row_of(self, commit_hash: str) -> Optional[int]:
+        if self._row_by_commit is None:
+            self._row_by_commit = {self._hash(cid): row for row, cid in enumerate(self._commit_ids)}
+        return self._row_by_commit.get(commit_hash)
+
+    def get(self, commit_hash: str) -> Optional[NodeView]:
+        row = self.row_of(commit_hash)
+        return NodeView(self, row) if row is not None else None
+
+    def child_rows(self, row: int) -> array:
+        return self._children[self._child_offsets[row] : self._child_offsets[row + 1]]
+
+    def to_nodes(self) -> Dict[str, QuipuNode]:
+        nodes = [view.materialize() for view in self]
+        for row, node in enumerate(nodes):
+            parent = self._parents[row]
+            if parent >= 0:
+                node.parent = nodes[parent]
+            node.children = [nodes[child] for child in self.child_rows(row)]
+        return {node.commit_hash: node for node in nodes}
+
+
+class NodeView:
+    __slots__ = ("_graph", "_row", "content")
+
+    def __init__(self, graph: CompactGraph, row: int):
+        self._graph = graph
+        self._row = row
+        self.content = ""
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, NodeView) and other._graph is self._graph and other._row == self._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._graph), self._row))
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.commit_hash[:7]}, {self.node_type}, {self.summary!r})"
+
+    @property
+    def commit_hash(self) -> str:
+        return self._graph._hash(self._graph._commit_ids[self._row])
+
+    @property
+    def output_tree(self) -> str:
+        return self._graph._hash(self._graph._tree_ids[self._row])
+
+    @property
+    def input_tree(self) -> str:
+        parent = self._graph._parents[self._row]
+        return self._graph._hash(self._graph._tree_ids[parent]) if parent >= 0 else EMPTY_TREE_HASH
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self._graph._timestamps[self._row])
+
+    @property
+    def filename(self) -> Path:
+        return Path(f".quipu/git_objects/{self.commit_hash}")
+
+    @property
+    def node_type(self) -> str:
+        return self._graph._types.values[self._graph._type_codes[self._row]]
+
+    @property
+    def summary(self) -> str:
+        return self._graph._summaries[self._row]
+
+    @property
+    def owner_id(self) -> Optional[str]:
+        return self._graph._owners.values[self._graph._owner_codes[self._row]]
+
+    @property
+    def parent(self) -> Optional[NodeView]:
+        parent = self._graph._parents[self._row]
+        return NodeView(self._graph, parent) if parent >= 0 else None
+
+    @property
+    def children(self) -> List[NodeView]:
+        return [NodeView(self._graph, child) for child in self._graph.child_rows(self._row)]
+
+    @property
+    def siblings(self) -> List[NodeView]:
+        parent = self.parent
+        return parent.children if parent else [self]
+
+    @property
+    def short_hash(self) -> str:
+        return self.output_tree[:7]
+
+    def materialize(self) -> QuipuNode:
+        return QuipuNode(
+            commit_hash=self.commit_hash,
+            output_tree=self.output_tree,
+            input_tree=self.input_tree,
+            timestamp=self.timestamp,
+            filename=self.filename,
+            node_type=self.node_type,
+            content=self.content,
+            summary=self.summary,
+            owner_id=self.owner_id,
+        )
@@ -5,7 +5,7 @@ from pathlib import Path
 from typing import List, Optional
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class QuipuNode:
     commit_hash: str
     output_tree: str
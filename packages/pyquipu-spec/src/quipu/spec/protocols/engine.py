@@ -23,6 +23,10 @@ class QuipuEngine(Protocol):
     def back(self) -> Optional[str]: ...
     def forward(self) -> Optional[str]: ...
     def find_nodes(
-        self, summary_regex: Optional[str] = None, node_type: Optional[str] = None, limit: int = 10
+        self,
+        summary_regex: Optional[str] = None,
+        node_type: Optional[str] = None,
+        limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]: ...
     def close(self) -> None: ...
@@ -9,8 +9,10 @@ from typing import Any, Dict, List, Optional, Set, Tuple
 from typer.testing import CliRunner
 
 from quipu.cli.main import app
+from quipu.engine.diff_service import TreeDiff
 from quipu.engine.state_machine import Engine
 from quipu.spec.constants import EMPTY_TREE_HASH
+from quipu.spec.models.compact_graph import CompactGraph
 from quipu.spec.models.graph import QuipuNode
 from quipu.spec.protocols.storage import HistoryReader, HistoryWriter
 
@@ -108,6 +110,14 @@ class InMemoryDB:
         changes = self.get_diff_name_status(old_tree, new_tree)
         return "\n".join(f"{status}\t{path}" for status, path in changes)
 
+    def get_tree_diff(self, old_tree: str, new_tree: str) -> TreeDiff:
+        return TreeDiff(
+            old_tree=old_tree,
+            new_tree=new_tree,
+            name_status=tuple(self.get_diff_name_status(old_tree, new_tree)),
+            stat=self.get_diff_stat(old_tree, new_tree),
+        )
+
 
 class InMemoryHistoryManager(HistoryReader, HistoryWriter):
     def __init__(self, db: InMemoryDB):
@@ -155,11 +165,21 @@ class InMemoryHistoryManager(HistoryReader, HistoryWriter):
         all_nodes = sorted(self.db.nodes.values(), key=lambda n: n.timestamp, reverse=True)
         return all_nodes[offset : offset + limit]
 
+    def load_nodes_page(self, limit: int, after: Optional[str] = None, before: Optional[str] = None) -> List[QuipuNode]:
+        all_nodes = sorted(self.db.nodes.values(), key=lambda n: (n.timestamp, n.commit_hash), reverse=True)
+        hashes = [node.commit_hash for node in all_nodes]
+        if before is not None:
+            end = hashes.index(before) if before in hashes else 0
+            return all_nodes[max(0, end - limit) : end]
+        start = hashes.index(after) + 1 if after in hashes else (0 if after is None else len(hashes))
+        return all_nodes[start : start + limit]
+
     def find_nodes(
         self,
         summary_regex: Optional[str] = None,
         node_type: Optional[str] = None,
         limit: int = 10,
+        content_query: Optional[str] = None,
     ) -> List[QuipuNode]:
         candidates = list(self.db.nodes.values())
 
@@ -173,12 +193,24 @@ class InMemoryHistoryManager(HistoryReader, HistoryWriter):
         if node_type:
             candidates = [node for node in candidates if node.node_type == node_type]
 
+        if content_query:
+            terms = [term.lower() for term in content_query.split()]
+            candidates = [
+                node for node in candidates if all(term in f"{node.summary}\n{node.content}".lower() for term in terms)
+            ]
+
         candidates.sort(key=lambda n: n.timestamp, reverse=True)
         return candidates[:limit]
 
     def get_node_content(self, node: QuipuNode) -> str:
         return node.content
 
+    def load_compact_graph(self) -> CompactGraph:
+        return CompactGraph.from_nodes(self.db.nodes.values())
+
+    def get_node_contents(self, nodes: List[QuipuNode]) -> Dict[str, str]:
+        return {node.commit_hash: node.content for node in nodes}
+
     def get_ancestor_output_trees(self, start_output_tree_hash: str) -> Set[str]:
         ancestors = set()
         if start_output_tree_hash not in self.db.nodes:
@@ -218,6 +250,9 @@ class InMemoryHistoryManager(HistoryReader, HistoryWriter):
     def get_private_data(self, node_commit_hash: str) -> Optional[str]:
         return None
 
+    def get_private_data_many(self, node_commit_hashes: List[str]) -> Dict[str, str]:
+        return {}
+
     def get_node_blobs(self, commit_hash: str) -> Dict[str, bytes]:
         return {}
 
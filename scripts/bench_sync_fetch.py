@@ -0,0 +1,101 @@
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Script configuration
+ROOT_PATH = Path(__file__).parent.parent.resolve()
+for src in ("pyquipu-engine", "pyquipu-common", "pyquipu-spec"):
+    sys.path.insert(0, str(ROOT_PATH / "packages" / src / "src"))
+
+import quipu.engine.git_db as git_db_module  # noqa: E402
+from quipu.engine.git_db import GitDB  # noqa: E402
+
+
+def git(cwd: Path, *args: str, input_data: str = None) -> str:
+    result = subprocess.run(
+        ["git", "-c", "user.name=Bench", "-c", "user.email=bench@quipu.dev", *args],
+        cwd=cwd,
+        input=input_data,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def build_remote(base_dir: Path, user_ids: list[str], heads_per_user: int) -> Path:
+    """Create a bare remote holding `heads_per_user` Quipu heads for every user."""
+    remote = base_dir / "remote.git"
+    git(base_dir, "init", "--bare", "-q", str(remote))
+    empty_tree = git(remote, "mktree", input_data="")
+
+    commands = []
+    for user_id in user_ids:
+        for i in range(heads_per_user):
+            commit = git(remote, "commit-tree", empty_tree, "-m", f"{user_id} {i}")
+            commands.append(f"create refs/quipu/users/{user_id}/heads/{commit} {commit}\n")
+    git(remote, "update-ref", "--stdin", input_data="".join(commands))
+    return remote
+
+
+def fresh_clone(base_dir: Path, remote: Path, name: str) -> GitDB:
+    local = base_dir / name
+    git(base_dir, "init", "-q", str(local))
+    git(local, "remote", "add", "origin", str(remote))
+    return GitDB(local)
+
+
+def timed(label: str, func) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed:8.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-subscription `quipu sync` fetches.")
+    parser.add_argument("--users", type=int, default=30, help="Number of subscribed users on the remote.")
+    parser.add_argument("--heads", type=int, default=5, help="Quipu heads per user.")
+    parser.add_argument("--jobs", type=int, default=4, help="Concurrency of the per-user fallback pool.")
+    args = parser.parse_args()
+
+    # The bus only renders progress; keep the benchmark output to the timings.
+    git_db_module.bus = MagicMock()
+    user_ids = [f"user{i:03d}" for i in range(args.users)]
+
+    with tempfile.TemporaryDirectory(prefix="quipu_bench_") as tmp:
+        base_dir = Path(tmp)
+        print(f"Building remote with {args.users} users x {args.heads} heads...")
+        remote = build_remote(base_dir, user_ids, args.heads)
+
+        sequential_db = fresh_clone(base_dir, remote, "sequential")
+        batched_db = fresh_clone(base_dir, remote, "batched")
+        pooled_db = fresh_clone(base_dir, remote, "pooled")
+
+        print("Results:")
+        baseline = timed(
+            "sequential fetch per user", lambda: [sequential_db.fetch_quipu_refs("origin", u) for u in user_ids]
+        )
+        batched = timed("single batched fetch", lambda: batched_db.fetch_quipu_refs_many("origin", user_ids))
+        pooled = timed(
+            f"per-user pool (jobs={args.jobs})",
+            lambda: pooled_db._fetch_each("origin", sorted(user_ids), args.jobs),
+        )
+        print(f"  speedup (batched): {baseline / batched:.1f}x, speedup (pool): {baseline / pooled:.1f}x")
+
+        expected = args.users * args.heads
+        for db in (sequential_db, batched_db, pooled_db):
+            fetched = len(db.get_all_ref_heads("refs/quipu/remotes/origin/"))
+            if fetched != expected:
+                print(f"❌ {db.root.name}: expected {expected} refs, fetched {fetched}")
+                sys.exit(1)
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
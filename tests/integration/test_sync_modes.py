@@ -1,3 +1,4 @@
+import yaml
 from quipu.cli.main import app
 from quipu.common.identity import get_user_id_from_email
 from quipu.test_utils.helpers import create_node_via_cli, run_git_command
@@ -6,6 +7,15 @@ from typer.testing import CliRunner
 runner = CliRunner()
 
 
+def _disable_head_compaction(work_dir):
+    # 以下测试依赖于“父子节点各自保留一个 head”，需关闭分支末端折叠
+    config_path = work_dir / ".quipu" / "config.yml"
+    config = yaml.safe_load(config_path.read_text()) if config_path.exists() else {}
+    config.setdefault("storage", {})["compact_heads"] = False
+    config_path.parent.mkdir(exist_ok=True)
+    config_path.write_text(yaml.dump(config))
+
+
 class TestSyncModes:
     def test_push_only_mode(self, sync_test_environment):
         """User A pushes, but does not pull User B's changes."""
@@ -38,7 +48,6 @@ class TestSyncModes:
         """User B pulls User A's changes, but does not push its own."""
         remote_path, user_a_path, user_b_path = sync_test_environment
         user_a_id = get_user_id_from_email("user.a@example.com")
-        import yaml
 
         # User A creates a node and pushes
         node_a = create_node_via_cli(runner, user_a_path, "node_from_a_for_pull")
@@ -77,6 +86,7 @@ class TestSyncModes:
     def test_push_force_mode(self, sync_test_environment):
         """User A force-pushes, deleting a stale ref on the remote."""
         remote_path, user_a_path, _ = sync_test_environment
+        _disable_head_compaction(user_a_path)
 
         # User A creates two nodes and pushes
         node1 = create_node_via_cli(runner, user_a_path, "node_to_keep")
@@ -105,6 +115,7 @@ class TestSyncModes:
         """User B has a stale local ref that should be pruned after pulling."""
         remote_path, user_a_path, user_b_path = sync_test_environment
         user_b_id = get_user_id_from_email("user.b@example.com")
+        _disable_head_compaction(user_b_path)
 
         # User B creates two nodes and pushes
         node1_b = create_node_via_cli(runner, user_b_path, "b_node_to_keep")